@@ -0,0 +1,162 @@
+#!/usr/bin/env python3
+
+# Streaming anomaly detection on the power of each host, fed with the same
+# instantaneous readings as ClusterStatisticsInterface. The work and memory per
+# sample are bounded by the window length, whatever the size of the fleet:
+#   spike     the robust z-score 0.6745 * (x - median) / MAD of the reading
+#             against the last window_samples readings is beyond z_threshold
+#   flatline  the same reading flatline_samples times in a row; BMC readings
+#             jitter, so a frozen value usually means a stuck sensor
+#   dropout   dropout_samples error readings in a row
+#   stale     still errors stale_after seconds after the last reading
+# A host going into or out of an anomaly is published to the status event
+# stream, and recordings get anomaly:<host> columns with anomaly_codes.
+#
+# One session at a time feeds the detectors of a cluster, so each host gets one
+# sample per collection however many sessions watch it. Hosts nobody has fed
+# for stale_after seconds, e.g. deactivated ones, have no current anomaly.
+
+import threading
+import time
+
+import numpy
+
+from StatusEvents import get_event_stream, is_number
+
+window_samples = 60
+min_samples = 10
+z_threshold = 6.0
+# the MAD is taken as at least mad_floor watts and mad_ratio of the median, so
+# the z-score stays finite on steady hosts and small load steps are no spikes
+mad_floor = 5.0
+mad_ratio = 0.02
+flatline_samples = 30
+dropout_samples = 3
+stale_after = 120.0
+# seconds without a reading before another session takes over the feeding
+feeder_timeout = 30.0
+
+anomaly_codes = {None: 0, "spike": 1, "flatline": 2, "dropout": 3, "stale": 4}
+
+class HostAnomalyDetector(object):
+	def __init__(self, window:int=window_samples):
+		self.buf = numpy.empty(window, dtype=numpy.float64)
+		self.n = 0
+		self.last = None
+		self.last_t = None
+		self.first_t = None
+		self.fed_t = None
+		self.repeats = 0
+		self.errors = 0
+		self.median = None
+		self.mad = None
+		self.z = None
+		self.anomaly = None
+		self.since = None
+
+	def put(self, t:float, power) -> str|None:
+		if self.first_t is None:
+			self.first_t = t
+		self.fed_t = t
+		if not is_number(power):
+			self.errors += 1
+			if t - (self.last_t or self.first_t) > stale_after:
+				return self.set(t, "stale")
+			return self.set(t, "dropout" if self.errors >= dropout_samples else None)
+
+		v = float(power)
+		self.errors = 0
+		self.last_t = t
+		self.repeats = self.repeats + 1 if v == self.last else 1
+		self.last = v
+		anomaly = None
+		if self.n >= min_samples:
+			window = self.buf[:min(self.n, len(self.buf))]
+			self.median = float(numpy.median(window))
+			self.mad = float(numpy.median(numpy.abs(window - self.median)))
+			self.z = 0.6745 * (v - self.median) / max(self.mad, mad_floor, mad_ratio * abs(self.median))
+			if abs(self.z) > z_threshold:
+				anomaly = "spike"
+		if anomaly is None and self.repeats >= flatline_samples:
+			anomaly = "flatline"
+		self.buf[self.n % len(self.buf)] = v
+		self.n += 1
+		return self.set(t, anomaly)
+
+	def set(self, t:float, anomaly:str|None) -> str|None:
+		if anomaly != self.anomaly:
+			self.anomaly = anomaly
+			self.since = t if anomaly else None
+		return anomaly
+
+	def current(self, t_now:float) -> str|None:
+		if self.fed_t is None or t_now - self.fed_t > stale_after:
+			return None
+		return self.anomaly
+
+
+class ClusterAnomalyDetector(object):
+	def __init__(self, name:str):
+		self.name = name
+		self.hosts = {}
+		self.feeder = None
+		self.fed_at = None
+		self.lock = threading.Lock()
+
+	def put(self, host:str, power, feeder:str) -> str|None:
+		# readings of sessions other than the feeder are dropped; the result is the current anomaly
+		t = time.time()
+		with self.lock:
+			if feeder != self.feeder and self.fed_at is not None and t - self.fed_at < feeder_timeout:
+				d = self.hosts.get(host)
+				return d.current(t) if d else None
+			self.feeder = feeder
+			self.fed_at = t
+			if not host in self.hosts:
+				self.hosts[host] = HostAnomalyDetector()
+			d = self.hosts[host]
+			old = d.anomaly
+			anomaly = d.put(t, power)
+			if anomaly != old:
+				get_event_stream().publish(self.name, host, "anomaly", old or "normal", anomaly or "normal")
+		return anomaly
+
+	def current(self, host:str) -> str|None:
+		with self.lock:
+			d = self.hosts.get(host)
+			return d.current(time.time()) if d else None
+
+	def count(self, hosts:list) -> int:
+		t_now = time.time()
+		with self.lock:
+			return sum(1 for host in hosts if host in self.hosts and self.hosts[host].current(t_now))
+
+	def table(self, hosts:list) -> list:
+		rows = []
+		t_now = time.time()
+		with self.lock:
+			for host in hosts:
+				d = self.hosts.get(host)
+				anomaly = d.current(t_now) if d else None
+				if anomaly is None:
+					continue
+				rows.append({
+					"host": host,
+					"anomaly": anomaly,
+					"for (sec.)": round(t_now - d.since, 1),
+					"last (W)": d.last,
+					"median (W)": d.median,
+					"MAD (W)": d.mad,
+					"z": round(d.z, 1) if d.z is not None else None,
+				})
+		return rows
+
+
+cluster_detectors = {}
+cluster_detectors_lock = threading.Lock()
+
+def get_anomaly_detector(name:str) -> ClusterAnomalyDetector:
+	with cluster_detectors_lock:
+		if not name in cluster_detectors:
+			cluster_detectors[name] = ClusterAnomalyDetector(name)
+		return cluster_detectors[name]
@@ -0,0 +1,450 @@
+#!/usr/bin/env python3
+
+# asyncio IPMI client. BMCs with if_type = lan are spoken to over IPMI v1.5 LAN
+# from one UDP socket: responses are matched to requests by BMC address and
+# IPMI sequence number, so thousands of requests can be in flight from one
+# thread, each costing a future and a few bytes.
+#
+#   RMCP header      0x06, 0x00, 0xff (no ACK), 0x07 class IPMI
+#   session header   auth type, session sequence (4), session ID (4), [auth code (16)], length
+#   IPMI message     rsSA, netFn/rsLUN, checksum, rqSA, rqSeq/rqLUN, cmd, data, checksum
+#
+# A session is set up with Get Channel Authentication Capabilities, Get Session
+# Challenge, Activate Session and Set Session Privilege Level. MD5, straight
+# password and none are supported; MD2 is not (hashlib has no MD2).
+#
+# if_type = lanplus (IPMI v2.0, RMCP+) needs the RAKP handshake and AES, which
+# are not implemented here. Those BMCs, the common case, are served by
+# IPMIManager on a worker thread (asyncio.to_thread) behind the same
+# coroutines, so they cost a thread per request in flight like the pages do.
+# tests/test_async_ipmi.py runs the client against a fake BMC on loopback.
+#
+#   async with AsyncIPMI() as client:
+#       bmc = client.bmc(ip, user, passwd, "lan")
+#       status = await bmc.get_chassis_status()
+
+import asyncio
+import hashlib
+import os
+import struct
+import threading
+
+import pyipmi
+
+from BMCLiveness import get_liveness
+from IPMIManager import IPMIManager, BMCUnreachable
+from PowerBackends import get_power_backend_cache
+from SDRCache import get_sdr_cache
+
+rmcp_header = bytes([0x06, 0x00, 0xff, 0x07])
+bmc_address = 0x20
+console_address = 0x81
+default_timeout = 1.0
+default_retries = 3
+
+AUTH_NONE = 0x00
+AUTH_MD2 = 0x01
+AUTH_MD5 = 0x02
+AUTH_STRAIGHT = 0x04
+PRIV_ADMINISTRATOR = 0x04
+
+NETFN_CHASSIS = 0x00
+NETFN_SENSOR = 0x04
+NETFN_APP = 0x06
+NETFN_GROUP = 0x2c
+DCMI_GROUP = 0xdc
+
+CONTROL_POWER_DOWN = 0
+CONTROL_POWER_UP = 1
+CONTROL_POWER_CYCLE = 2
+CONTROL_HARD_RESET = 3
+CONTROL_DIAGNOSTIC_INTERRUPT = 4
+CONTROL_SOFT_SHUTDOWN = 5
+
+# ipmitool pads v1.5 packets of these lengths, some BMCs drop them otherwise
+legacy_pad_lengths = (56, 84, 112, 128, 156)
+
+class RequestTimeout(pyipmi.errors.IpmiConnectionError):
+	pass
+
+
+def checksum(data:bytes) -> int:
+	return -sum(data) & 0xff
+
+def pad16(s:str) -> bytes:
+	return s.encode()[:16].ljust(16, b"\x00")
+
+def auth_code(auth_type:int, password:bytes, session_id:int, seq:int, message:bytes) -> bytes:
+	if auth_type == AUTH_STRAIGHT:
+		return password
+	if auth_type == AUTH_MD5:
+		return hashlib.md5(password + struct.pack("<I", session_id) + message + struct.pack("<I", seq) + password).digest()
+	return b""
+
+def build_message(netfn:int, lun:int, rq_seq:int, cmd:int, data:bytes) -> bytes:
+	head = bytes([bmc_address, netfn << 2 | lun])
+	body = bytes([console_address, rq_seq << 2, cmd]) + data
+	return head + bytes([checksum(head)]) + body + bytes([checksum(body)])
+
+def build_packet(auth_type:int, seq:int, session_id:int, password:bytes, message:bytes) -> bytes:
+	header = struct.pack("<BII", auth_type, seq, session_id)
+	if auth_type != AUTH_NONE:
+		header += auth_code(auth_type, password, session_id, seq, message)
+	packet = rmcp_header + header + bytes([len(message)]) + message
+	if len(packet) in legacy_pad_lengths:
+		packet += b"\x00"
+	return packet
+
+def parse_packet(data:bytes) -> dict|None:
+	# the response message: rqSA, netFn/rqLUN, checksum, rsSA, rqSeq/rsLUN, cmd, completion code, data, checksum
+	if len(data) < 4 + 10 or data[:4] != rmcp_header:
+		return None
+	auth_type, seq, session_id = struct.unpack_from("<BII", data, 4)
+	offset = 13 + (16 if auth_type != AUTH_NONE else 0)
+	if len(data) <= offset:
+		return None
+	length = data[offset]
+	message = data[offset + 1:offset + 1 + length]
+	if len(message) < 8 or checksum(message[:2]) != message[2] or checksum(message[3:-1]) != message[-1]:
+		return None
+	return {"session_id": session_id, "netfn": message[1] >> 2, "rq_seq": message[4] >> 2,
+		"cmd": message[5], "cc": message[6], "data": message[7:-1]}
+
+
+class ChassisStatus(object):
+	# the fields of pyipmi's ChassisStatus that the pages use
+	def __init__(self, data:bytes):
+		self.power_on = bool(data[0] & 0x01)
+		self.overload = bool(data[0] & 0x02)
+		self.interlock = bool(data[0] & 0x04)
+		self.fault = bool(data[0] & 0x08)
+		self.control_fault = bool(data[0] & 0x10)
+		self.restore_policy = (data[0] >> 5) & 0x03
+		self.last_event = data[1] if len(data) > 1 else None
+		self.misc_state = data[2] if len(data) > 2 else None
+
+
+class PowerReading(object):
+	# DCMI Get Power Reading, with the field names of pyipmi's response
+	def __init__(self, data:bytes):
+		(group, self.current_power, self.minimum_power, self.maximum_power, self.average_power,
+			self.timestamp, self.period, self.reading_state) = struct.unpack_from("<BHHHHIIB", data)
+
+
+class LanProtocol(asyncio.DatagramProtocol):
+	def __init__(self, client):
+		self.client = client
+
+	def datagram_received(self, data, addr):
+		self.client.received(data, addr)
+
+	def error_received(self, exc):
+		# ICMP port unreachable and the like; the request runs into its timeout
+		pass
+
+
+class AsyncIPMI(object):
+	def __init__(self, timeout:float=default_timeout, retries:int=default_retries, port:int=623):
+		self.timeout = timeout
+		self.retries = retries
+		self.port = port
+		self.transport = None
+		self.pending = {}
+		self.bmcs = {}
+
+	async def open(self):
+		loop = asyncio.get_running_loop()
+		self.transport, _ = await loop.create_datagram_endpoint(lambda: LanProtocol(self), local_addr=("0.0.0.0", 0))
+		return self
+
+	async def close(self):
+		await asyncio.gather(*(b.close() for b in self.bmcs.values()), return_exceptions=True)
+		self.bmcs = {}
+		if self.transport:
+			self.transport.close()
+			self.transport = None
+
+	async def __aenter__(self):
+		return await self.open()
+
+	async def __aexit__(self, *exc):
+		await self.close()
+
+	def bmc(self, ip:str, user:str, passwd:str, iftype:str="lan"):
+		if not ip in self.bmcs:
+			if iftype == "lan":
+				self.bmcs[ip] = LanBMC(self, ip, user, passwd)
+			else:
+				self.bmcs[ip] = ThreadedBMC(ip, user, passwd, iftype)
+		return self.bmcs[ip]
+
+	def received(self, data:bytes, addr):
+		rsp = parse_packet(data)
+		if rsp is None:
+			return
+		fut, request = self.pending.get((addr[0], rsp["rq_seq"]), (None, None))
+		if fut is None or fut.done() or request != (rsp["netfn"] - 1, rsp["cmd"]):
+			return
+		fut.set_result(rsp)
+
+	async def request(self, bmc, netfn:int, cmd:int, data:bytes=b"", lun:int=0, timeout:float|None=None, retries:int|None=None) -> bytes:
+		timeout = self.timeout if timeout is None else timeout
+		retries = self.retries if retries is None else retries
+		for i in range(64):
+			key = (bmc.ip, bmc.next_rq_seq())
+			if not key in self.pending:
+				break
+		else:
+			raise pyipmi.errors.IpmiConnectionError(f"64 requests to {bmc.ip} in flight")
+		rq_seq = key[1]
+		fut = asyncio.get_running_loop().create_future()
+		self.pending[key] = (fut, (netfn, cmd))
+		message = build_message(netfn, lun, rq_seq, cmd, data)
+		try:
+			for attempt in range(retries + 1):
+				# a retransmit is a new packet for the session, with the next session sequence number
+				self.transport.sendto(bmc.packet(message), (bmc.ip, self.port))
+				try:
+					rsp = await asyncio.wait_for(asyncio.shield(fut), timeout)
+					break
+				except asyncio.TimeoutError:
+					continue
+			else:
+				raise RequestTimeout(f"{bmc.ip} did not answer netfn 0x{netfn:02x} cmd 0x{cmd:02x}")
+		finally:
+			del self.pending[key]
+		if rsp["cc"] != 0:
+			raise pyipmi.errors.CompletionCodeError(rsp["cc"])
+		return bytes(rsp["data"])
+
+
+class LanBMC(object):
+	def __init__(self, client:AsyncIPMI, ip:str, user:str, passwd:str):
+		self.client = client
+		self.ip = ip
+		self.user = user
+		self.passwd = passwd
+		self.password = pad16(passwd)
+		self.auth_type = AUTH_NONE
+		self.session_id = 0
+		self.seq = 0
+		self.rq_seq = 0
+		self.active = False
+		self.lock = None
+
+	def next_rq_seq(self) -> int:
+		self.rq_seq = (self.rq_seq + 1) & 0x3f
+		return self.rq_seq
+
+	def packet(self, message:bytes) -> bytes:
+		seq = self.seq
+		if self.seq:
+			self.seq = (self.seq + 1) & 0xffffffff or 1
+		return build_packet(self.auth_type, seq, self.session_id, self.password, message)
+
+	async def connect(self):
+		if self.active:
+			return
+		if self.lock is None:
+			self.lock = asyncio.Lock()
+		async with self.lock:
+			if self.active:
+				return
+			if not await asyncio.to_thread(get_liveness().allow, self.ip):
+				raise BMCUnreachable(f"{self.ip} does not answer the RMCP presence ping")
+			try:
+				await self.establish()
+			except pyipmi.errors.IpmiConnectionError:
+				get_liveness().record_failure(self.ip)
+				raise
+			except pyipmi.errors.CompletionCodeError:
+				# rejected, but the BMC answered
+				get_liveness().record_success(self.ip)
+				raise
+			get_liveness().record_success(self.ip)
+
+	async def establish(self):
+		self.auth_type, self.session_id, self.seq = AUTH_NONE, 0, 0
+		rsp = await self.client.request(self, NETFN_APP, 0x38, bytes([0x0e, PRIV_ADMINISTRATOR]))
+		supported = rsp[1]
+		if supported & (1 << AUTH_MD5):
+			auth_type = AUTH_MD5
+		elif supported & (1 << AUTH_STRAIGHT):
+			auth_type = AUTH_STRAIGHT
+		elif supported & 0x01:
+			auth_type = AUTH_NONE
+		else:
+			raise pyipmi.errors.IpmiConnectionError(f"{self.ip} supports no authentication type of this client")
+
+		rsp = await self.client.request(self, NETFN_APP, 0x39, bytes([auth_type]) + pad16(self.user))
+		temporary_id = struct.unpack_from("<I", rsp)[0]
+		challenge = rsp[4:20]
+
+		# Activate Session is the first message with authentication, sequence number 0
+		self.auth_type, self.session_id = auth_type, temporary_id
+		outbound = struct.unpack("<I", os.urandom(4))[0] or 1
+		rsp = await self.client.request(self, NETFN_APP, 0x3a,
+			bytes([auth_type, PRIV_ADMINISTRATOR]) + challenge + struct.pack("<I", outbound))
+		self.auth_type = rsp[0] & 0x0f
+		self.session_id, self.seq = struct.unpack_from("<II", rsp, 1)
+		self.seq = self.seq or 1
+		await self.client.request(self, NETFN_APP, 0x3b, bytes([PRIV_ADMINISTRATOR]))
+		self.active = True
+
+	async def close(self):
+		if not self.active:
+			return
+		self.active = False
+		try:
+			await self.client.request(self, NETFN_APP, 0x3c, struct.pack("<I", self.session_id), retries=1)
+		except (pyipmi.errors.IpmiConnectionError, pyipmi.errors.CompletionCodeError):
+			pass
+
+	async def request(self, netfn:int, cmd:int, data:bytes=b"", lun:int=0) -> bytes:
+		await self.connect()
+		try:
+			return await self.client.request(self, netfn, cmd, data, lun)
+		except RequestTimeout:
+			# the BMC may have closed an idle session; the next call sets up a new one
+			self.active = False
+			get_liveness().record_failure(self.ip)
+			raise
+
+	async def get_chassis_status(self) -> ChassisStatus:
+		return ChassisStatus(await self.request(NETFN_CHASSIS, 0x01))
+
+	async def is_power_on(self) -> bool:
+		return (await self.get_chassis_status()).power_on
+
+	async def chassis_control(self, control:int):
+		await self.request(NETFN_CHASSIS, 0x02, bytes([control]))
+
+	async def get_power_reading(self, mode:int=1, attributes:int=0) -> PowerReading:
+		return PowerReading(await self.request(NETFN_GROUP, 0x02, bytes([DCMI_GROUP, mode, attributes, 0x00])))
+
+	async def get_sensor_reading(self, number:int, lun:int=0) -> tuple:
+		# (raw reading, states) like pyipmi: raw is None during the initial update
+		rsp = await self.request(NETFN_SENSOR, 0x2d, bytes([number]), lun)
+		raw = None if rsp[1] & 0x20 else rsp[0]
+		states = None
+		if len(rsp) > 2:
+			states = rsp[2] | (rsp[3] << 8 if len(rsp) > 3 else 0)
+		return raw, states
+
+	async def get_sensor_value(self, name:str) -> float|None:
+		record = get_sdr_cache(self.ip).find(name)
+		if record is None:
+			# the SDR is read once over the synchronous path and cached on disk
+			cache = await asyncio.to_thread(IPMIManager(self.ip, self.user, self.passwd, "lan").getSdrCache)
+			record = cache.find(name)
+		if record is None:
+			return None
+		raw, states = await self.get_sensor_reading(record.number, record.owner_lun)
+		if raw is None:
+			return None
+		try:
+			return record.convert_sensor_raw_to_value(raw)
+		except (AttributeError, TypeError, ValueError):
+			return None
+
+	async def power_down(self):
+		await self.chassis_control(CONTROL_POWER_DOWN)
+
+	async def power_up(self):
+		await self.chassis_control(CONTROL_POWER_UP)
+
+	async def hard_reset(self):
+		await self.chassis_control(CONTROL_HARD_RESET)
+
+	async def soft_shutdown(self):
+		await self.chassis_control(CONTROL_SOFT_SHUTDOWN)
+
+
+class ThreadedBMC(object):
+	# the same coroutines over IPMIManager for if_types this client does not speak
+	def __init__(self, ip:str, user:str, passwd:str, iftype:str):
+		self.ip = ip
+		self.ipmiman = IPMIManager(ip, user, passwd, iftype)
+		self.lock = threading.Lock()
+
+	def call(self, func, *args):
+		# one pyipmi connection is not safe for concurrent use
+		with self.lock:
+			try:
+				self.ipmiman.connect()
+				result = func(self.ipmiman.connection, *args)
+				get_liveness().record_success(self.ip)
+				return result
+			except BMCUnreachable:
+				raise
+			except pyipmi.errors.IpmiConnectionError:
+				self.ipmiman.connection = None
+				get_liveness().record_failure(self.ip)
+				raise
+			except pyipmi.errors.CompletionCodeError:
+				get_liveness().record_success(self.ip)
+				raise
+
+	async def run(self, func, *args):
+		return await asyncio.to_thread(self.call, func, *args)
+
+	async def close(self):
+		pass
+
+	async def get_chassis_status(self):
+		return await self.run(lambda c: c.get_chassis_status())
+
+	async def is_power_on(self) -> bool:
+		return (await self.get_chassis_status()).power_on
+
+	async def chassis_control(self, control:int):
+		await self.run(lambda c: c.chassis_control(control))
+
+	async def get_power_reading(self, mode:int=1, attributes:int=0):
+		return await self.run(lambda c: c.get_power_reading(mode=mode, attributes=attributes))
+
+	async def get_sensor_reading(self, number:int, lun:int=0) -> tuple:
+		return await self.run(lambda c: c.get_sensor_reading(number, lun))
+
+	async def get_sensor_value(self, name:str) -> float|None:
+		def read(c):
+			record = self.ipmiman.getSdrCache().find(name)
+			return None if record is None else self.ipmiman.readSensor(record)
+		return await self.run(read)
+
+	async def power_down(self):
+		await self.chassis_control(CONTROL_POWER_DOWN)
+
+	async def power_up(self):
+		await self.chassis_control(CONTROL_POWER_UP)
+
+	async def hard_reset(self):
+		await self.chassis_control(CONTROL_HARD_RESET)
+
+	async def soft_shutdown(self):
+		await self.chassis_control(CONTROL_SOFT_SHUTDOWN)
+
+
+async def get_current_power(bmc, power_method:str="dcmi", power_sensor:str="Total_Power") -> int|None:
+	if power_method == "auto":
+		# probing is left to IPMIManager; until then DCMI
+		power_method = get_power_backend_cache().cached(bmc.ip) or "dcmi"
+	if power_method == "dcmi":
+		return (await bmc.get_power_reading()).current_power
+	value = await bmc.get_sensor_value(power_sensor if power_method == "sdr" else "Total_Power")
+	return None if value is None else round(value)
+
+async def gather_power(client:AsyncIPMI, hostdics:list) -> dict:
+	# {hostname: watts or the exception}, all BMCs at once
+	async def read(d):
+		bmc = client.bmc(d["ipmi_ip"], d["ipmi_user"], d["ipmi_pass"], d["if_type"])
+		return await get_current_power(bmc, d.get("power_method", "dcmi"), d.get("power_sensor", "Total_Power"))
+	results = await asyncio.gather(*(read(d) for d in hostdics), return_exceptions=True)
+	return {d["hostname"]: r for d, r in zip(hostdics, results)}
+
+def read_power(hostdics:list, timeout:float=default_timeout, retries:int=default_retries) -> dict:
+	# for callers without an event loop, e.g. a page
+	async def main():
+		async with AsyncIPMI(timeout, retries) as client:
+			return await gather_power(client, hostdics)
+	return asyncio.run(main())
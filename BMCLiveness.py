@@ -0,0 +1,155 @@
+#!/usr/bin/env python3
+
+# Liveness of each BMC, checked with an RMCP presence ping before IPMIManager
+# opens a session, and a circuit breaker per BMC:
+#
+#   closed     calls go through; a pong or a missing pong is trusted for pong_ttl seconds
+#   open       after failure_threshold IPMI failures in a row, calls fail at once
+#   half-open  after open_seconds one call may try again, the others still fail
+#
+# A missing pong only stops calls to a BMC that has answered a ping before: some
+# BMCs answer IPMI but not ASF pings, and those are no longer pinged once a call
+# succeeds. Hosts with ping = off in their ini file are never pinged.
+
+import threading
+import time
+
+from RMCPPing import presence_ping
+
+pong_ttl = 10.0
+failure_threshold = 3
+open_seconds = 30.0
+ping_timeout = 0.5
+ping_retries = 1
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half-open"
+
+class BMCState(object):
+	def __init__(self):
+		self.state = CLOSED
+		self.failures = 0
+		self.opened_at = 0.0
+		self.probe_at = 0.0
+		self.pong_at = None
+		self.silent_at = None
+		# None until known, False for BMCs that answer IPMI but not pings
+		self.answers_ping = None
+
+
+class BMCLiveness(object):
+	def __init__(self):
+		self.bmcs = {}
+		self.no_ping = set()
+		self.lock = threading.Lock()
+
+	def get(self, ip:str) -> BMCState:
+		if not ip in self.bmcs:
+			self.bmcs[ip] = BMCState()
+		return self.bmcs[ip]
+
+	def set_ping(self, ip:str, enabled:bool):
+		with self.lock:
+			if enabled:
+				self.no_ping.discard(ip)
+			else:
+				self.no_ping.add(ip)
+
+	def pinged_locked(self, ip:str) -> bool:
+		return not ip in self.no_ping and self.get(ip).answers_ping is not False
+
+	def ping(self, ips:list) -> set:
+		pongs = presence_ping(ips, ping_timeout, ping_retries)
+		now = time.monotonic()
+		with self.lock:
+			for ip in ips:
+				if ip in pongs:
+					self.get(ip).pong_at = now
+					self.get(ip).silent_at = None
+					self.get(ip).answers_ping = True
+				else:
+					self.get(ip).silent_at = now
+		return set(pongs)
+
+	def ping_stale(self, ips:list):
+		# one select loop for a whole cluster instead of one ping per thread
+		now = time.monotonic()
+		with self.lock:
+			stale = [ip for ip in ips if self.pinged_locked(ip) and not self.is_known_locked(self.get(ip), now)]
+		if stale:
+			self.ping(stale)
+
+	def allow(self, ip:str) -> bool:
+		now = time.monotonic()
+		with self.lock:
+			b = self.get(ip)
+			if b.state == OPEN:
+				if now - b.opened_at < open_seconds:
+					return False
+				b.state = HALF_OPEN
+				b.probe_at = now
+			elif b.state == HALF_OPEN:
+				# a probe that never reported back does not hold the BMC forever
+				if now - b.probe_at < open_seconds:
+					return False
+				b.probe_at = now
+			if not self.pinged_locked(ip):
+				return True
+			if b.pong_at is not None and now - b.pong_at <= pong_ttl:
+				return True
+			if b.silent_at is not None and now - b.silent_at <= pong_ttl:
+				return self.silent_locked(b, now)
+		alive = ip in self.ping([ip])
+		with self.lock:
+			b = self.get(ip)
+			return alive or self.silent_locked(b, now)
+
+	def silent_locked(self, b:BMCState, now:float) -> bool:
+		# a BMC not known to answer pings gets the call, its result decides
+		if not b.answers_ping:
+			return True
+		if b.state == HALF_OPEN:
+			b.state = OPEN
+			b.opened_at = now
+		return False
+
+	def is_known_locked(self, b:BMCState, now:float) -> bool:
+		if b.state == OPEN:
+			return now - b.opened_at < open_seconds
+		seen = max(x for x in (b.pong_at, b.silent_at, -pong_ttl) if x is not None)
+		return now - seen <= pong_ttl
+
+	def fail_locked(self, b:BMCState, now:float):
+		b.failures += 1
+		b.pong_at = None
+		if b.state == HALF_OPEN or b.failures >= failure_threshold:
+			b.state = OPEN
+			b.opened_at = now
+
+	def record_failure(self, ip:str):
+		with self.lock:
+			self.fail_locked(self.get(ip), time.monotonic())
+
+	def record_success(self, ip:str):
+		with self.lock:
+			b = self.get(ip)
+			b.state = CLOSED
+			b.failures = 0
+			if not b.answers_ping and b.silent_at is not None:
+				b.answers_ping = False
+
+	def state(self, ip:str) -> str:
+		with self.lock:
+			return self.get(ip).state
+
+
+liveness = None
+liveness_lock = threading.Lock()
+
+def get_liveness() -> BMCLiveness:
+	global liveness
+	with liveness_lock:
+		if liveness is None:
+			liveness = BMCLiveness()
+		return liveness
@@ -3,6 +3,9 @@
 import configparser
 from pathlib import Path
 
+from BMCLiveness import get_liveness
+from StatusEvents import default_power_delta
+
 
 class StreamlitBasePage(object):
 	def __init__(self):
@@ -42,10 +45,29 @@ class ClusterBasePage(StreamlitBasePage):
 	def get_urlpath(self):
 		return self.urlpath_prefix + Path(self.inifile).stem + self.urlpath_suffix
 
+	def parse_value(self, parser, section:str, option:str, fallback, kind:str):
+		# a malformed value is reported on the page and replaced by the fallback
+		try:
+			if kind == "boolean":
+				return parser.getboolean(section, option, fallback=fallback)
+			return parser.getfloat(section, option, fallback=fallback)
+		except ValueError:
+			self.errors.append(f"{option} = {parser.get(section, option)} in [{section}] is not a {kind}; using {fallback}.")
+			return fallback
+
+	def render_errors(self):
+		import streamlit as st
+		for e in self.errors:
+			st.error(f"{self.inifile}: {e}")
+
 	def parse_data(self):
+		self.errors = []
 		if not Path(self.inifile).exists():
 			self.title_str = "Error"
 			self.note_str = f"There is no file {self.inifile}"
+			self.source = "ipmi"
+			self.power_delta = default_power_delta
+			self.power_budget = None
 			self.hosts_dic = []
 			return
 
@@ -64,8 +86,12 @@ class ClusterBasePage(StreamlitBasePage):
 			h["ipmi_pass"] = parser[x]["ipmi_pass"]
 			h["if_type"] = parser[x]["if_type"]
 			h["note"] = parser[x].get("note", None)
-			h["disabled"] = parser[x].getboolean("disabled", False)
+			h["disabled"] = self.parse_value(parser, x, "disabled", False, "boolean")
 			h["power_method"] = parser[x].get("power_method", "dcmi")
+			h["power_sensor"] = parser[x].get("power_sensor", "Total_Power")
+			h["power_floor"] = self.parse_value(parser, x, "power_floor", None, "number")
+			h["ping"] = self.parse_value(parser, x, "ping", True, "boolean")
+			get_liveness().set_ping(h["ipmi_ip"], h["ping"])
 			self.hosts_dic.append(h)
 
 		try:
@@ -76,6 +102,12 @@ class ClusterBasePage(StreamlitBasePage):
 			self.note_str = parser['Page']['note']
 		except KeyError:
 			self.note_str = None
+		try:
+			self.source = parser['Page']['source']
+		except KeyError:
+			self.source = "ipmi"
+		self.power_delta = self.parse_value(parser, "Page", "power_delta", default_power_delta, "number")
+		self.power_budget = self.parse_value(parser, "Page", "power_budget", None, "number")
 
 	def get_hosts_dic(self):
 		return self.hosts_dic
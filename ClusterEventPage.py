@@ -0,0 +1,75 @@
+#!/usr/bin/env python3
+
+import time
+from pathlib import Path
+
+import pandas as pd
+import streamlit as st
+
+from ClusterBasePage import ClusterBasePage
+from SDRCache import get_sdr_cache
+from SELReader import get_sel_store, poll_cluster, timestamp_str, event_str
+
+since_choices = {"1 hour": 3600, "1 day": 86400, "7 days": 7 * 86400, "30 days": 30 * 86400, "All": None}
+
+class ClusterEventPage(ClusterBasePage):
+
+	def get_title(self):
+		return self.title_str
+
+	def sensor_names(self, bmc:str) -> dict:
+		# names come from an SDR cache already on disk; the SDR is not read for this page
+		records = get_sdr_cache(bmc).records
+		return {r.number: r.device_id_string.strip() for r in records if hasattr(r, "number") and getattr(r, "device_id_string", None)}
+
+	def render(self):
+		st.header(self.get_title())
+		self.render_errors()
+		if self.note_str:
+			st.markdown(f"Note: {self.note_str}")
+
+		cluster = Path(self.inifile).stem
+		store = get_sel_store()
+		polled_tag = self.get_urlpath() + "_sel_polled"
+		hosts = [d["hostname"] for d in self.get_hosts_dic()]
+
+		with st.container(horizontal=True, vertical_alignment="bottom", horizontal_alignment="left"):
+			read = st.button("Read new entries", icon=":material/refresh:")
+			selected = st.multiselect("Hosts", hosts, key=f"{self.get_urlpath()}-hosts", placeholder="All hosts")
+			since = st.selectbox("Since", list(since_choices), index=1, key=f"{self.get_urlpath()}-since")
+			limit = st.selectbox("Rows", [100, 500, 2000], key=f"{self.get_urlpath()}-limit")
+
+		if read or not polled_tag in st.session_state:
+			# disabled only turns off power actions; the SEL of those hosts is still read
+			hostdics = self.get_hosts_dic()
+			with st.spinner(f"Reading the SEL of {len(hostdics)} hosts..."):
+				t0 = time.monotonic()
+				st.session_state[polled_tag] = (poll_cluster(store, cluster, hostdics), time.monotonic() - t0)
+		results, seconds = st.session_state[polled_tag]
+
+		errors = [r for r in results if r["error"]]
+		st.caption(
+			f"{sum(r['new'] or 0 for r in results)} new entries from {len(results)} hosts in {seconds:.1f} sec."
+			+ (f" / {len(errors)} hosts failed" if errors else ""))
+		with st.expander("Hosts"):
+			st.dataframe(pd.DataFrame(results), hide_index=True)
+
+		t = since_choices[since]
+		rows = store.recent(cluster, selected, time.time() - t if t else 0.0, limit)
+		names = {}
+		events = []
+		for host, record_id, timestamp, record_type, sensor_type, sensor_number, event_type, deasserted, event_data, bmc in rows:
+			if not bmc in names:
+				names[bmc] = self.sensor_names(bmc)
+			events.append({
+				"Time": timestamp_str(timestamp),
+				"Host": host,
+				"Sensor": names[bmc].get(sensor_number, f"#{sensor_number}"),
+				"Event": event_str(record_type, sensor_type, event_type, deasserted),
+				"Data": event_data,
+				"Record ID": record_id,
+			})
+		if not events:
+			st.text("No events in this range.")
+			return
+		st.dataframe(pd.DataFrame(events), hide_index=True, width="stretch")
@@ -34,6 +34,7 @@ def readme1st():
 
 	st.markdown(note_markdown)
 
+import pyipmi
 from IPMIManager import IPMIManager
 from PingManager import PingManager
 
@@ -43,6 +44,7 @@ class MachineStatus(object):
 		self.os = False
 		self.at = None
 		self.error = False
+		self.unreachable = False
 		self.cause = None
 		self.ipmiman = ipmiman
 		self.pingman = pingman
@@ -50,6 +52,8 @@ class MachineStatus(object):
 	def __str__(self):
 		if self.at is None:
 			return ""
+		elif self.unreachable:
+			return ":orange[BMC Unreachable]"
 		elif self.error:
 			return f'{self.cause}'
 		if not self.chasis:
@@ -58,6 +62,19 @@ class MachineStatus(object):
 			return ":red[Machine Up] / :blue[OS Down]"
 		return f':red[Machine Up] / :red[OS Up]'
 
+	def get_state_str(self):
+		if self.at is None:
+			return ""
+		elif self.unreachable:
+			return "BMC Unreachable"
+		elif self.error:
+			return f'{self.cause}'
+		if not self.chasis:
+			return "Machine Down"
+		if not self.os:
+			return "Machine Up / OS Down"
+		return "Machine Up / OS Up"
+
 	def set_machine_down(self):
 		self.chasis = False
 		self.os = False
@@ -81,6 +98,13 @@ class MachineStatus(object):
 		self.cause = cause
 		self.at = datetime.now()
 
+	def set_bmc_unreachable(self):
+		self.set_error("BMC Unreachable")
+		self.unreachable = True
+
+	def is_bmc_unreachable(self):
+		return self.unreachable
+
 	def is_machine_up(self):
 		return self.chasis
 
@@ -96,6 +120,9 @@ class MachineStatus(object):
 		return None
 
 	def get(self):
+		self.error = False
+		self.cause = None
+		self.unreachable = False
 		if self.ipmiman.isPowerOn():
 			self.set_machine_up()
 			if self.pingman.is_reached():
@@ -103,12 +130,38 @@ class MachineStatus(object):
 			else:
 				self.set_os_down()
 		else:
-			if self.ipmiman.isError():
+			if self.ipmiman.getCause() == "BMC Unreachable":
+				self.set_bmc_unreachable()
+			elif self.ipmiman.isError():
 				self.set_error(self.ipmiman.getCause())
 			else:
 				self.set_machine_down()
 
 from ClusterBasePage import ClusterBasePage
+from HostGrid import HostGrid
+from BMCLiveness import get_liveness
+from StatusEvents import get_event_stream
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+import pandas as pd
+
+event_log_interval = 2.0
+
+def render_event_log(cluster, key):
+	follow = st.toggle("Follow", key=f"{key}-follow-events",
+		help=f"Refresh the event log every {event_log_interval:.0f} sec. without rerunning the page.")
+
+	@st.fragment(run_every=event_log_interval if follow else None)
+	def event_log():
+		events = get_event_stream().latest(cluster)
+		st.dataframe(pd.DataFrame({
+			"Time": [datetime.fromtimestamp(e["t"]).strftime('%Y/%m/%d %H:%M:%S') for e in events],
+			"Host": [e["host"] for e in events],
+			"Event": [e["kind"] for e in events],
+			"From": [str(e["old"]) for e in events],
+			"To": [str(e["new"]) for e in events],
+		}), hide_index=True, width="stretch")
+	event_log()
 
 class ClusterPowerPage(ClusterBasePage):
 	def get_title(self):
@@ -116,12 +169,113 @@ class ClusterPowerPage(ClusterBasePage):
 
 	def render(self):
 		st.header(self.get_title())
+		self.render_errors()
 		if self.note_str:
 			st.markdown(f"Note: {self.note_str}")
+		with st.expander(label="Events"):
+			render_event_log(Path(self.inifile).stem, self.get_urlpath())
+		if st.toggle("Compact grid", key=f"{self.get_urlpath()}-grid",
+				help="Show all hosts as one table with paging, sorting and filtering. Suitable for hundreds of hosts."):
+			self.render_grid()
+			return
 		for d in self.get_hosts_dic():
-			single_host_container(d)
+			single_host_container(d, Path(self.inifile).stem)
+
+	def grid_status(self):
+		tag = self.get_urlpath() + "_grid_status"
+		if not tag in st.session_state:
+			st.session_state[tag] = {}
+		return st.session_state[tag]
 
-def single_host_container(hostdic):
+	def get_grid_status(self, hostdics):
+		def get(d):
+			ipmiman = IPMIManager(d["ipmi_ip"], d["ipmi_user"], d["ipmi_pass"], d["if_type"])
+			machine_status = MachineStatus(ipmiman, PingManager(d["ip"]))
+			machine_status.get()
+			return d["hostname"], machine_status
+		get_liveness().ping_stale([d["ipmi_ip"] for d in hostdics])
+		events = get_event_stream()
+		with ThreadPoolExecutor(max_workers=16) as executor:
+			for host, machine_status in executor.map(get, hostdics):
+				events.update_status(Path(self.inifile).stem, host, machine_status.get_state_str())
+				self.grid_status()[host] = (machine_status.get_state_str(), machine_status.get_timestamp_str())
+
+	def grid_action(self, hostdics, label, func_name):
+		hostdics = [d for d in hostdics if not d["disabled"]]
+		def act(d):
+			ipmiman = IPMIManager(d["ipmi_ip"], d["ipmi_user"], d["ipmi_pass"], d["if_type"])
+			try:
+				getattr(ipmiman, func_name)()
+				ipmiman.setSucceeded()
+			except pyipmi.errors.IpmiConnectionError as e:
+				ipmiman.setConnectionError(e)
+				return d["hostname"], ipmiman.getCause()
+			except pyipmi.errors.CompletionCodeError as e:
+				ipmiman.setCompletionCodeError(e)
+				return d["hostname"], ipmiman.getCause()
+			except Exception as e:
+				return d["hostname"], ipmiman.getCause() or type(e).__name__
+			return d["hostname"], None
+		with st.spinner(f"{label} {len(hostdics)} hosts..."):
+			with ThreadPoolExecutor(max_workers=16) as executor:
+				failed = [(host, cause) for host, cause in executor.map(act, hostdics) if cause]
+		st.toast(f"{label} requested for {len(hostdics) - len(failed)} hosts. Each action may take a few minutes.")
+		if failed:
+			st.error(f"{label} failed on {len(failed)} hosts: " + ", ".join(f"{host} ({cause})" for host, cause in failed))
+
+	def render_grid(self):
+		status = self.grid_status()
+		grid = HostGrid(self, {
+			"Host": lambda d: d["hostname"],
+			"Status": lambda d: status.get(d["hostname"], ("", None))[0],
+		})
+		visible = grid.render_controls()
+
+		try:
+			auto_status = st.session_state["auto_status"]
+		except KeyError:
+			auto_status = False
+		if auto_status:
+			self.get_grid_status(visible)
+
+		col1, col2 = st.columns([2, 2])
+		with col1:
+			checked = grid.render_editor(visible, "Select", lambda host: False)
+		with col2:
+			status_field = st.empty()
+		selected = [d for d in visible if checked.get(d["hostname"])]
+
+		with st.container(horizontal=True, vertical_alignment="center", horizontal_alignment="left"):
+			st.text(f"{len(selected)} selected")
+			get_status = st.button("Get Status", disabled=auto_status or not selected)
+			confirm = st.checkbox("Confirm", disabled=not selected,
+				help="Start, shutdown and reset act on every selected host that is not disabled.")
+			start = st.button("Start", disabled=not (selected and confirm))
+			shutdown = st.button("Shutdown", disabled=not (selected and confirm))
+			reset = st.button("Reset", disabled=not (selected and confirm))
+
+		if get_status:
+			self.get_grid_status(selected)
+		if start:
+			self.grid_action(selected, "Starting", "powerUp")
+		if shutdown:
+			self.grid_action(selected, "Shutting down", "softShutdown")
+		if reset:
+			self.grid_action(selected, "Resetting", "hardReset")
+
+		rows = [status.get(d["hostname"], ("", None)) for d in visible]
+		status_field.dataframe(
+			pd.DataFrame({"Status": [r[0] for r in rows], "Checked at": [r[1] or "" for r in rows]}),
+			hide_index=True, width="stretch")
+
+def status_badge(machine_status, since):
+	if not machine_status.get_timestamp_str():
+		return None
+	if since:
+		return f"Since {datetime.fromtimestamp(since).strftime('%Y/%m/%d %H:%M:%S')}"
+	return f"Get status at {machine_status.get_timestamp_str()}"
+
+def single_host_container(hostdic, cluster):
 	name = hostdic["hostname"]
 	host_ip = hostdic["ip"]
 	ipmi_ip = hostdic["ipmi_ip"]
@@ -135,17 +289,39 @@ def single_host_container(hostdic):
 	pingman = PingManager(host_ip)
 	machine_status = MachineStatus(ipmiman, pingman)
 
+	def act(func, label):
+		try:
+			func()
+			ipmiman.setSucceeded()
+		except pyipmi.errors.IpmiConnectionError as e:
+			ipmiman.setConnectionError(e)
+			st.error(f"{label} {name} failed: {ipmiman.getCause()}")
+			return False
+		except pyipmi.errors.CompletionCodeError as e:
+			ipmiman.setCompletionCodeError(e)
+			st.error(f"{label} {name} failed: {ipmiman.getCause()}")
+			return False
+		return True
+
 	try:
 		auto_status = st.session_state["auto_status"]
 	except KeyError:
 		auto_status = False
+	events = get_event_stream()
 	if auto_status:
 		machine_status.get()
+		events.update_status(cluster, name, machine_status.get_state_str())
+
+	# with auto status, the status is drawn once and rewritten only when an action changes it;
+	# the badge tells since when the host is in that status rather than when it was checked
+	since = lambda: events.status_since(cluster, name) if auto_status else None
+	shown_status = str(machine_status)
+	shown_badge = status_badge(machine_status, since())
 
 	with st.container(horizontal=False, vertical_alignment="center", border=True):
 		with st.container(horizontal=True, horizontal_alignment="left", vertical_alignment="center", border=False):
 			st.html(f'<b>{name}</b> (<a target="_blank" rel="noopener noreferrer" href="https://{ipmi_ip}">IPMI</a>)')
-			lastupdate = st.caption("")
+			lastupdate = st.badge(shown_badge, icon=":material/check:", color="grey") if shown_badge else st.caption("")
 		if note:
 			with st.container(horizontal=True, vertical_alignment="center", border=False):
 				st.markdown(f"Note: {hostdic['note']}")
@@ -155,7 +331,7 @@ def single_host_container(hostdic):
 				with st.container(horizontal=True, horizontal_alignment="left", vertical_alignment="center", border=False):
 					if st.button("Get Status", key=f"{name}-getter", disabled=auto_status):
 						machine_status.get()
-					status = st.text("")
+					status = st.markdown(shown_status) if shown_status else st.text("")
 					if machine_status.is_error() or not machine_status.get_timestamp_str():
 						disabled_btn = ["Up", "Sd", "Rs"]
 					elif machine_status.is_machine_up():
@@ -167,30 +343,34 @@ def single_host_container(hostdic):
 					if not disable_all:
 						if st.button('Start', key=f"{name}-start", disabled="Up" in disabled_btn):
 							with st.spinner(f"Starting..."):
-								ipmiman.powerUp()
-								while machine_status.is_machine_up() == False:
-									time.sleep(5)
-									machine_status.get()
-							with st.spinner(f"Waiting for OS..."):
-								while machine_status.is_os_up() == False:
+								started = act(ipmiman.powerUp, "Starting")
+								while started and machine_status.is_machine_up() == False:
 									time.sleep(5)
 									machine_status.get()
-							if auto_status:
+							if started:
+								with st.spinner(f"Waiting for OS..."):
+									while machine_status.is_os_up() == False:
+										time.sleep(5)
+										machine_status.get()
+							if started and auto_status:
 								st.rerun()
 						if st.button('Shutdown', key=f"{name}-shutdown", disabled="Sd" in disabled_btn):
 							with st.spinner(f"Shutting down..."):
-								ipmiman.softShutdown()
-								while machine_status.is_os_up():
+								stopped = act(ipmiman.softShutdown, "Shutting down")
+								while stopped and machine_status.is_os_up():
 									time.sleep(5)
 									machine_status.get()
-								while machine_status.is_machine_up():
+								while stopped and machine_status.is_machine_up():
 									time.sleep(5)
 									machine_status.get()
-							if auto_status:
+							if stopped and auto_status:
 								st.rerun()
 						if st.button('Reset', key=f"{name}-reset", disabled="Rs" in disabled_btn):
-							ipmiman.hardReset()
-							machine_status.get()
-			status.markdown(machine_status)
-			if machine_status.get_timestamp_str():
-				lastupdate.badge(f"Get status at {machine_status.get_timestamp_str()}",icon=":material/check:", color="grey")
+							if act(ipmiman.hardReset, "Resetting"):
+								machine_status.get()
+			events.update_status(cluster, name, machine_status.get_state_str())
+			if str(machine_status) != shown_status:
+				status.markdown(machine_status)
+			badge = status_badge(machine_status, since())
+			if badge and badge != shown_badge:
+				lastupdate.badge(badge, icon=":material/check:", color="grey")
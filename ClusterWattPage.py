@@ -1,111 +1,50 @@
 #!/usr/bin/env python3
 from datetime import datetime
+from pathlib import Path
 import time
-import numpy
+import pandas as pd
 
 import streamlit as st
 
-class Averager(object):
-	def __init__(self, num, num_outliers, precision):
-		self.hist = []
-		self.hist_take = []
-		self.hist_avg = []
-		self.num = num
-		if self.num < 3:
-			self.num = 3
-		self.num_outliers = num_outliers
-		if self.num_outliers % 2 != 0:
-			assert(True)
-		self.precision = precision
-		self.put_count = 0
-		self.count_until_max = 0
-
-	def put(self, val):
-		self.put_count += 1
-		self.count_until_max += 1
-		self.hist.append(val)
-		if len(self.hist) > self.num:
-			self.hist = self.hist[1:]
-		self.put_hist_avg(self.get())
-
-	def put_hist_avg(self, val):
-		self.hist_avg.append(val)
-		if len(self.hist_avg) > self.num:
-			self.hist_avg = self.hist_avg[1:]
-
-	def get_stddev(self):
-		return numpy.std(self.hist)
-
-	def get_rawavg(self):
-		if len(self.hist) == 0:
-			return 0.0
-		avg = round(sum(self.hist)/len(self.hist), self.precision)
-		return avg
-	
-	def get_variance(self):
-		return numpy.var(self.hist)
-
-	def get(self):
-		if len(self.hist) == 0:
-			return 0.0
-		if len(self.hist) <= self.num_outliers:
-			avg = sum(self.hist)/len(self.hist)
-			return avg
-		self.hist_take = sorted(self.hist)
-		edgenum = int(self.num_outliers / 2)
-		self.hist_take = self.hist_take[edgenum:-(edgenum+1)]
-		self.c = len(self.hist_take)
-		if self.c == 0:
-			return 0.0
-		self.m = sum(self.hist_take)
-		avg = self.m/self.c
-		return avg
-	
-	def get_str(self):
-		return f"{self.get():.3f}"
-	
-	def stat(self):
-		return f"{self.n_effective()} eff. / {self.n_samples()} smpl. / {self.n_all()} tot."
-
-	def is_good(self):
-		if self.num == len(self.hist):
-			return True
-		return False
-
-	def n_all(self):
-		return self.put_count
-
-	def n_samples(self):
-		return len(self.hist)
-	
-	def n_effective(self):
-		return len(self.hist_take)
-
-	def clear(self):
-		self.hist = []
-		self.hist_take = []
-		self.hist_avg = []
-		self.put_count = 0
-
-from ClusterPowerPage import ClusterBasePage, IPMIManager
+from ClusterPowerPage import ClusterBasePage, IPMIManager, render_event_log
 from SessionStateInterface import (
 	DataRecorderInterface,
 	ClusterStatisticsInterface,
 	PageStatisticsInterface
 )
-from PIDController import PIDController
+from RefreshScheduler import RefreshScheduler, init_state, system_clock
+from EnergyAccumulator import get_energy_accumulator
+from WindowStatistics import get_window_statistics, default_windows
+from PowerHistory import get_power_history, chart_ranges
+from CollectorAgent import get_reading_table
+from SharedReadings import get_shared_table
+from BMCLiveness import get_liveness
+from RerunProfiler import phase
+from HostGrid import HostGrid, power_sort_key
+from StatusEvents import get_event_stream, is_number
+from AnomalyDetector import get_anomaly_detector, anomaly_codes
+from RecordingBudget import current_session_id
+from PowerBudget import get_power_budget_controller
+
+# st.download_button takes a callable that builds the data on click since 1.52
+deferred_download = tuple(int(x) for x in st.__version__.split(".")[:2]) >= (1, 52)
 
 class ClusterWattPage(ClusterBasePage):
+	# a VirtualClock here runs the auto refresh timing without waiting
+	clock = system_clock
 
 	def get_title(self):
 		return self.title_str
 
 	def render(self):
-		self.duration_start_time = datetime.now()
+		self.duration_start_time = self.clock.now()
 
-		self.render_init()
-		self.render_ui()
-		self.render_logic()
+		with phase("render_init"):
+			self.render_init()
+		with phase("render_ui"):
+			self.render_ui()
+		with phase("render_logic"):
+			self.render_logic()
 
 	def render_init(self):
 		if not hasattr(self, "drec"):
@@ -114,6 +53,16 @@ class ClusterWattPage(ClusterBasePage):
 			self.clstat = ClusterStatisticsInterface(self)
 		if not hasattr(self, "pagestat"):
 			self.pagestat = PageStatisticsInterface(self)
+		if not hasattr(self, "energy"):
+			self.energy = get_energy_accumulator(Path(self.inifile).stem)
+		if not hasattr(self, "winstat"):
+			self.winstat = get_window_statistics(Path(self.inifile).stem)
+		if not hasattr(self, "history"):
+			self.history = get_power_history(Path(self.inifile).stem)
+		if not hasattr(self, "anomalies"):
+			self.anomalies = get_anomaly_detector(Path(self.inifile).stem)
+		if not hasattr(self, "budget"):
+			self.budget = get_power_budget_controller(Path(self.inifile).stem)
 
 		pss = PageStatisticsInterface(self)
 
@@ -128,28 +77,24 @@ class ClusterWattPage(ClusterBasePage):
 		st_o = pss["stat_outliers"]
 		st_s = pss["stat_samples"]
 
-		if not "ar_intl" in pss:
-			pss["ar_intl"] = Averager(st_s, st_o, 3)
-		if not "ar_dura" in pss:
-			pss["ar_dura"] = Averager(st_s, st_o, 3)
-		if not "ar_tgte" in pss:
-			pss["ar_tgte"] = Averager(st_s, st_o, 3)
-
-		if not "interval" in pss:
-			pss["interval"] = 0.0
-		if not "target_interval" in pss:
-			pss["target_interval"] = 0.0
-		if not "interval_error_correction" in pss:
-			pss["interval_error_correction"] = 0.0
-
-		if not "auto_since" in pss:
-			pss["auto_since"] = None
-		if not "auto_iec_amount" in pss:
-			pss["auto_iec_amount"] = 0.0
+		init_state(pss, st_s, st_o)
+		self.scheduler = RefreshScheduler(pss, self.clock)
+
+		if not "collection_mode" in pss:
+			pss["collection_mode"] = "Instantaneous"
+		if not "statistics_window" in pss:
+			pss["statistics_window"] = 60.0
+		# what each host field shows as (power, text), and the last event of the stream seen
+		if not "shown_power" in pss:
+			pss["shown_power"] = {}
+		if not "event_cursor" in pss:
+			pss["event_cursor"] = get_event_stream().seq
 
 		#formats
 		self.total_hosts_field_format = "({} machines)"
 		self.power_field_format = "{} W"
+		self.window_field_format = "{} W (min. {} W / max. {} W)"
+		self.collector_stale = 60.0
 		self.duration_field_format = "{} sec."
 		self.interval_field_format = "{} sec."
 		self.tgterror_field_format = "{} sec."
@@ -161,12 +106,14 @@ class ClusterWattPage(ClusterBasePage):
 
 		self.host_act_check = {}
 		self.host_power_field = {}
+		self.shown_power = pss["shown_power"]
 
 	def render_ui(self):
 		pss = PageStatisticsInterface(self)
 
 		# page's UI
 		st.header(f"Watt Monitor in {self.get_title()}")
+		self.render_errors()
 
 		with st.expander(label="Auto refresh"):
 			with st.container(horizontal=True, vertical_alignment="center", horizontal_alignment="left"):
@@ -213,16 +160,76 @@ class ClusterWattPage(ClusterBasePage):
 						st.caption(f"Amount of auto error correction")
 						st.text(f"{pss['auto_iec_amount']:.3f} sec.")
 
+		with st.expander(label="Collection mode"):
+			with st.container(horizontal=True, vertical_alignment="center", horizontal_alignment="left"):
+				self.collection_mode = st.radio(
+					"Collection mode", ["Instantaneous", "BMC statistics window"],
+					index=["Instantaneous", "BMC statistics window"].index(pss["collection_mode"]), horizontal=True)
+				self.statistics_window = st.number_input(
+					"Statistics window in seconds", value=pss["statistics_window"],
+					min_value=1.0, step=1.0, format="%.0f", disabled=self.collection_mode == "Instantaneous")
+			pss["collection_mode"] = self.collection_mode
+			pss["statistics_window"] = self.statistics_window
+			st.caption("In the statistics window mode, the BMC averages the power over the window "
+				"(DCMI enhanced power statistics over the supported period nearest to it, where supported), so the refresh interval can be as long as the window.")
+
+		with st.expander(label="Energy"):
+			self.cluster_energy_field = st.empty()
+			self.host_energy_field = st.empty()
+			self.render_energy()
+
+		with st.expander(label="Statistics"):
+			self.statistics_window_name = st.segmented_control(
+				"Window", list(default_windows), default=list(default_windows)[0], key=f"{self.get_urlpath()}-winstat")
+			self.winstat_field = st.empty()
+			self.render_window_statistics()
+
+		with st.expander(label="Anomalies"):
+			st.caption("Spikes against the rolling median and MAD, readings frozen at one value, "
+				"repeated errors and active hosts without readings. Readings of one session at a time are used, none of the statistics window mode.")
+			self.anomaly_field = st.empty()
+			self.render_anomalies()
+
+		with st.expander(label="Charts"):
+			with st.container(horizontal=True, vertical_alignment="bottom", horizontal_alignment="left"):
+				self.show_charts = st.toggle("Show charts", key=f"{self.get_urlpath()}-charts")
+				self.chart_range = st.selectbox("Range", list(chart_ranges), index=1, key=f"{self.get_urlpath()}-chart_range")
+				self.chart_points = st.number_input(
+					"Points per series (about the chart width in pixels)", value=600,
+					min_value=50, max_value=4000, step=50, key=f"{self.get_urlpath()}-chart_points")
+			st.caption("The charts are sent in full with every refresh, at most the points per series for each host; "
+				"fewer points or hosts make a refresh cheaper.")
+			self.total_chart_field = st.empty()
+			self.host_chart_field = st.empty()
+			self.render_charts()
+
 		with st.expander(label="Recording"):
 			with st.container(horizontal=True, vertical_alignment="center", horizontal_alignment="left"):
 				with st.container(horizontal=True, vertical_alignment="center", horizontal_alignment="left"):
 					self.record_data = st.toggle("Record data")
 					st.text(f"Records: {self.drec.get_id()}")
 					disabled = True if self.drec.get_id() == 0 else False
+				# the CSV is built from the spilled chunks only when the button is clicked, where supported
 				st.download_button(
-					label="Download", data=self.drec.to_download(), file_name=self.drec.get_fname(),
-					mime="text/csv", icon=":material/download:", disabled=disabled)
+					label="Download", data=self.drec.to_download if deferred_download else self.drec.to_download(),
+					file_name=self.drec.get_fname(), mime="text/csv", icon=":material/download:", disabled=disabled)
 				self.reset_recorded_data = st.button("Reset", disabled=disabled, icon=":material/delete:")
+			u = self.drec.usage()
+			st.caption(
+				f"This session: {u['memory'] / 1048576:.1f} MB in memory, {u['disk'] / 1048576:.1f} MB on disk / "
+				f"All {u['sessions']} sessions: {u['total_memory'] / 1048576:.1f} MB of {u['limit'] / 1048576:.0f} MB in memory, "
+				f"{u['total_disk'] / 1048576:.1f} MB on disk")
+
+		if self.power_budget is not None:
+			with st.expander(label="Power budget"):
+				self.render_power_budget_ui()
+
+		with st.expander(label="Events"):
+			if self.power_delta > 0:
+				st.caption(f"Hosts are redrawn when their power moves by {self.power_delta:g} W or more, or their error changes.")
+			else:
+				st.caption("Hosts are redrawn when their power or their error changes.")
+			render_event_log(Path(self.inifile).stem, self.get_urlpath())
 
 		with st.container(horizontal=True, vertical_alignment="center", horizontal_alignment="left"):
 			refresh = st.button("Manual refresh", disabled=self.auto_refresh_toggle)
@@ -237,22 +244,50 @@ class ClusterWattPage(ClusterBasePage):
 		with st.container(horizontal=True, border=True, horizontal_alignment="distribute"):
 			st.markdown(f"**Total power consumption**")
 			self.total_hosts_field = st.text(self.total_hosts_field_format.format(self.clstat.total_nhost()))
-			self.total_power_field = st.text(self.power_field_format.format(self.clstat.total_power()))
+			self.shown_total = self.power_field_format.format(self.clstat.total_power())
+			self.total_power_field = st.text(self.shown_total)
+
+		self.grid_mode = st.toggle("Compact grid", key=f"{self.get_urlpath()}-grid",
+			help="Show all hosts as one table with paging, sorting and filtering. Suitable for hundreds of hosts.")
+		if self.grid_mode:
+			self.render_host_grid()
+			return
 
 		for d in self.get_hosts_dic():
 			host = d["hostname"]
 
 			with st.container(horizontal=True, border=True, horizontal_alignment="distribute"):
-				self.host_act_check[host] = st.toggle("Activate", key=f"{host}-skip", label_visibility="collapsed")
+				self.host_act_check[host] = st.toggle(
+					"Activate", value=self.clstat.is_host_act(host), key=f"{host}-skip", label_visibility="collapsed")
 				st.markdown(f"**{host}**")
-				self.host_power_field[host] = st.text(self.power_field_format.format(self.clstat.host_power(host)))
+				shown = self.shown_power.get(host)
+				self.host_power_field[host] = st.text(shown[1] if shown else self.power_field_format.format(self.clstat.host_power(host)))
+
+	def render_host_grid(self):
+		grid = HostGrid(self, {
+			"Host": lambda d: d["hostname"],
+			"Power": lambda d: power_sort_key(self.clstat.host_power(d["hostname"])),
+		})
+		self.grid_visible = grid.render_controls()
+		for d in self.get_hosts_dic():
+			self.host_act_check[d["hostname"]] = self.clstat.is_host_act(d["hostname"])
+
+		col1, col2 = st.columns([3, 1])
+		with col1:
+			self.host_act_check.update(grid.render_editor(self.grid_visible, "Activate", self.clstat.is_host_act))
+		with col2:
+			self.grid_power_field = st.empty()
+			self.render_grid_power()
+
+	def render_grid_power(self):
+		powers = [self.power_field_format.format(self.clstat.host_power(d["hostname"])) for d in self.grid_visible]
+		anomalies = [self.anomalies.current(d["hostname"]) or "" for d in self.grid_visible]
+		self.grid_power_field.dataframe(pd.DataFrame({"Power": powers, "Anomaly": anomalies}), hide_index=True, width="stretch")
 
 	def finish_duration_measurement(self):
-		duration_end_time = datetime.now()
-		self.duration = duration_end_time - self.duration_start_time
-		self.ar_dura.put(self.duration.total_seconds())
+		self.duration = self.scheduler.finish(self.duration_start_time)
 		self.duration_field.text(self.duration_field_format.format(self.ar_dura.get_str()))
-		self.pagestat.set_duration(self.duration.total_seconds())
+		self.pagestat.set_duration(self.duration)
 		self.manualdura_field.text(f"Duration: {self.pagestat.duration():.3f} sec.")
 
 	def power_monitor_and_render(self):
@@ -261,31 +296,84 @@ class ClusterWattPage(ClusterBasePage):
 			st.rerun()
 
 		self.clstat.clear_touched()
+		cluster = Path(self.inifile).stem
+		events = get_event_stream()
+		powers = {}
+		if self.source == "ipmi":
+			with phase("ipmi"):
+				get_liveness().ping_stale([d["ipmi_ip"] for d in self.hosts_dic if self.host_act_check[d["hostname"]]])
 		for d in self.hosts_dic:
 			host = d["hostname"]
+			averaged = False
 
-			if self.host_act_check[host]:
+			if self.host_act_check[host] and self.source in ("collector", "shm"):
+				self.clstat.set_host_act(host)
+				power = self.collector_power(host)
+				power_str = self.power_field_format.format(power)
+				self.clstat.set_host_power(host, power)
+				self.energy.put(host, power)
+				self.winstat.put(host, power, current_session_id())
+				if self.record_data:
+					self.drec.set_record_data("power:"+host, power)
+
+			elif self.host_act_check[host]:
 				self.clstat.set_host_act(host)
 				ipmiman = IPMIManager(d["ipmi_ip"], d["ipmi_user"], d["ipmi_pass"], d["if_type"])
 				ipmiman.setPowerMethod(d["power_method"])
-				power = ipmiman.getCurrentPower()
+				ipmiman.setPowerSensor(d["power_sensor"])
+				with phase("ipmi"):
+					if self.collection_mode == "Instantaneous" or ipmiman.getPowerMethod() != "dcmi":
+						power = ipmiman.getCurrentPower()
+						power_str = self.power_field_format.format(power)
+					else:
+						power = self.window_power_monitor(host, ipmiman)
+						power_str = self.window_power_str
+						averaged = True
 				if ipmiman.isError():
 					power = f"/* {ipmiman.getCause()} */"
+					power_str = self.power_field_format.format(power)
 					self.clstat.set_host_power(host, power)
 				else:
 					self.clstat.set_host_power(host, power)
+				self.energy.put(host, power)
+				self.winstat.put(host, power, current_session_id())
 				if self.record_data:
 					self.drec.set_record_data("power:"+host, power)
 
 			else:
 				self.clstat.unset_host_act(host)
 				power = "n/a"
+				power_str = self.power_field_format.format(power)
 				self.clstat.set_host_power(host, power)
 
-			self.host_power_field[host].text(self.power_field_format.format(power))
+			if self.host_act_check[host]:
+				# window averages would blur the medians of the instantaneous readings
+				if averaged:
+					anomaly = self.anomalies.current(host)
+				else:
+					anomaly = self.anomalies.put(host, power, current_session_id())
+				if anomaly:
+					power_str = f"{power_str} [{anomaly}]"
+				if self.record_data:
+					self.drec.set_record_data("anomaly:"+host, anomaly_codes[anomaly])
+
+			if power != "n/a":
+				events.update_power(cluster, host, power, self.power_delta)
+			powers[host] = (power, power_str)
 
+		if not self.grid_mode:
+			self.redraw_hosts(powers)
 		self.total_hosts_field.text(self.total_hosts_field_format.format(self.clstat.total_nhost()))
-		self.total_power_field.text(self.power_field_format.format(self.clstat.total_power()))
+		total = self.power_field_format.format(self.clstat.total_power())
+		if total != self.shown_total:
+			self.total_power_field.text(total)
+		if self.grid_mode:
+			self.render_grid_power()
+		self.render_energy()
+		self.render_window_statistics()
+		self.render_anomalies()
+		self.render_power_budget({host: p if is_number(p) else None for host, (p, _) in powers.items() if self.host_act_check[host]})
+		self.append_charts()
 
 		if self.record_data:
 			t = datetime.now()
@@ -293,6 +381,137 @@ class ClusterWattPage(ClusterBasePage):
 			self.drec.set_record_datetime(t)
 			self.drec.inc_id()
 
+	def redraw_hosts(self, powers):
+		# a field keeps its text while the host moves less than power_delta; errors,
+		# n/a and recoveries are redrawn as soon as the text changes
+		pss = PageStatisticsInterface(self)
+		changed, overflow, pss["event_cursor"] = get_event_stream().changed_hosts(pss["event_cursor"], Path(self.inifile).stem)
+		for host, (power, text) in powers.items():
+			shown = self.shown_power.get(host)
+			if shown is not None:
+				if shown[1] == text:
+					continue
+				if is_number(shown[0]) and is_number(power) and not (host in changed or overflow):
+					continue
+			self.shown_power[host] = (power, text)
+			self.host_power_field[host].text(text)
+
+	def collector_power(self, host):
+		if self.source == "shm":
+			table = get_shared_table()
+			if table is None:
+				return "/* No shared reading table, run HeadlessCollector.py --shm */"
+		else:
+			table = get_reading_table()
+			if table is None:
+				return "/* Collector receiver is not running */"
+		reading = table.get(Path(self.inifile).stem, host)
+		if reading is None:
+			return "/* No reading from collector */"
+		if time.time() - reading["t"] > self.collector_stale:
+			return f"/* Stale reading from {reading['agent']} */"
+		if reading["error"]:
+			return f"/* {reading['error']} */"
+		return reading["power"]
+
+	def render_energy(self):
+		hosts = [d["hostname"] for d in self.get_hosts_dic()]
+		c = self.energy.cluster_rollup(hosts)
+		self.cluster_energy_field.text(
+			f"Cluster: {c['today (kWh)']} kWh today / {c['this month (kWh)']} kWh this month / {c['total (kWh)']} kWh total")
+		self.host_energy_field.dataframe(self.energy.rollup(hosts), hide_index=True)
+
+	def render_window_statistics(self):
+		if not self.statistics_window_name:
+			self.winstat_field.empty()
+			return
+		hosts = [d["hostname"] for d in self.get_hosts_dic()]
+		self.winstat_field.dataframe(self.winstat.table(hosts, self.statistics_window_name), hide_index=True)
+
+	def render_power_budget_ui(self):
+		# the controller is shared by every session of the cluster, and so is this toggle
+		enforce = st.toggle(f"Enforce power budget of {self.power_budget:g} W", value=self.budget.enabled,
+			help="Share the budget out as DCMI power limits in proportion to each host's power, never below its power_floor.")
+		if enforce and not self.budget.enabled:
+			self.budget.enabled = True
+		elif not enforce and self.budget.enabled:
+			self.budget.enabled = False
+			st.toast(f"Power limits of {self.budget.release(self.get_hosts_dic())} hosts deactivated.")
+		st.caption("The limits follow the power only while a watt page of this cluster refreshes or PowerBudget.py runs; "
+			"otherwise the BMCs keep the last ones until the budget is turned off.")
+		self.budget_summary_field = st.empty()
+		self.budget_field = st.empty()
+		self.render_power_budget()
+		if st.button("Read limits from BMCs"):
+			st.dataframe(self.budget.bmc_limits([d for d in self.get_hosts_dic() if not d["disabled"]]), hide_index=True)
+
+	def render_power_budget(self, readings:dict|None=None):
+		# ticks with the readings of a refresh, and only shows the last tick without them
+		if self.power_budget is None:
+			return
+		if not self.budget.enabled:
+			self.budget_summary_field.text("Not enforced.")
+			self.budget_field.empty()
+			return
+		s = self.budget.tick(self.get_hosts_dic(), self.power_budget, readings) if readings is not None else self.budget.summary
+		if not s:
+			self.budget_summary_field.text("No limits written yet." if readings is None else "No enabled hosts.")
+			return
+		warning = " The floors alone exceed the budget." if s["floors over budget"] else ""
+		unlimited = f" ({s['unlimited']:.0f} W of disabled hosts)" if s["unlimited"] else ""
+		if s["unlimited unread"]:
+			unlimited += f", {s['unlimited unread']} disabled hosts without a reading"
+		self.budget_summary_field.text(
+			f"Measured {s['measured']:.0f} W{unlimited} of {s['budget']:.0f} W (allocating {s['target']:.0f} W), "
+			f"{s['written']} limits written, {s['unread']} hosts unread at {datetime.fromtimestamp(s['at']):%H:%M:%S}.{warning}")
+		self.budget_field.dataframe(self.budget.table(), hide_index=True)
+
+	def render_anomalies(self):
+		rows = self.anomalies.table([d["hostname"] for d in self.get_hosts_dic()])
+		if rows:
+			self.anomaly_field.dataframe(rows, hide_index=True)
+		else:
+			self.anomaly_field.text("No anomalies.")
+
+	def render_charts(self):
+		if not self.show_charts:
+			return
+		hosts = [d["hostname"] for d in self.get_hosts_dic()]
+		self.charts_drawn_at = self.history.latest()
+		self.total_chart_field.line_chart(
+			self.history.total_frame(self.chart_range, self.chart_points), x="time", y="power (W)", height=200)
+		self.host_chart_field.line_chart(
+			self.history.host_frame(hosts, self.chart_range, self.chart_points), x="time", y="power (W)", color="host")
+
+	def append_charts(self):
+		host_powers = {}
+		for d in self.get_hosts_dic():
+			if self.host_act_check[d["hostname"]]:
+				host_powers[d["hostname"]] = self.clstat.host_power(d["hostname"])
+		if not host_powers:
+			return
+		self.history.append(host_powers)
+		# Streamlit has no add_rows any more, and the next rerun draws the charts anyway; they
+		# are sent again now only when the new reading closes a bucket of the downsampled series
+		if not self.show_charts:
+			return
+		bucket = self.history.bucket_seconds(self.chart_range, self.chart_points)
+		if self.charts_drawn_at is None or self.history.latest() - self.charts_drawn_at >= bucket:
+			self.render_charts()
+
+	def window_power_monitor(self, host, ipmiman):
+		ipmiman.setStatisticsPeriod(self.statistics_window)
+		stats = ipmiman.getPowerStatistics()
+		if stats is None:
+			self.window_power_str = self.power_field_format.format(None)
+			return None
+		self.window_power_str = self.window_field_format.format(stats["average"], stats["minimum"], stats["maximum"])
+		if self.record_data:
+			self.drec.set_record_data("power_min:"+host, stats["minimum"])
+			self.drec.set_record_data("power_max:"+host, stats["maximum"])
+			self.drec.set_record_data("period:"+host, stats["period"])
+		return stats["average"]
+
 	def render_logic(self):
 		pss = PageStatisticsInterface(self)
 
@@ -301,73 +520,27 @@ class ClusterWattPage(ClusterBasePage):
 
 		self.power_monitor_and_render()
 
+		scheduler = self.scheduler
 		if not self.auto_refresh_toggle:
-			pss.unset_autoref()
+			scheduler.stop()
 			self.finish_duration_measurement()
 		else:
-			init_refresh = False
-			init_auto_correct = False
-
-			if not pss.autoref():
-				init_refresh = True
-			pss.set_autoref()
-
-			if self.auto_correct_toggle:
-				if not pss["auto_correct"]:
-					init_auto_correct = True
-			pss["auto_correct"] = self.auto_correct_toggle
-
-			if pss["target_interval"] != self.target_interval:
-				init_refresh = True
-			if pss["interval_error_correction"] != self.interval_error_correction:
-				init_refresh = True
-			if self.clstat.are_hosts_touched():
-				init_refresh = True
-
-			pss["target_interval"] = self.target_interval
-			pss["interval_error_correction"] = self.interval_error_correction
-
-			if init_refresh:
-				pss["auto_since"] = datetime.now().strftime("%Y/%m/%d %H:%M:%S")
-				pss["duration_start_previous"] = None
-				self.since_field.text(f"{pss["auto_since"]}")
-				self.ar_intl.clear()
-				self.ar_dura.clear()
-				self.ar_tgte.clear()
+			seconds = scheduler.tick(self.duration_start_time, self.target_interval, self.interval_error_correction,
+				self.auto_correct_toggle, self.clstat.are_hosts_touched())
+
+			if scheduler.restarted:
+				self.since_field.text(f"{pss['auto_since']}")
 				self.duration_field.text(self.duration_field_format.format(self.ar_dura.get_str()))
 				self.interval_field.text(self.interval_field_format.format(self.ar_intl.get_str()))
 				self.tgterror_field.text(self.tgterror_field_format.format(self.ar_tgte.get_str()))
 
-			if not hasattr(self, "pid"):
-				self.pidcon = PIDController(0.15, 0.05, 0.1)
-
-			if init_auto_correct:
-				self.pidcon.clear()
-				pss["auto_iec_amount"] = 0.0
-
-			if pss["duration_start_previous"] != None:
-				self.interval = self.duration_start_time - pss["duration_start_previous"]
-				pss["interval"] = f"{self.interval.total_seconds():.3f}"
+			if scheduler.interval is not None:
 				self.curinterval_field.text(self.interval_field_format.format(pss["interval"]))
-				self.ar_intl.put(self.interval.total_seconds())
 				self.interval_field.text(self.interval_field_format.format(self.ar_intl.get_str()))
-				self.ar_tgte.put(self.interval.total_seconds() - self.target_interval)
 				self.tgterror_field.text(self.tgterror_field_format.format(self.ar_tgte.get_str()))
-				if self.auto_correct_toggle:
-					self.pidcon.put_data(self.target_interval, self.interval.total_seconds())
-			pss["duration_start_previous"] = self.duration_start_time
-
-			if self.auto_correct_toggle:
-				pss["auto_iec_amount"] += self.pidcon.get_correction()
-
-			static_seconds = self.target_interval + self.interval_error_correction
-			seconds = static_seconds + pss["auto_iec_amount"]
-
-			if seconds < 0:
-				seconds = static_seconds
-				pss["auto_iec_amount"] = 0.0
 
 			self.finish_duration_measurement()
 
-			time.sleep(seconds)
+			with phase("sleep"):
+				self.clock.sleep(seconds)
 			st.rerun()
@@ -0,0 +1,254 @@
+#!/usr/bin/env python3
+
+import hashlib
+import hmac
+import ipaddress
+import json
+import socket
+import socketserver
+import struct
+import threading
+import time
+import uuid
+import zlib
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+from ClusterBasePage import ClusterBasePage
+
+default_port = 6230
+# frames are the payload length, an HMAC-SHA256 of the payload with the shared secret, and the zlib payload
+frame_header = struct.Struct("!I")
+mac_size = hashlib.sha256().digest_size
+max_frame = 1 << 20
+max_batch = 16 << 20
+ack = b"\x06"
+secret_file = Path("./COLLECTOR_SECRET")
+
+def read_host_power(cluster:str, hostdic:dict) -> list:
+	from IPMIManager import IPMIManager
+	ipmiman = IPMIManager(hostdic["ipmi_ip"], hostdic["ipmi_user"], hostdic["ipmi_pass"], hostdic["if_type"])
+	ipmiman.setPowerMethod(hostdic["power_method"])
+	ipmiman.setPowerSensor(hostdic["power_sensor"])
+	try:
+		power = ipmiman.getCurrentPower()
+	except Exception as e:
+		return [cluster, hostdic["hostname"], time.time(), None, type(e).__name__]
+	error = ipmiman.getCause() if ipmiman.isError() else None
+	if not isinstance(power, (int, float)):
+		power = None
+	return [cluster, hostdic["hostname"], time.time(), power, error]
+
+def poll_clusters(pages:list, executor:ThreadPoolExecutor) -> list:
+	futures = []
+	for p in pages:
+		cluster = Path(p.inifile).stem
+		for d in p.get_hosts_dic():
+			futures.append(executor.submit(read_host_power, cluster, d))
+	return [f.result() for f in futures]
+
+def read_secret(path:Path=secret_file) -> bytes:
+	if not path.exists():
+		return b""
+	return path.read_text().strip().encode("utf-8")
+
+def frame_mac(secret:bytes, payload:bytes) -> bytes:
+	return hmac.new(secret, payload, hashlib.sha256).digest()
+
+def encode_frame(batch:dict, secret:bytes=b"") -> bytes:
+	payload = zlib.compress(json.dumps(batch, separators=(",", ":")).encode("utf-8"))
+	return frame_header.pack(len(payload)) + frame_mac(secret, payload) + payload
+
+def recv_exact(sock, n:int) -> bytes:
+	buf = b""
+	while len(buf) < n:
+		chunk = sock.recv(n - len(buf))
+		if not chunk:
+			raise ConnectionError("connection closed")
+		buf += chunk
+	return buf
+
+def recv_frame(sock, secret:bytes=b"") -> dict:
+	(n,) = frame_header.unpack(recv_exact(sock, frame_header.size))
+	if n > max_frame:
+		raise ValueError(f"frame of {n} bytes")
+	mac = recv_exact(sock, mac_size)
+	payload = recv_exact(sock, n)
+	if not hmac.compare_digest(mac, frame_mac(secret, payload)):
+		raise ValueError("bad frame MAC")
+	d = zlib.decompressobj()
+	data = d.decompress(payload, max_batch)
+	if d.unconsumed_tail:
+		raise ValueError(f"batch over {max_batch} bytes")
+	return validate_batch(json.loads(data.decode("utf-8")))
+
+def is_number(x) -> bool:
+	return isinstance(x, (int, float)) and not isinstance(x, bool)
+
+def validate_batch(batch) -> dict:
+	if not isinstance(batch, dict) or not isinstance(batch.get("a"), str) or not isinstance(batch.get("b"), str) \
+			or not isinstance(batch.get("s"), int) or not isinstance(batch.get("r"), list) \
+			or not (batch.get("n") is None or is_number(batch["n"])):
+		raise ValueError("malformed batch")
+	for r in batch["r"]:
+		if not isinstance(r, list) or len(r) != 5:
+			raise ValueError("malformed reading")
+		cluster, host, t, power, error = r
+		if not isinstance(cluster, str) or not isinstance(host, str) or not is_number(t) \
+				or not (power is None or is_number(power)) or not (error is None or isinstance(error, str)):
+			raise ValueError("malformed reading")
+	return batch
+
+def parse_address(s:str, default_host:str="127.0.0.1") -> tuple:
+	host, sep, port = s.strip().rpartition(":")
+	if not sep:
+		return (s.strip() or default_host, default_port)
+	return (host or default_host, int(port))
+
+
+class CollectorAgent(object):
+	def __init__(self, inifiles:list, server:tuple, interval:float=10.0, max_workers:int=16, backlog:int=360, secret:bytes=b""):
+		self.pages = [ClusterBasePage(f) for f in inifiles]
+		self.server = server
+		self.secret = secret
+		self.interval = interval
+		self.executor = ThreadPoolExecutor(max_workers=max_workers)
+		self.agent_id = socket.gethostname()
+		self.boot = uuid.uuid4().hex[:8]
+		self.seq = 0
+		# unsent batches are kept while the dashboard is unreachable and sent in order later
+		self.pending = deque(maxlen=backlog)
+		self.sock = None
+
+	def connect(self):
+		if self.sock:
+			return
+		self.sock = socket.create_connection(self.server, timeout=10)
+
+	def close(self):
+		if self.sock:
+			self.sock.close()
+		self.sock = None
+
+	def push(self):
+		while self.pending:
+			try:
+				self.connect()
+				# the agent's clock at sending, so the dashboard can date the readings by its own clock
+				self.sock.sendall(encode_frame(dict(self.pending[0], n=time.time()), self.secret))
+				if recv_exact(self.sock, 1) != ack:
+					raise ConnectionError("no ack")
+			except OSError:
+				self.close()
+				return
+			self.pending.popleft()
+
+	def collect_once(self):
+		readings = poll_clusters(self.pages, self.executor)
+		self.seq += 1
+		self.pending.append({"a": self.agent_id, "b": self.boot, "s": self.seq, "r": readings})
+		self.push()
+
+	def run(self):
+		next_at = time.monotonic()
+		while True:
+			self.collect_once()
+			next_at += self.interval
+			time.sleep(max(0.0, next_at - time.monotonic()))
+
+
+class ReadingTable(object):
+	def __init__(self):
+		self.readings = {}
+		self.last_seq = {}
+		self.agents = {}
+		self.lock = threading.Lock()
+
+	def merge(self, batch:dict) -> bool:
+		# readings are dated by this clock: the receive time less their age when the agent sent
+		# them, so clock skew between the machines does not make hosts look stale or live
+		agent = (batch["a"], batch["b"])
+		received = time.time()
+		with self.lock:
+			if self.last_seq.get(agent, 0) >= batch["s"]:
+				return False
+			self.last_seq[agent] = batch["s"]
+			self.agents[batch["a"]] = received
+			for cluster, host, t, power, error in batch["r"]:
+				key = (cluster, host)
+				t = min(received, received - (batch["n"] - t)) if batch.get("n") is not None else received
+				# several agents may poll the same BMC; keep only the newest reading
+				if key in self.readings and self.readings[key]["t"] >= t:
+					continue
+				self.readings[key] = {"t": t, "power": power, "error": error, "agent": batch["a"]}
+		return True
+
+	def get(self, cluster:str, host:str) -> dict|None:
+		with self.lock:
+			return self.readings.get((cluster, host))
+
+	def agent_list(self) -> dict:
+		with self.lock:
+			return dict(self.agents)
+
+
+class CollectorRequestHandler(socketserver.BaseRequestHandler):
+	def handle(self):
+		while True:
+			try:
+				batch = recv_frame(self.request, self.server.secret)
+			except (ConnectionError, OSError, ValueError, zlib.error):
+				# a bad frame closes the connection; the agent keeps the batch and reconnects
+				return
+			self.server.table.merge(batch)
+			self.request.sendall(ack)
+
+
+class CollectorReceiver(socketserver.ThreadingTCPServer):
+	daemon_threads = True
+	allow_reuse_address = True
+
+	def __init__(self, address:tuple, secret:bytes=b""):
+		# anyone who can connect could report readings, so other addresses need a shared secret
+		if not secret and not ipaddress.ip_address(socket.gethostbyname(address[0])).is_loopback:
+			raise ValueError(f"listening on {address[0]} needs a shared secret in {secret_file}")
+		super().__init__(address, CollectorRequestHandler)
+		self.secret = secret
+		self.table = ReadingTable()
+		self.thread = threading.Thread(target=self.serve_forever, daemon=True)
+		self.thread.start()
+
+
+receiver = None
+receiver_lock = threading.Lock()
+
+def get_receiver(address:tuple=("127.0.0.1", default_port), secret:bytes=b"") -> CollectorReceiver:
+	global receiver
+	with receiver_lock:
+		if receiver is None:
+			receiver = CollectorReceiver(address, secret)
+		return receiver
+
+def get_reading_table() -> ReadingTable|None:
+	if receiver is None:
+		return None
+	return receiver.table
+
+
+def main():
+	import argparse
+	parser = argparse.ArgumentParser(description="Poll BMCs near a rack and push the readings to the dashboard.")
+	parser.add_argument("inifiles", nargs="*", help="cluster ini files (default: *.ini)")
+	parser.add_argument("--server", required=True, help="dashboard collector address, host:port")
+	parser.add_argument("--interval", type=float, default=10.0, help="polling interval in seconds")
+	parser.add_argument("--workers", type=int, default=16, help="number of BMCs polled at the same time")
+	parser.add_argument("--secret-file", default=str(secret_file), help="file with the secret shared with the dashboard")
+	args = parser.parse_args()
+
+	inifiles = args.inifiles if args.inifiles else sorted(Path(".").glob("*.ini"))
+	agent = CollectorAgent(inifiles, parse_address(args.server), args.interval, args.workers, secret=read_secret(Path(args.secret_file)))
+	agent.run()
+
+if __name__=="__main__":
+	main()
@@ -0,0 +1,190 @@
+#!/usr/bin/env python3
+
+# Recordings are stored one directory per recording, one raw little-endian
+# file per column, so they can be memory-mapped and sliced without loading:
+#
+#   recordings/<page>/<since>_<session>/meta.json    column names
+#   recordings/<page>/<since>_<session>/time.i8      datetime64[ns] as int64
+#   recordings/<page>/<since>_<session>/<n>.f8       float64 column n, NaN when missing
+#
+# A writer buffers rows and appends them to the files every flush_rows rows or
+# flush_seconds seconds, opening the files only for that; rows show up in the
+# recording once flushed.
+
+import atexit
+import json
+import threading
+import time
+from datetime import datetime
+from pathlib import Path
+
+import numpy
+
+recordings_dir = Path("./recordings")
+flush_rows = 60
+flush_seconds = 10.0
+# writers of sessions that stopped recording without a reset are flushed and dropped
+idle_seconds = 600.0
+
+def to_float(v) -> float:
+	if isinstance(v, bool) or not isinstance(v, (int, float)):
+		return numpy.nan
+	return float(v)
+
+
+class ColumnarWriter(object):
+	def __init__(self, path:Path):
+		self.path = path
+		self.path.mkdir(parents=True, exist_ok=True)
+		self.columns = []
+		self.rows = 0
+		self.buffer = []
+		self.flushed_at = time.monotonic()
+		self.used_at = time.monotonic()
+		self.lock = threading.Lock()
+		if (self.path / "meta.json").exists():
+			self.columns = json.loads((self.path / "meta.json").read_text())["columns"]
+			self.rows = (self.path / "time.i8").stat().st_size // 8
+
+	def append_row(self, at:datetime, values:dict):
+		with self.lock:
+			self.buffer.append((numpy.datetime64(at, "ns").astype(numpy.int64), dict(values)))
+			self.used_at = time.monotonic()
+			if len(self.buffer) >= flush_rows or self.used_at - self.flushed_at >= flush_seconds:
+				self.flush_locked()
+
+	def flush_locked(self):
+		self.flushed_at = time.monotonic()
+		if not self.buffer:
+			return
+		new = [name for name in dict.fromkeys(name for _, values in self.buffer for name in values) if not name in self.columns]
+		for name in new:
+			self.columns.append(name)
+			# a column that appears later is back-filled with NaN for the earlier rows
+			with open(self.path / f"{self.columns.index(name)}.f8", "ab") as f:
+				numpy.full(self.rows, numpy.nan, dtype="<f8").tofile(f)
+		if new:
+			(self.path / "meta.json").write_text(json.dumps({"columns": self.columns}))
+		for i, name in enumerate(self.columns):
+			with open(self.path / f"{i}.f8", "ab") as f:
+				numpy.array([to_float(values.get(name)) for _, values in self.buffer], dtype="<f8").tofile(f)
+		# the time file last, since readers take the number of rows from it
+		with open(self.path / "time.i8", "ab") as f:
+			numpy.array([t for t, _ in self.buffer], dtype="<i8").tofile(f)
+		self.rows += len(self.buffer)
+		self.buffer = []
+
+	def flush(self):
+		with self.lock:
+			self.flush_locked()
+
+	def close(self):
+		self.flush()
+
+
+class ColumnarRecording(object):
+	def __init__(self, path:Path):
+		self.path = Path(path)
+		self.columns = json.loads((self.path / "meta.json").read_text())["columns"]
+		time_file = self.path / "time.i8"
+		self.rows = time_file.stat().st_size // 8
+		self.time = numpy.memmap(time_file, dtype="<i8", mode="r", shape=(self.rows,)) if self.rows else numpy.empty(0, dtype="<i8")
+
+	def column(self, name:str, start:int=0, end:int|None=None):
+		end = self.rows if end is None else end
+		f = self.path / f"{self.columns.index(name)}.f8"
+		n = min(self.rows, f.stat().st_size // 8)
+		if n == 0:
+			return numpy.full(end - start, numpy.nan)
+		col = numpy.memmap(f, dtype="<f8", mode="r", shape=(n,))[start:min(end, n)]
+		if len(col) < end - start:
+			# a row being written right now may not have reached every column file yet
+			col = numpy.concatenate([col, numpy.full(end - start - len(col), numpy.nan)])
+		return col
+
+	def time_range(self) -> tuple:
+		if self.rows == 0:
+			return None, None
+		return self.time[0].astype("datetime64[ns]"), self.time[-1].astype("datetime64[ns]")
+
+	def index_range(self, start:datetime, end:datetime) -> tuple:
+		i = int(numpy.searchsorted(self.time, numpy.datetime64(start, "ns").astype(numpy.int64), side="left"))
+		j = int(numpy.searchsorted(self.time, numpy.datetime64(end, "ns").astype(numpy.int64), side="right"))
+		return i, j
+
+	def host_columns(self, prefix:str="power:") -> list:
+		return [c for c in self.columns if c.startswith(prefix) and c != prefix + "total"]
+
+	def host_summary(self, i:int, j:int, max_gap:float=300.0) -> list:
+		t = self.time[i:j].astype(numpy.float64) / 1e9
+		rows = []
+		for name in self.host_columns():
+			host = name.split(":", 1)[1]
+			v = self.column(name, i, j)
+			valid = numpy.isfinite(v)
+			rows.append({
+				"host": host,
+				"samples": int(valid.sum()),
+				"mean (W)": round(float(v[valid].mean()), 1) if valid.any() else None,
+				"peak (W)": float(v[valid].max()) if valid.any() else None,
+				"energy (kWh)": round(energy_wh(t[valid], v[valid], max_gap) / 1000, 3),
+				# samples marked by AnomalyDetector, in recordings that have them
+				"anomalies": int((self.column("anomaly:" + host, i, j) > 0).sum()) if "anomaly:" + host in self.columns else None,
+			})
+		return rows
+
+	def hourly_total(self, i:int, j:int):
+		if not "power:total" in self.columns or i >= j:
+			return numpy.empty(0, dtype="datetime64[h]"), numpy.empty(0)
+		hours = self.time[i:j].astype("datetime64[ns]").astype("datetime64[h]")
+		v = self.column("power:total", i, j)
+		valid = numpy.isfinite(v)
+		keys, inverse = numpy.unique(hours[valid], return_inverse=True)
+		means = numpy.bincount(inverse, weights=v[valid]) / numpy.bincount(inverse)
+		return keys, means
+
+
+def energy_wh(t, v, max_gap:float) -> float:
+	if len(t) < 2:
+		return 0.0
+	dt = numpy.diff(t)
+	# intervals longer than max_gap are gaps in the recording and are not integrated
+	dt = numpy.where(dt > max_gap, 0.0, dt)
+	return float(((v[1:] + v[:-1]) / 2 * dt).sum() / 3600)
+
+def list_recordings() -> list:
+	if not recordings_dir.exists():
+		return []
+	return sorted((p for p in recordings_dir.glob("*/*") if (p / "meta.json").exists()), reverse=True)
+
+
+writers = {}
+writers_lock = threading.Lock()
+
+def writer_path(page_name:str, since:datetime, session_id:str) -> Path:
+	# sessions starting to record the same page in the same second get their own recordings
+	return recordings_dir / page_name / f"{since.strftime('%Y%m%d_%H%M%S')}_{session_id[:8]}"
+
+def get_writer(page_name:str, since:datetime, session_id:str) -> ColumnarWriter:
+	path = writer_path(page_name, since, session_id)
+	now = time.monotonic()
+	with writers_lock:
+		for p, w in list(writers.items()):
+			if p != path and now - w.used_at > idle_seconds:
+				writers.pop(p).close()
+		if not path in writers:
+			writers[path] = ColumnarWriter(path)
+		return writers[path]
+
+def close_writer(page_name:str, since:datetime, session_id:str):
+	path = writer_path(page_name, since, session_id)
+	with writers_lock:
+		if path in writers:
+			writers.pop(path).close()
+
+@atexit.register
+def close_writers():
+	with writers_lock:
+		for w in writers.values():
+			w.close()
+		writers.clear()
@@ -0,0 +1,237 @@
+#!/usr/bin/env python3
+
+# Energy of each host, integrated from its readings and kept in
+# energy/<cluster>.json. Several dashboard processes may share the file: each
+# one adds what it counted since its last save under a file lock, and a host
+# another live process is counting is left to that process, so no energy is
+# overwritten or counted twice. Accumulators are saved at exit too.
+
+import atexit
+import fcntl
+import json
+import os
+import threading
+import time
+from datetime import datetime
+from pathlib import Path
+
+energy_dir = Path("./energy")
+
+def pid_alive(pid:int) -> bool:
+	try:
+		os.kill(pid, 0)
+	except ProcessLookupError:
+		return False
+	except PermissionError:
+		pass
+	return True
+
+class HostEnergy(object):
+	def __init__(self, max_gap:float):
+		self.max_gap = max_gap
+		self.last_t = None
+		self.last_power = None
+		self.total_wh = 0.0
+		self.daily = {}
+		self.monthly = {}
+		self.samples = 0
+		self.missing = 0
+		self.gaps = 0
+		self.gap_seconds = 0.0
+
+	def put(self, t:float, at:datetime, power) -> dict:
+		# returns what the sample adds, in the form of to_dict()
+		delta = {}
+		if isinstance(power, bool) or not isinstance(power, (int, float)):
+			# errors and missing readings are bridged by the next valid sample if it arrives within max_gap
+			delta["missing"] = 1
+			self.add(delta)
+			return delta
+		delta["samples"] = 1
+		if self.last_t is not None and t > self.last_t:
+			dt = t - self.last_t
+			if dt > self.max_gap:
+				delta["gaps"] = 1
+				delta["gap_seconds"] = dt
+			else:
+				wh = (self.last_power + power) / 2 * dt / 3600
+				delta["total_wh"] = wh
+				delta["daily"] = {at.strftime("%Y-%m-%d"): wh}
+				delta["monthly"] = {at.strftime("%Y-%m"): wh}
+		if self.last_t is None or t > self.last_t:
+			self.last_t = t
+			self.last_power = power
+		self.add(delta)
+		return delta
+
+	def add(self, d:dict):
+		self.total_wh += d.get("total_wh", 0.0)
+		for day, wh in d.get("daily", {}).items():
+			self.daily[day] = self.daily.get(day, 0.0) + wh
+		for month, wh in d.get("monthly", {}).items():
+			self.monthly[month] = self.monthly.get(month, 0.0) + wh
+		self.samples += d.get("samples", 0)
+		self.missing += d.get("missing", 0)
+		self.gaps += d.get("gaps", 0)
+		self.gap_seconds += d.get("gap_seconds", 0.0)
+
+	def day_wh(self, day:str) -> float:
+		return self.daily.get(day, 0.0)
+
+	def month_wh(self, month:str) -> float:
+		return self.monthly.get(month, 0.0)
+
+	def to_dict(self) -> dict:
+		return {
+			"total_wh": self.total_wh,
+			"daily": self.daily,
+			"monthly": self.monthly,
+			"samples": self.samples,
+			"missing": self.missing,
+			"gaps": self.gaps,
+			"gap_seconds": self.gap_seconds,
+		}
+
+	def from_dict(self, d:dict):
+		self.total_wh = d.get("total_wh", 0.0)
+		self.daily = d.get("daily", {})
+		self.monthly = d.get("monthly", {})
+		self.samples = d.get("samples", 0)
+		self.missing = d.get("missing", 0)
+		self.gaps = d.get("gaps", 0)
+		self.gap_seconds = d.get("gap_seconds", 0.0)
+
+
+class EnergyAccumulator(object):
+	def __init__(self, name:str, max_gap:float=300.0, save_interval:float=60.0):
+		self.name = name
+		self.max_gap = max_gap
+		self.save_interval = save_interval
+		self.hosts = {}
+		# what this process counted since its last save
+		self.pending = {}
+		self.saved_at = time.monotonic()
+		self.lock = threading.Lock()
+		energy_dir.mkdir(exist_ok=True)
+		with self.file_lock():
+			self.hosts_from(self.read())
+
+	def fname(self) -> Path:
+		return energy_dir / f"{self.name}.json"
+
+	def file_lock(self):
+		# an flock held while the file object is open
+		f = open(energy_dir / f"{self.name}.lock", "a")
+		fcntl.flock(f, fcntl.LOCK_EX)
+		return f
+
+	def read(self) -> dict:
+		if not self.fname().exists():
+			return {"hosts": {}, "counted_by": {}}
+		try:
+			with open(self.fname()) as f:
+				d = json.load(f)
+		except (OSError, ValueError):
+			return {"hosts": {}, "counted_by": {}}
+		d.setdefault("hosts", {})
+		d.setdefault("counted_by", {})
+		return d
+
+	def hosts_from(self, d:dict):
+		# the totals of the file, keeping where the integration of each host stands
+		for host, hd in d["hosts"].items():
+			if not host in self.hosts:
+				self.hosts[host] = HostEnergy(self.max_gap)
+			self.hosts[host].from_dict(hd)
+
+	def save_locked(self):
+		pid = os.getpid()
+		now = time.time()
+		with self.file_lock():
+			d = self.read()
+			for host, delta in self.pending.items():
+				counted_by = d["counted_by"].get(host)
+				if counted_by and counted_by[0] != pid and now - counted_by[1] < 2 * self.save_interval and pid_alive(counted_by[0]):
+					continue
+				he = HostEnergy(self.max_gap)
+				he.from_dict(d["hosts"].get(host, {}))
+				he.add(delta)
+				d["hosts"][host] = he.to_dict()
+				d["counted_by"][host] = [pid, now]
+			tmp = self.fname().with_suffix(f".{pid}.tmp")
+			with open(tmp, "w") as f:
+				json.dump(d, f)
+			tmp.replace(self.fname())
+			self.hosts_from(d)
+		self.pending = {}
+		self.saved_at = time.monotonic()
+
+	def save(self):
+		with self.lock:
+			self.save_locked()
+
+	def put(self, host:str, power):
+		with self.lock:
+			if not host in self.hosts:
+				self.hosts[host] = HostEnergy(self.max_gap)
+			delta = self.hosts[host].put(time.monotonic(), datetime.now(), power)
+			if not host in self.pending:
+				self.pending[host] = {}
+			merge_delta(self.pending[host], delta)
+			if time.monotonic() - self.saved_at > self.save_interval:
+				self.save_locked()
+
+	def rollup(self, hosts:list, at:datetime=None) -> list:
+		if at is None:
+			at = datetime.now()
+		day = at.strftime("%Y-%m-%d")
+		month = at.strftime("%Y-%m")
+		rows = []
+		with self.lock:
+			for host in hosts:
+				he = self.hosts.get(host)
+				if he is None:
+					he = HostEnergy(self.max_gap)
+				rows.append({
+					"host": host,
+					"today (kWh)": round(he.day_wh(day) / 1000, 3),
+					"this month (kWh)": round(he.month_wh(month) / 1000, 3),
+					"total (kWh)": round(he.total_wh / 1000, 3),
+					"gaps": he.gaps,
+					"missing": he.missing,
+				})
+		return rows
+
+	def cluster_rollup(self, hosts:list, at:datetime=None) -> dict:
+		rows = self.rollup(hosts, at)
+		return {
+			"today (kWh)": round(sum(r["today (kWh)"] for r in rows), 3),
+			"this month (kWh)": round(sum(r["this month (kWh)"] for r in rows), 3),
+			"total (kWh)": round(sum(r["total (kWh)"] for r in rows), 3),
+		}
+
+
+def merge_delta(into:dict, delta:dict):
+	for k, v in delta.items():
+		if isinstance(v, dict):
+			for kk, vv in v.items():
+				into.setdefault(k, {})[kk] = into.get(k, {}).get(kk, 0.0) + vv
+		else:
+			into[k] = into.get(k, 0) + v
+
+
+accumulators = {}
+accumulators_lock = threading.Lock()
+
+@atexit.register
+def save_all():
+	# Streamlit stops on SIGTERM and SIGINT by returning, so this runs on those too
+	with accumulators_lock:
+		for a in accumulators.values():
+			a.save()
+
+def get_energy_accumulator(name:str) -> EnergyAccumulator:
+	with accumulators_lock:
+		if not name in accumulators:
+			accumulators[name] = EnergyAccumulator(name)
+		return accumulators[name]
@@ -0,0 +1,160 @@
+#!/usr/bin/env python3
+
+# One overview of every ini cluster for the Dashboard Home. All BMCs of all
+# clusters are queried at the same time, so a sweep takes about as long as
+# the slowest BMC. Clusters with source = collector or shm are read from the
+# reading table instead. The sweep runs in the background and its result is
+# shared by all sessions for max_age seconds; the page shows the last one
+# meanwhile.
+
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+from AnomalyDetector import get_anomaly_detector
+from BMCLiveness import get_liveness
+from ClusterBasePage import ClusterBasePage
+
+max_workers = 256
+default_max_age = 15.0
+collector_stale = 60.0
+
+def sweep_host(cluster:str, d:dict) -> dict:
+	from IPMIManager import IPMIManager
+	ipmiman = IPMIManager(d["ipmi_ip"], d["ipmi_user"], d["ipmi_pass"], d["if_type"])
+	ipmiman.setPowerMethod(d["power_method"])
+	ipmiman.setPowerSensor(d["power_sensor"])
+	r = {"cluster": cluster, "host": d["hostname"], "state": "error", "power": None, "cause": None, "t": time.time()}
+	try:
+		if ipmiman.isPowerOn():
+			r["state"] = "up"
+		elif ipmiman.isError():
+			r["cause"] = ipmiman.getCause()
+			if r["cause"] == "BMC Unreachable":
+				r["state"] = "unreachable"
+			return r
+		else:
+			r["state"] = "down"
+		# the BMC reports standby power while the machine is down
+		power = ipmiman.getCurrentPower()
+	except Exception as e:
+		r["state"] = "error"
+		r["cause"] = type(e).__name__
+		return r
+	if isinstance(power, (int, float)) and not isinstance(power, bool):
+		r["power"] = power
+	r["t"] = time.time()
+	return r
+
+def snapshot_host(cluster:str, source:str, d:dict) -> dict:
+	if source == "shm":
+		from SharedReadings import get_shared_table
+		table = get_shared_table()
+	else:
+		from CollectorAgent import get_reading_table
+		table = get_reading_table()
+	r = {"cluster": cluster, "host": d["hostname"], "state": "error", "power": None, "cause": None, "t": None}
+	reading = table.get(cluster, d["hostname"]) if table else None
+	if reading is None:
+		r["cause"] = "No reading"
+		return r
+	r["t"] = reading["t"]
+	if reading["error"]:
+		r["cause"] = reading["error"]
+	elif time.time() - reading["t"] > collector_stale:
+		r["cause"] = "Stale reading"
+	else:
+		# a reading only tells that the BMC answers, not whether the machine is up
+		r["state"] = "reporting"
+		r["power"] = reading["power"]
+	return r
+
+
+class FleetOverview(object):
+	def __init__(self):
+		self.clusters = []
+		self.hosts = []
+		self.swept_at = None
+		self.seconds = None
+		self.sweeping = False
+		self.lock = threading.Lock()
+
+	def sweep(self):
+		pages = [ClusterBasePage(f) for f in sorted(Path(".").glob("*.ini"))]
+		t0 = time.monotonic()
+		n = sum(len(p.get_hosts_dic()) for p in pages if p.source == "ipmi")
+		get_liveness().ping_stale([d["ipmi_ip"] for p in pages if p.source == "ipmi" for d in p.get_hosts_dic()])
+		with ThreadPoolExecutor(max_workers=max(1, min(max_workers, n))) as executor:
+			futures = []
+			for p in pages:
+				cluster = Path(p.inifile).stem
+				for d in p.get_hosts_dic():
+					if p.source == "ipmi":
+						futures.append(executor.submit(sweep_host, cluster, d))
+					else:
+						futures.append(executor.submit(snapshot_host, cluster, p.source, d))
+			hosts = [f.result() for f in futures]
+		with self.lock:
+			self.clusters = [(Path(p.inifile).stem, p.title_str, p.source) for p in pages]
+			self.hosts = hosts
+			self.seconds = time.monotonic() - t0
+			self.swept_at = time.time()
+
+	def sweep_in_background(self):
+		try:
+			self.sweep()
+		finally:
+			with self.lock:
+				self.sweeping = False
+
+	def get(self, max_age:float=default_max_age, force:bool=False):
+		# starts a sweep when the last one is too old; sessions arriving during it do not start their own
+		with self.lock:
+			if not self.sweeping and (force or self.swept_at is None or time.time() - self.swept_at > max_age):
+				self.sweeping = True
+				threading.Thread(target=self.sweep_in_background, daemon=True).start()
+			return self
+
+	def summary(self) -> list:
+		now = time.time()
+		rows = []
+		with self.lock:
+			clusters = list(self.clusters)
+			all_hosts = list(self.hosts)
+		for cluster, title, source in clusters:
+			hosts = [h for h in all_hosts if h["cluster"] == cluster]
+			states = [h["state"] for h in hosts]
+			timed = [h for h in hosts if h["t"] is not None]
+			stalest = min(timed, key=lambda h: h["t"]) if timed else None
+			rows.append({
+				"Cluster": title,
+				"Source": source,
+				"Hosts": len(hosts),
+				"Up": states.count("up"),
+				"Down": states.count("down"),
+				"Error": states.count("error"),
+				"Unreachable": states.count("unreachable"),
+				"Reporting": states.count("reporting"),
+				"Total power (W)": sum(h["power"] for h in hosts if h["power"] is not None),
+				"Stalest reading (sec.)": round(now - stalest["t"], 1) if stalest else None,
+				"Stalest host": stalest["host"] if stalest else None,
+				"Anomalies": get_anomaly_detector(cluster).count([h["host"] for h in hosts]),
+			})
+		return rows
+
+	def errors(self) -> list:
+		with self.lock:
+			hosts = list(self.hosts)
+		return [{"Cluster": h["cluster"], "Host": h["host"], "Cause": h["cause"]} for h in hosts if h["state"] in ("error", "unreachable")]
+
+
+overview = None
+overview_lock = threading.Lock()
+
+def get_fleet_overview() -> FleetOverview:
+	global overview
+	with overview_lock:
+		if overview is None:
+			overview = FleetOverview()
+		return overview
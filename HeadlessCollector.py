@@ -0,0 +1,230 @@
+#!/usr/bin/env python3
+
+# Headless power collection without a browser:
+#
+#   python HeadlessCollector.py --interval 1 > trace.ndjson
+#   python HeadlessCollector.py --interval 1 --format parquet --output traces/ --rotate 3600
+#   python HeadlessCollector.py --interval 1 --format columnar
+#   python HeadlessCollector.py --interval 1 --format none --shm    (pages with source = shm)
+
+import json
+import signal
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from pathlib import Path
+
+from ClusterBasePage import ClusterBasePage
+from CollectorAgent import poll_clusters
+from ColumnarRecording import ColumnarWriter, recordings_dir
+from SharedReadings import SharedReadingTable, default_name, default_capacity
+
+record_fields = ["time", "cluster", "host", "power", "error"]
+
+def to_records(readings:list) -> list:
+	records = []
+	for cluster, host, t, power, error in readings:
+		records.append({
+			"time": datetime.fromtimestamp(t).isoformat(timespec="milliseconds"),
+			"cluster": cluster, "host": host, "power": power, "error": error})
+	return records
+
+
+class NDJSONSink(object):
+	suffix = ".ndjson"
+
+	def __init__(self, f):
+		self.f = f
+
+	def write(self, records:list):
+		for r in records:
+			self.f.write(json.dumps(r, separators=(",", ":")) + "\n")
+
+	def flush(self):
+		self.f.flush()
+
+	def close(self):
+		self.flush()
+		if self.f is not sys.stdout:
+			self.f.close()
+
+
+class ParquetSink(object):
+	suffix = ".parquet"
+
+	def __init__(self, f):
+		import pyarrow
+		import pyarrow.parquet
+		self.pa = pyarrow
+		self.schema = pyarrow.schema([
+			("time", pyarrow.timestamp("ms")), ("cluster", pyarrow.string()), ("host", pyarrow.string()),
+			("power", pyarrow.float64()), ("error", pyarrow.string())])
+		self.writer = pyarrow.parquet.ParquetWriter(f, self.schema)
+		self.buffer = []
+
+	def write(self, records:list):
+		self.buffer.extend(records)
+
+	def flush(self):
+		# each flush becomes one row group; the footer is written only at close, so a file
+		# becomes readable when it is rotated or the collector stops
+		if not self.buffer:
+			return
+		columns = {k: [r[k] for r in self.buffer] for k in record_fields}
+		columns["time"] = [datetime.fromisoformat(x) for x in columns["time"]]
+		self.writer.write_table(self.pa.table(columns, schema=self.schema))
+		self.buffer = []
+
+	def close(self):
+		self.flush()
+		self.writer.close()
+
+
+class ColumnarSink(object):
+	suffix = ""
+
+	def __init__(self, base:Path):
+		self.base = base
+		self.started = datetime.now()
+		self.writers = {}
+
+	def write(self, records:list):
+		rows = {}
+		for r in records:
+			rows.setdefault(r["cluster"], {})["power:" + r["host"]] = r["power"]
+		for cluster, values in rows.items():
+			values["power:total"] = sum(v for v in values.values() if isinstance(v, (int, float)))
+			if not cluster in self.writers:
+				self.writers[cluster] = ColumnarWriter(self.base / cluster / self.started.strftime("%Y%m%d_%H%M%S"))
+			self.writers[cluster].append_row(datetime.fromisoformat(records[0]["time"]), values)
+
+	def flush(self):
+		for w in self.writers.values():
+			w.flush()
+
+	def close(self):
+		for w in self.writers.values():
+			w.close()
+
+
+class NullSink(object):
+	suffix = ""
+
+	def write(self, records:list):
+		pass
+
+	def flush(self):
+		pass
+
+	def close(self):
+		pass
+
+
+sink_types = {"ndjson": NDJSONSink, "parquet": ParquetSink, "columnar": ColumnarSink, "none": NullSink}
+
+class RotatingOutput(object):
+	def __init__(self, sink_type, output:str|None, rotate:float|None):
+		self.sink_type = sink_type
+		self.output = Path(output) if output else None
+		self.rotate = rotate
+		self.sink = None
+		self.opened_at = None
+
+	def open(self):
+		if self.sink_type is NullSink:
+			self.sink = NullSink()
+		elif self.sink_type is ColumnarSink:
+			# a directory per cluster and file set, readable on the Recordings analysis page
+			self.sink = ColumnarSink(self.output if self.output else recordings_dir)
+		elif self.output is None:
+			if self.sink_type is ParquetSink:
+				self.sink = ParquetSink(sys.stdout.buffer)
+			else:
+				self.sink = NDJSONSink(sys.stdout)
+		else:
+			self.output.mkdir(parents=True, exist_ok=True)
+			fname = self.output / (datetime.now().strftime("power_%Y%m%d_%H%M%S") + self.sink_type.suffix)
+			mode = "wb" if self.sink_type is ParquetSink else "w"
+			self.sink = self.sink_type(open(fname, mode))
+			print(f"writing {fname}", file=sys.stderr)
+		self.opened_at = time.monotonic()
+
+	def write(self, records:list):
+		if self.sink is None:
+			self.open()
+		elif self.output and self.rotate and time.monotonic() - self.opened_at > self.rotate:
+			self.sink.close()
+			self.open()
+		self.sink.write(records)
+
+	def flush(self):
+		if self.sink:
+			self.sink.flush()
+
+	def close(self):
+		if self.sink:
+			self.sink.close()
+		self.sink = None
+
+
+def run(inifiles:list, interval:float, workers:int, out:RotatingOutput, flush_interval:float, count:int|None=None, shared:SharedReadingTable|None=None):
+	pages = [ClusterBasePage(f) for f in inifiles]
+	executor = ThreadPoolExecutor(max_workers=workers)
+	next_at = time.monotonic()
+	flushed_at = time.monotonic()
+	skipped = 0
+	n = 0
+	while count is None or n < count:
+		readings = poll_clusters(pages, executor)
+		if shared:
+			shared.publish(readings)
+		out.write(to_records(readings))
+		n += 1
+		if time.monotonic() - flushed_at >= flush_interval:
+			out.flush()
+			flushed_at = time.monotonic()
+		next_at += interval
+		now = time.monotonic()
+		if now > next_at:
+			# a sweep took longer than the interval: drop the missed ticks instead of bursting
+			missed = int((now - next_at) // interval) + 1
+			skipped += missed
+			next_at += missed * interval
+			print(f"sweep overran the interval, {skipped} ticks skipped so far", file=sys.stderr)
+		time.sleep(max(0.0, next_at - time.monotonic()))
+	executor.shutdown()
+
+def main():
+	import argparse
+	parser = argparse.ArgumentParser(description="Poll every cluster at a fixed rate and stream the power readings.")
+	parser.add_argument("inifiles", nargs="*", help="cluster ini files (default: *.ini)")
+	parser.add_argument("--interval", type=float, default=1.0, help="polling interval in seconds")
+	parser.add_argument("--workers", type=int, default=32, help="number of BMCs polled at the same time")
+	parser.add_argument("--format", choices=list(sink_types), default="ndjson")
+	parser.add_argument("--output", help="directory for rotating files (default: stdout)")
+	parser.add_argument("--rotate", type=float, default=3600.0, help="seconds per output file")
+	parser.add_argument("--flush", type=float, default=10.0, help="seconds between flushes")
+	parser.add_argument("--count", type=int, help="stop after this many sweeps")
+	parser.add_argument("--shm", nargs="?", const=default_name, help=f"also publish the latest readings in shared memory (default name: {default_name})")
+	parser.add_argument("--capacity", type=int, default=default_capacity, help="hosts in the shared memory table")
+	args = parser.parse_args()
+
+	inifiles = args.inifiles if args.inifiles else sorted(Path(".").glob("*.ini"))
+	try:
+		shared = SharedReadingTable.create(args.shm, args.capacity, args.interval) if args.shm else None
+	except FileExistsError as e:
+		sys.exit(str(e))
+	out = RotatingOutput(sink_types[args.format], args.output, args.rotate)
+	signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+	try:
+		run(inifiles, args.interval, args.workers, out, args.flush, args.count, shared)
+	except KeyboardInterrupt:
+		pass
+	finally:
+		out.close()
+		if shared:
+			shared.close()
+
+if __name__=="__main__":
+	main()
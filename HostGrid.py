@@ -0,0 +1,68 @@
+#!/usr/bin/env python3
+
+import hashlib
+import math
+
+import pandas as pd
+import streamlit as st
+
+class HostGrid(object):
+	def __init__(self, page, sort_keys:dict):
+		self.page = page
+		self.sort_keys = sort_keys
+		self.key_prefix = page.get_urlpath() + "-grid"
+
+	def render_controls(self) -> list:
+		hosts = self.page.get_hosts_dic()
+		with st.container(horizontal=True, vertical_alignment="bottom", horizontal_alignment="left"):
+			pattern = st.text_input("Filter", key=f"{self.key_prefix}-filter", placeholder="host name or note")
+			sort_by = st.selectbox("Sort by", list(self.sort_keys), key=f"{self.key_prefix}-sort")
+			descending = st.toggle("Descending", key=f"{self.key_prefix}-desc")
+			page_size = st.selectbox("Rows", [25, 50, 100, 250], key=f"{self.key_prefix}-rows")
+
+			if pattern:
+				p = pattern.lower()
+				hosts = [d for d in hosts if p in d["hostname"].lower() or p in (d["note"] or "").lower()]
+			hosts = sorted(hosts, key=self.sort_keys[sort_by], reverse=descending)
+
+			n_pages = max(1, math.ceil(len(hosts) / page_size))
+			page_no = st.number_input("Page", min_value=1, max_value=n_pages, value=1, step=1, key=f"{self.key_prefix}-page")
+			st.caption(f"{len(hosts)} hosts / {n_pages} pages")
+		start = (min(page_no, n_pages) - 1) * page_size
+		return hosts[start:start + page_size]
+
+	def render_editor(self, visible:list, check_label:str, checked) -> dict:
+		# the editor keeps its edits by row position, so it gets a new key whenever other hosts
+		# sit in its rows, and the checks live per host in the session state
+		tag = f"{self.key_prefix}-{check_label}-checked"
+		if not tag in st.session_state:
+			st.session_state[tag] = {}
+		state = st.session_state[tag]
+		# clicks made in the previous editor are mapped to hosts by the rows it showed
+		shown = st.session_state.get(f"{tag}-rows")
+		if shown and shown[0] in st.session_state:
+			for row, change in st.session_state[shown[0]].get("edited_rows", {}).items():
+				if check_label in change and int(row) < len(shown[1]):
+					state[shown[1][int(row)]] = bool(change[check_label])
+		hosts = [d["hostname"] for d in visible]
+		rows_id = hashlib.md5("\n".join(hosts).encode("utf-8")).hexdigest()[:12]
+		key = f"{self.key_prefix}-editor-{rows_id}"
+		st.session_state[f"{tag}-rows"] = (key, hosts)
+		df = pd.DataFrame({
+			check_label: [bool(state.get(d["hostname"], checked(d["hostname"]))) for d in visible],
+			"Host": [d["hostname"] for d in visible],
+			"Note": [d["note"] or "" for d in visible],
+		})
+		edited = st.data_editor(
+			df, key=key, hide_index=True, width="stretch",
+			disabled=["Host", "Note"], column_config={check_label: st.column_config.CheckboxColumn(width="small")})
+		result = {host: bool(v) for host, v in zip(edited["Host"], edited[check_label])}
+		state.update(result)
+		return result
+
+
+def power_sort_key(value):
+	# hosts without a numeric reading are sorted after all readings
+	if isinstance(value, bool) or not isinstance(value, (int, float)):
+		return (1, 0.0)
+	return (0, value)
@@ -2,11 +2,18 @@
 
 import pyipmi
 import pyipmi.interfaces
+import pyipmi.sel
 
 import subprocess
+import threading
+import time
 
 from datetime import datetime
 
+from SDRCache import get_sdr_cache
+from BMCLiveness import get_liveness
+from PowerBackends import power_backends, register_power_backend, get_power_backend_cache
+
 
 def ipmi_command_output(ip, user, passwd, iftype, command_arg_list):
 	command_list = ["ipmitool", "-I", iftype, "-H", ip, "-U", user, "-P", passwd] + command_arg_list
@@ -23,6 +30,26 @@ def bravo_extract_power(ip, user, passwd, iftype):
 			power_val = power_watt[0]
 			return int(power_val)
 
+def dcmi_period_seconds(attribute):
+	# DCMI enhanced power statistics encode the averaging period in one byte:
+	# bits 7:6 select the unit (sec., min., hour, day), bits 5:0 hold the value.
+	return (attribute & 0x3f) * [1, 60, 3600, 86400][attribute >> 6]
+
+
+# the rolling average periods each BMC supports, read once per IP for the process since an
+# IPMIManager is made per poll, and the (ip, period attribute) pairs a BMC rejected anyway
+statistics_periods = {}
+no_enhanced_statistics = set()
+statistics_periods_lock = threading.Lock()
+
+class BMCUnreachable(pyipmi.errors.IpmiConnectionError):
+	pass
+
+def connection_error_cause(e):
+	if isinstance(e, BMCUnreachable):
+		return "BMC Unreachable"
+	return "IPMI Connection Error"
+
 
 class IPMIManager(object):
 
@@ -38,14 +65,26 @@ class IPMIManager(object):
 		self.error = False
 		self.cause = None
 		self.power_method = "dcmi"
+		self.power_sensor = "Total_Power"
+		self.statistics_period = None
 
 	def setPowerMethod(self, s):
 		self.power_method = s
 
+	def setPowerSensor(self, s):
+		self.power_sensor = s
+
+	def setStatisticsPeriod(self, seconds):
+		self.statistics_period = seconds
+
 	def connect(self):
 		if self.connection:
 			return
-		
+
+		# a session to a BMC that does not answer a presence ping would only run into the timeout
+		if not get_liveness().allow(self.ip):
+			raise BMCUnreachable(f"{self.ip} does not answer the RMCP presence ping")
+
 		# Supported interface_types for ipmitool are: 'lan' , 'lanplus', and 'serial-terminal'
 		self.interface = pyipmi.interfaces.create_interface('ipmitool', interface_type=self.iftype)
 		self.connection = pyipmi.create_connection(self.interface)
@@ -64,33 +103,44 @@ class IPMIManager(object):
 		return status
 	
 	def isPowerOn(self):
-		self.connect()
 		try:
 			status = self.getChassisStatus()
-			self.error = False
-			self.cause = None
+			self.setSucceeded()
 		except pyipmi.errors.IpmiConnectionError as e:
-			self.error = True
-			self.cause = "IPMI Connection Error"
+			self.setConnectionError(e)
 			return False
 		return status.power_on
 
 	def isError(self):
 		return self.error
 
+	def setSucceeded(self):
+		self.error = False
+		self.cause = None
+		get_liveness().record_success(self.ip)
+
+	def setConnectionError(self, e):
+		self.error = True
+		self.cause = connection_error_cause(e)
+		if not isinstance(e, BMCUnreachable):
+			get_liveness().record_failure(self.ip)
+
+	def setCompletionCodeError(self, e):
+		# the command failed, but the BMC answered
+		self.error = True
+		self.cause = "Completion Code Error"
+		get_liveness().record_success(self.ip)
+
 	def getCause(self):
 		return self.cause
 
 	def isPowerOnStatus(self):
-		self.connect()
 		try:
 			status = self.getChassisStatus()
-			self.error = False
-			self.cause = None
+			self.setSucceeded()
 		except pyipmi.errors.IpmiConnectionError as e:
-			self.error = True
-			self.cause = "IPMI Connection Error"
-			return f"IPMI Connection Error"
+			self.setConnectionError(e)
+			return self.cause
 		return "Up" if status.power_on else "Down"
 	
 	def powerDown(self):
@@ -110,7 +160,6 @@ class IPMIManager(object):
 		return self.connection.chassis_control_soft_shutdown()
 
 	def getDcmiPowerRead(self):
-		self.connect()
 		update_dcmi_power = False
 		if not self.dcmi_requested_at:
 			update_dcmi_power = True
@@ -121,16 +170,14 @@ class IPMIManager(object):
 		if not update_dcmi_power:
 			return
 		try:
-			self.dcmi_power_reading_rsp = self.connection.get_power_reading(mode=1)
-			self.error = False
-			self.cause = None
+			self.connect()
+			self.dcmi_power_reading_rsp = self.readDcmiPowerStatistics()
+			self.setSucceeded()
 		except pyipmi.errors.CompletionCodeError as e:
-			self.error = True
-			self.cause = "Completion Code Error"
+			self.setCompletionCodeError(e)
 			return
 		except pyipmi.errors.IpmiConnectionError as e:
-			self.error = True
-			self.cause = "IPMI Connection Error"
+			self.setConnectionError(e)
 			return
 		except ValueError as e:
 			self.error = True
@@ -138,15 +185,209 @@ class IPMIManager(object):
 			return
 		self.dcmi_requested_at = datetime.now()
 
-	def getCurrentPower(self):
-		if self.power_method == "dcmi":
-			self.getDcmiPowerRead()
-			if not self.dcmi_power_reading_rsp:
+	def getStatisticsPeriods(self):
+		# attributes of the rolling average periods of the enhanced power statistics
+		with statistics_periods_lock:
+			if self.ip in statistics_periods:
+				return statistics_periods[self.ip]
+		try:
+			data = bytes(self.connection.get_dcmi_capabilities(5).parameter_data)
+			periods = list(data[1:1 + data[0]]) if data else []
+		except pyipmi.errors.CompletionCodeError:
+			# enhanced statistics are optional in DCMI
+			periods = []
+		with statistics_periods_lock:
+			statistics_periods[self.ip] = periods
+		return periods
+
+	def readDcmiPowerStatistics(self):
+		if self.statistics_period:
+			with statistics_periods_lock:
+				rejected = set(a for ip, a in no_enhanced_statistics if ip == self.ip)
+			periods = [a for a in self.getStatisticsPeriods() if not a in rejected and dcmi_period_seconds(a) > 0]
+			if periods:
+				# the supported period nearest to the window
+				attribute = min(periods, key=lambda a: abs(dcmi_period_seconds(a) - self.statistics_period))
+				try:
+					return self.connection.get_power_reading(mode=2, attributes=attribute)
+				except pyipmi.errors.CompletionCodeError:
+					with statistics_periods_lock:
+						no_enhanced_statistics.add((self.ip, attribute))
+		return self.connection.get_power_reading(mode=1)
+
+	def getPowerStatistics(self):
+		self.getDcmiPowerRead()
+		if not self.dcmi_power_reading_rsp:
+			return None
+		rsp = self.dcmi_power_reading_rsp
+		return {
+			"current": rsp.current_power,
+			"average": rsp.average_power,
+			"minimum": rsp.minimum_power,
+			"maximum": rsp.maximum_power,
+			"period": rsp.period,
+		}
+
+	def getSdrCache(self):
+		self.connect()
+		cache = get_sdr_cache(self.ip)
+		cache.refresh(self.connection)
+		return cache
+
+	def readSensor(self, record):
+		raw, states = self.connection.get_sensor_reading(record.number, record.owner_lun)
+		if raw is None:
+			return None
+		try:
+			return record.convert_sensor_raw_to_value(raw)
+		except (AttributeError, TypeError, ValueError):
+			# a record without usable conversion factors
+			return None
+
+	def getSensorValue(self, name):
+		try:
+			record = self.getSdrCache().find(name)
+			if record is None:
+				self.error = True
+				self.cause = f"No sensor {name}"
 				return None
-			return self.dcmi_power_reading_rsp.current_power
-		if self.power_method == "bravo":
-			return bravo_extract_power(self.ip, self.user, self.passwd, self.iftype)
-		return "No power method available"
+			value = self.readSensor(record)
+			self.setSucceeded()
+		except pyipmi.errors.CompletionCodeError as e:
+			self.setCompletionCodeError(e)
+			return None
+		except pyipmi.errors.IpmiConnectionError as e:
+			self.setConnectionError(e)
+			return None
+		return value
+
+	def getSensorValues(self, sensor_type_code):
+		values = {}
+		try:
+			for record in self.getSdrCache().of_type(sensor_type_code):
+				values[record.device_id_string.strip()] = self.readSensor(record)
+			self.setSucceeded()
+		except pyipmi.errors.CompletionCodeError as e:
+			self.setCompletionCodeError(e)
+		except pyipmi.errors.IpmiConnectionError as e:
+			self.setConnectionError(e)
+		return values
+
+	def getSelInfo(self):
+		self.connect()
+		return pyipmi.sel.SelInfo(self.connection.send_message_with_name("GetSelInfo"))
+
+	def getSelReservation(self):
+		self.connect()
+		return self.connection.get_sel_reservation_id()
+
+	def getSelEntry(self, record_id, reservation):
+		self.connect()
+		return self.connection.get_sel_entry(record_id, reservation)
+
+	def setPowerLimit(self, watts, correction_time_limit=6000, statistics_sampling_period=1):
+		# DCMI Set Power Limit; the BMC enforces it after activatePowerLimit()
+		return self.dcmiPowerLimitCommand(lambda: self.connection.set_power_limit(
+			int(watts), correction_time_limit, statistics_sampling_period))
+
+	def activatePowerLimit(self):
+		return self.dcmiPowerLimitCommand(lambda: self.connection.activate_power_limit())
+
+	def deactivatePowerLimit(self):
+		return self.dcmiPowerLimitCommand(lambda: self.connection.deactivate_power_limit())
+
+	def getPowerLimit(self):
+		# watts of the active power limit, None when there is none or on an error
+		try:
+			self.connect()
+			rsp = self.connection.get_power_limit()
+			self.setSucceeded()
+		except pyipmi.errors.CompletionCodeError as e:
+			if e.cc == 0x80:
+				self.setSucceeded()
+			else:
+				self.setCompletionCodeError(e)
+			return None
+		except pyipmi.errors.IpmiConnectionError as e:
+			self.setConnectionError(e)
+			return None
+		return rsp.power_limit
+
+	def dcmiPowerLimitCommand(self, command):
+		try:
+			self.connect()
+			command()
+			self.setSucceeded()
+		except pyipmi.errors.CompletionCodeError as e:
+			self.setCompletionCodeError(e)
+			return False
+		except pyipmi.errors.IpmiConnectionError as e:
+			self.setConnectionError(e)
+			return False
+		return True
+
+	def getPowerMethod(self):
+		# the backend that power_method = auto resolves to, None until probed
+		if self.power_method == "auto":
+			return get_power_backend_cache().cached(self.ip)
+		return self.power_method
+
+	def getCurrentPower(self):
+		if self.power_method != "auto":
+			if not self.power_method in power_backends:
+				return "No power method available"
+			return power_backends[self.power_method](self)
+		cache = get_power_backend_cache()
+		entry = cache.lookup(self.ip)
+		if entry is None:
+			# sessions reading the same host wait for one probe
+			with cache.probe_lock(self.ip):
+				entry = cache.lookup(self.ip)
+				if entry is None:
+					return self.probePowerBackends()
+		if entry["backend"] is None:
+			self.error = True
+			self.cause = "No power method available"
+			return None
+		power = power_backends[entry["backend"]](self)
+		if power is not None:
+			cache.read_succeeded(self.ip)
+		elif not self.cause in ("IPMI Connection Error", "BMC Unreachable"):
+			cache.read_failed(self.ip)
+		return power
+
+	def probePowerBackends(self):
+		# tries every backend, keeps the fastest one that reads a power and returns that power
+		try:
+			self.connect()
+		except pyipmi.errors.IpmiConnectionError as e:
+			self.setConnectionError(e)
+			return None
+		seconds = {}
+		readings = {}
+		for name, backend in power_backends.items():
+			self.dcmi_power_reading_rsp = None
+			self.error = False
+			self.cause = None
+			t0 = time.perf_counter()
+			try:
+				power = backend(self)
+			except Exception:
+				power = None
+			seconds[name] = round(time.perf_counter() - t0, 4)
+			if self.error or not isinstance(power, (int, float)) or isinstance(power, bool) or power <= 0:
+				seconds[name] = None
+				continue
+			readings[name] = power
+		best = min(readings, key=lambda name: seconds[name]) if readings else None
+		get_power_backend_cache().store(self.ip, best, seconds)
+		if best is None:
+			self.error = True
+			self.cause = "No power method available"
+			return None
+		self.error = False
+		self.cause = None
+		return readings[best]
 	
 	def getAveragePower(self):
 		self.getDcmiPowerRead()
@@ -164,7 +405,7 @@ class IPMIManager(object):
 		self.getDcmiPowerRead()
 		if not self.dcmi_power_reading_rsp:
 			return None
-		return self.dcmi_power_reading_rsp.minimum_power
+		return self.dcmi_power_reading_rsp.maximum_power
 
 	def getPowerPeriod(self):
 		self.getDcmiPowerRead()
@@ -173,6 +414,31 @@ class IPMIManager(object):
 		return self.dcmi_power_reading_rsp.period
 
 
+def read_dcmi_power(ipmiman):
+	ipmiman.getDcmiPowerRead()
+	if not ipmiman.dcmi_power_reading_rsp:
+		return None
+	return ipmiman.dcmi_power_reading_rsp.current_power
+
+def read_sdr_power(ipmiman):
+	power = ipmiman.getSensorValue(ipmiman.power_sensor)
+	return round(power) if power is not None else None
+
+def read_bravo_power(ipmiman):
+	power = ipmiman.getSensorValue("Total_Power")
+	if power is None and ipmiman.cause == "BMC Unreachable":
+		return None
+	if power is None:
+		ipmiman.error = False
+		ipmiman.cause = None
+		return bravo_extract_power(ipmiman.ip, ipmiman.user, ipmiman.passwd, ipmiman.iftype)
+	return round(power)
+
+register_power_backend("dcmi", read_dcmi_power)
+register_power_backend("sdr", read_sdr_power)
+register_power_backend("bravo", read_bravo_power)
+
+
 from pathlib import Path
 import configparser
 
@@ -205,10 +471,11 @@ def test():
 		iftype = host["if_type"]
 
 		ipmiman = IPMIManager(ipmi_ip, user, passwd, iftype)
+		ipmiman.setPowerMethod(host.get("power_method", "dcmi"))
 		cur_power = ipmiman.getCurrentPower()
 		power_str = f"{cur_power:4}" if type(cur_power) == int else " n/a"
 		print(f"cur: {power_str} W ({name})")
-		sum_current_power += ipmiman.getCurrentPower() if ipmiman.getCurrentPower() else 0
+		sum_current_power += cur_power if type(cur_power) == int else 0
 
 	print(f"Total current power: {sum_current_power} W")
 
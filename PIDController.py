@@ -3,17 +3,20 @@
 from streamlit import session_state as ss
 
 class PIDController(object):
-	def __init__(self, kp:float, ki:float, kd:float, hist_limit=10):
+	def __init__(self, kp:float, ki:float, kd:float, hist_limit=10, store=None):
 		self.kp = kp
 		self.ki = ki
 		self.kd = kd
 
+		# store keeps the error history between reruns: the session state, a
+		# SessionStateInterface or a dict
+		self.store = ss if store is None else store
 		self.error_hist_tag = "PIDCorrector_error_hist"
-		if not "PIDCorrector_error_hist" in ss:
-			ss[self.error_hist_tag] = []
-		self.error_hist = ss[self.error_hist_tag]
-		self.hist = []
+		if not self.error_hist_tag in self.store:
+			self.store[self.error_hist_tag] = []
+		self.error_hist = self.store[self.error_hist_tag]
 		self.hist_limit = hist_limit
+		self.filter_outliers()
 
 	def put_data(self, goal:float, current:float) -> float:
 		error = goal - current
@@ -31,8 +34,10 @@ class PIDController(object):
 		if len(self.error_hist) > self.hist_limit:
 			diff = len(self.error_hist) - self.hist_limit
 			self.error_hist = self.error_hist[diff:]
-		ss[self.error_hist_tag] = self.error_hist
+		self.store[self.error_hist_tag] = self.error_hist
+		self.filter_outliers()
 
+	def filter_outliers(self):
 		self.hist_no_out = set(self.remove_outliers())
 		self.outliers = set(self.error_hist) - set(self.hist_no_out)
 		self.hist = []
@@ -69,5 +74,6 @@ class PIDController(object):
 		return sum(self.hist)
 
 	def clear(self):
-		ss[self.error_hist_tag] = []
-		ss.error_hist = ss[self.error_hist_tag]
+		self.store[self.error_hist_tag] = []
+		self.error_hist = self.store[self.error_hist_tag]
+		self.hist = []
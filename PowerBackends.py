@@ -0,0 +1,115 @@
+#!/usr/bin/env python3
+
+# Registry of the ways to read the power of a host, and which one each BMC
+# uses with power_method = auto. A backend is a function of an IPMIManager that
+# returns watts or None and leaves the cause in the IPMIManager on failure.
+# IPMIManager registers dcmi, sdr and bravo; an OEM command is added with
+# register_power_backend("name", func).
+#
+# The first time a BMC is read with auto, every backend is tried and timed and
+# the fastest one that returns a reading is kept in power_backends.json, so
+# later reads and restarts go straight to it. A BMC is probed again after
+# probe_ttl seconds or when its backend fails forget_after reads in a row; one
+# completion code error is not enough.
+#
+# Hosts read with dcmi unless their ini section sets power_method.
+
+import json
+import threading
+import time
+from pathlib import Path
+
+backends_file = Path("./power_backends.json")
+probe_ttl = 7 * 86400.0
+# a BMC without a working backend is probed again sooner
+failed_probe_ttl = 600.0
+forget_after = 3
+
+power_backends = {}
+
+def register_power_backend(name:str, func):
+	power_backends[name] = func
+
+
+class PowerBackendCache(object):
+	def __init__(self, fname:Path=backends_file):
+		self.fname = fname
+		self.bmcs = {}
+		self.probe_locks = {}
+		self.failures = {}
+		self.lock = threading.Lock()
+		self.load()
+
+	def load(self):
+		if not self.fname.exists():
+			return
+		try:
+			with open(self.fname) as f:
+				self.bmcs = json.load(f)
+		except (OSError, ValueError):
+			self.bmcs = {}
+
+	def save_locked(self):
+		tmp = self.fname.with_suffix(".tmp")
+		with open(tmp, "w") as f:
+			json.dump(self.bmcs, f, indent=1)
+		tmp.replace(self.fname)
+
+	def lookup(self, ip:str) -> dict|None:
+		with self.lock:
+			d = self.bmcs.get(ip)
+		if d is None:
+			return None
+		if d["backend"] is None:
+			return d if time.time() - d["probed_at"] <= failed_probe_ttl else None
+		if not d["backend"] in power_backends or time.time() - d["probed_at"] > probe_ttl:
+			return None
+		return d
+
+	def cached(self, ip:str) -> str|None:
+		d = self.lookup(ip)
+		return d["backend"] if d else None
+
+	def probe_lock(self, ip:str) -> threading.Lock:
+		with self.lock:
+			if not ip in self.probe_locks:
+				self.probe_locks[ip] = threading.Lock()
+			return self.probe_locks[ip]
+
+	def store(self, ip:str, backend:str|None, seconds:dict):
+		with self.lock:
+			self.bmcs[ip] = {"backend": backend, "probed_at": time.time(), "seconds": seconds}
+			self.save_locked()
+
+	def forget(self, ip:str):
+		with self.lock:
+			self.failures.pop(ip, None)
+			if self.bmcs.pop(ip, None) is not None:
+				self.save_locked()
+
+	def read_failed(self, ip:str):
+		# the BMC answers but not with its backend
+		with self.lock:
+			self.failures[ip] = self.failures.get(ip, 0) + 1
+			if self.failures[ip] < forget_after:
+				return
+		self.forget(ip)
+
+	def read_succeeded(self, ip:str):
+		with self.lock:
+			self.failures.pop(ip, None)
+
+	def rows(self) -> list:
+		with self.lock:
+			return [{"BMC": ip, "Backend": d["backend"], **{k: v for k, v in d["seconds"].items()}} for ip, d in self.bmcs.items()]
+
+
+cache = None
+cache_lock = threading.Lock()
+
+def get_power_backend_cache() -> PowerBackendCache:
+	global cache
+	with cache_lock:
+		if cache is None:
+			cache = PowerBackendCache()
+		return cache
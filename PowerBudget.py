@@ -0,0 +1,301 @@
+#!/usr/bin/env python3
+
+# Power capping of a cluster with DCMI power limits. Given the power_budget of
+# an ini file, each tick takes the power of every host, shares the budget out
+# in proportion to the readings on top of each host's power_floor, and writes
+# the limits that moved by min_limit_change watts or more. Disabled hosts get
+# no limit, but their power counts against the budget. A proportional-integral
+# correction trims the shared budget while the measured total is above it,
+# since BMCs enforce their limits only approximately.
+#
+#   python PowerBudget.py cluster.ini --interval 5
+#   python PowerBudget.py cluster.ini --release    (deactivate the limits)
+#
+# The watt page of a cluster with power_budget drives the same controller with
+# its own readings while "Enforce power budget" is on. The hosts the page does
+# not read, the disabled ones mostly, are read in the background, and a tick
+# uses their last reading up to max_reading_age seconds old. Limits are adjusted only
+# while a watt page or this script ticks; otherwise the BMCs keep enforcing the
+# last ones. The activated limits are kept in power_limits.json, so a restart
+# still knows which hosts to release.
+
+import json
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+import numpy
+
+from ClusterBasePage import ClusterBasePage
+from IPMIManager import IPMIManager
+from StatusEvents import is_number
+
+limits_file = Path("./power_limits.json")
+default_power_floor = 100.0
+min_limit_change = 5.0
+min_tick_interval = 5.0
+max_reading_age = 60.0
+# proportional and integral gain of the correction
+budget_gains = (0.5, 0.1)
+max_workers = 64
+
+def allocate(demand:numpy.ndarray, floors:numpy.ndarray, budget:float) -> numpy.ndarray:
+	# floors first, then the rest of the budget in proportion to the demand
+	spare = budget - floors.sum()
+	if spare <= 0:
+		return floors.copy()
+	weights = numpy.maximum(demand, floors)
+	return floors + spare * weights / weights.sum()
+
+def host_ipmiman(d:dict) -> IPMIManager:
+	ipmiman = IPMIManager(d["ipmi_ip"], d["ipmi_user"], d["ipmi_pass"], d["if_type"])
+	ipmiman.setPowerMethod(d["power_method"])
+	ipmiman.setPowerSensor(d["power_sensor"])
+	return ipmiman
+
+def read_power(hostdics:list) -> dict:
+	def read(d):
+		ipmiman = host_ipmiman(d)
+		power = ipmiman.getCurrentPower()
+		return d["hostname"], power if is_number(power) and not ipmiman.isError() else None
+	if not hostdics:
+		return {}
+	with ThreadPoolExecutor(max_workers=min(max_workers, len(hostdics))) as executor:
+		return dict(executor.map(read, hostdics))
+
+
+limits_file_lock = threading.Lock()
+
+def load_limits(name:str) -> dict:
+	with limits_file_lock:
+		if not limits_file.exists():
+			return {}
+		try:
+			with open(limits_file) as f:
+				return json.load(f).get(name, {})
+		except (OSError, ValueError):
+			return {}
+
+def save_limits(name:str, limits:dict):
+	with limits_file_lock:
+		saved = {}
+		if limits_file.exists():
+			try:
+				with open(limits_file) as f:
+					saved = json.load(f)
+			except (OSError, ValueError):
+				saved = {}
+		saved[name] = limits
+		tmp = limits_file.with_suffix(".tmp")
+		with open(tmp, "w") as f:
+			json.dump(saved, f, indent=1)
+		tmp.replace(limits_file)
+
+
+class PowerBudgetController(object):
+	def __init__(self, name:str):
+		self.name = name
+		# {host: watts} of the limits this controller activated
+		self.limits = load_limits(name)
+		# limits left active by an earlier run are enforced until released
+		self.enabled = bool(self.limits)
+		self.integral = 0.0
+		self.ticked_at = None
+		self.rows = []
+		self.summary = {}
+		self.lock = threading.Lock()
+		# {host: (monotonic time, watts)} of the background reads
+		self.readings = {}
+		self.reading = False
+		self.readings_lock = threading.Lock()
+
+	def correction(self, budget:float, measured:float) -> float:
+		# never above 0, and the integral neither builds up under budget nor beyond the budget
+		error = budget - measured
+		kp, ki = budget_gains
+		self.integral = min(0.0, max(self.integral + error, -budget / ki))
+		return max(-budget, min(0.0, kp * error + ki * self.integral))
+
+	def read_in_background(self, hostdics:list):
+		# one read at a time, so BMCs that time out do not pile up threads
+		with self.readings_lock:
+			if self.reading or not hostdics:
+				return
+			self.reading = True
+		def run():
+			try:
+				readings = read_power(hostdics)
+				now = time.monotonic()
+				with self.readings_lock:
+					self.readings.update({h: (now, w) for h, w in readings.items() if w is not None})
+			finally:
+				with self.readings_lock:
+					self.reading = False
+		threading.Thread(target=run, daemon=True).start()
+
+	def recent_readings(self, hosts:list) -> dict:
+		now = time.monotonic()
+		with self.readings_lock:
+			return {h: self.readings[h][1] for h in hosts if h in self.readings and now - self.readings[h][0] <= max_reading_age}
+
+	def tick(self, hostdics:list, budget:float, readings:dict|None=None, force:bool=False) -> dict:
+		# readings are {host: watts or None} the caller already has; the other hosts get their last background
+		# reading. Without readings every host is read here. Sessions calling in between ticks, or while
+		# another one ticks, get the last result.
+		if not force and self.ticked_at is not None and time.monotonic() - self.ticked_at < min_tick_interval:
+			return self.summary
+		if not self.lock.acquire(blocking=False):
+			return self.summary
+		try:
+			self.ticked_at = time.monotonic()
+			if readings is None:
+				readings = read_power(hostdics)
+			else:
+				readings = dict(readings)
+				missing = [d for d in hostdics if not d["hostname"] in readings]
+				readings.update(self.recent_readings([d["hostname"] for d in missing]))
+				self.read_in_background(missing)
+			other = [d for d in hostdics if d["disabled"]]
+			hostdics = [d for d in hostdics if not d["disabled"]]
+			if not hostdics:
+				return self.summary
+
+			hosts = [d["hostname"] for d in hostdics]
+			powers = numpy.array([float(readings[h]) if is_number(readings.get(h)) else numpy.nan for h in hosts])
+			floors = numpy.array([default_power_floor if d["power_floor"] is None else d["power_floor"] for d in hostdics])
+			previous = numpy.array([self.limits.get(h, numpy.nan) for h in hosts])
+			readable = numpy.isfinite(powers)
+
+			unlimited = sum(float(readings[d["hostname"]]) for d in other if is_number(readings.get(d["hostname"])))
+			measured = float(powers[readable].sum()) + unlimited
+			target = budget + self.correction(budget, measured)
+
+			# a host without a reading keeps its share at its current limit
+			demand = numpy.where(readable, powers, numpy.where(numpy.isfinite(previous), previous, floors))
+			limits = numpy.rint(allocate(demand, floors, target - unlimited))
+			changed = readable & ~(numpy.abs(limits - previous) < min_limit_change)
+
+			def write(i):
+				d = hostdics[i]
+				ipmiman = host_ipmiman(d)
+				if not ipmiman.setPowerLimit(limits[i]):
+					return i, ipmiman.getCause()
+				if not d["hostname"] in self.limits and not ipmiman.activatePowerLimit():
+					return i, ipmiman.getCause()
+				return i, None
+			writes = numpy.nonzero(changed)[0]
+			errors = {}
+			if len(writes):
+				with ThreadPoolExecutor(max_workers=min(max_workers, len(writes))) as executor:
+					for i, cause in executor.map(write, writes):
+						if cause:
+							errors[hosts[i]] = cause
+						else:
+							self.limits[hosts[i]] = float(limits[i])
+				save_limits(self.name, self.limits)
+
+			self.rows = [{
+				"host": h,
+				"power (W)": None if numpy.isnan(powers[i]) else float(powers[i]),
+				"floor (W)": float(floors[i]),
+				"limit (W)": self.limits.get(h),
+				"written": bool(changed[i]) and not h in errors,
+				"error": errors.get(h),
+			} for i, h in enumerate(hosts)]
+			self.summary = {
+				"budget": budget,
+				"target": round(target, 1),
+				"measured": measured,
+				"unlimited": unlimited,
+				"unread": int((~readable).sum()),
+				"unlimited unread": sum(1 for d in other if not is_number(readings.get(d["hostname"]))),
+				"written": len(writes) - len(errors),
+				"floors over budget": bool(floors.sum() + unlimited > budget),
+				"at": time.time(),
+			}
+			return self.summary
+		finally:
+			self.lock.release()
+
+	def release(self, hostdics:list, every:bool=False) -> int:
+		# deactivates the limits this controller activated, also those of an earlier run, or those of every host
+		with self.lock:
+			def deactivate(d):
+				return d["hostname"], host_ipmiman(d).deactivatePowerLimit()
+			hostdics = [d for d in hostdics if every or d["hostname"] in self.limits]
+			released = 0
+			if hostdics:
+				with ThreadPoolExecutor(max_workers=min(max_workers, len(hostdics))) as executor:
+					for host, ok in executor.map(deactivate, hostdics):
+						if ok:
+							self.limits.pop(host, None)
+							released += 1
+				save_limits(self.name, self.limits)
+			self.integral = 0.0
+			self.ticked_at = None
+			self.summary = {}
+			self.rows = []
+			return released
+
+	def bmc_limits(self, hostdics:list) -> list:
+		# what the BMCs enforce, which may differ from what this controller wrote
+		def get(d):
+			ipmiman = host_ipmiman(d)
+			watts = ipmiman.getPowerLimit()
+			state = ipmiman.getCause() if ipmiman.isError() else ("active" if watts is not None else "not active")
+			return {"host": d["hostname"], "BMC limit (W)": watts, "state": state, "written (W)": self.limits.get(d["hostname"])}
+		if not hostdics:
+			return []
+		with ThreadPoolExecutor(max_workers=min(max_workers, len(hostdics))) as executor:
+			return list(executor.map(get, hostdics))
+
+	def table(self) -> list:
+		with self.lock:
+			return list(self.rows)
+
+
+controllers = {}
+controllers_lock = threading.Lock()
+
+def get_power_budget_controller(name:str) -> PowerBudgetController:
+	with controllers_lock:
+		if not name in controllers:
+			controllers[name] = PowerBudgetController(name)
+		return controllers[name]
+
+def main():
+	import argparse
+	parser = argparse.ArgumentParser(description="Keep a cluster under its power_budget with DCMI power limits.")
+	parser.add_argument("inifile", help="cluster ini file with power_budget in [Page]")
+	parser.add_argument("--interval", type=float, default=min_tick_interval, help="seconds between ticks")
+	parser.add_argument("--budget", type=float, help="watts, instead of power_budget of the ini file")
+	parser.add_argument("--count", type=int, help="stop after this many ticks")
+	parser.add_argument("--release", action="store_true", help="deactivate the power limits of every host and exit")
+	args = parser.parse_args()
+
+	page = ClusterBasePage(args.inifile)
+	controller = get_power_budget_controller(Path(args.inifile).stem)
+	if args.release:
+		print(f"{controller.release(page.get_hosts_dic(), every=True)} hosts released")
+		return
+	budget = args.budget if args.budget is not None else page.power_budget
+	if budget is None:
+		sys.exit(f"{args.inifile} has no power_budget in [Page]; give --budget")
+
+	n = 0
+	try:
+		while args.count is None or n < args.count:
+			s = controller.tick(page.get_hosts_dic(), budget, force=True)
+			if not s:
+				sys.exit(f"{args.inifile} has no enabled hosts")
+			print(f"{time.strftime('%H:%M:%S')} measured {s['measured']:.0f} W / budget {s['budget']:.0f} W (target {s['target']:.0f} W), "
+				f"{s['written']} limits written, {s['unread']} hosts unread", flush=True)
+			n += 1
+			time.sleep(args.interval)
+	except KeyboardInterrupt:
+		pass
+
+if __name__=="__main__":
+	main()
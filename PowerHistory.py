@@ -0,0 +1,160 @@
+#!/usr/bin/env python3
+
+import threading
+import time
+from datetime import datetime
+
+import numpy
+import pandas as pd
+
+chart_ranges = {"15 min": 900.0, "1 h": 3600.0, "1 day": 86400.0, "1 week": 604800.0, "All": None}
+# hosts without a reading for this long no longer count in the total
+total_max_age = 60.0
+
+def lttb(x, y, n_out:int):
+	# Largest-Triangle-Three-Buckets: returns the indices of the points to keep.
+	n = len(x)
+	if n_out >= n or n_out < 3:
+		return numpy.arange(n)
+	edges = numpy.linspace(1, n - 1, n_out - 1).astype(numpy.int64)
+	idx = numpy.empty(n_out, dtype=numpy.int64)
+	idx[0] = 0
+	idx[-1] = n - 1
+	a = 0
+	for i in range(n_out - 2):
+		start, end = edges[i], edges[i + 1]
+		if i + 2 < len(edges):
+			next_start, next_end = edges[i + 1], edges[i + 2]
+		else:
+			next_start, next_end = n - 1, n
+		avg_x = x[next_start:next_end].mean()
+		avg_y = y[next_start:next_end].mean()
+		area = numpy.abs((x[a] - avg_x) * (y[start:end] - y[a]) - (x[a] - x[start:end]) * (avg_y - y[a]))
+		a = start + int(numpy.argmax(area))
+		idx[i + 1] = a
+	return idx
+
+
+class SeriesHistory(object):
+	def __init__(self, max_points:int=20000):
+		self.max_points = max_points
+		self.t = numpy.empty(1024, dtype=numpy.float64)
+		self.v = numpy.empty(1024, dtype=numpy.float64)
+		self.n = 0
+
+	def append(self, t:float, v:float):
+		if self.n == len(self.t):
+			self.t = numpy.resize(self.t, len(self.t) * 2)
+			self.v = numpy.resize(self.v, len(self.v) * 2)
+		self.t[self.n] = t
+		self.v[self.n] = v
+		self.n += 1
+		if self.n > self.max_points:
+			self.compact()
+
+	def compact(self):
+		# the older half is thinned with LTTB, so long histories stay bounded and keep their shape
+		half = self.n // 2
+		keep = lttb(self.t[:half], self.v[:half], half // 4)
+		t = numpy.concatenate([self.t[:half][keep], self.t[half:self.n]])
+		v = numpy.concatenate([self.v[:half][keep], self.v[half:self.n]])
+		self.n = len(t)
+		self.t[:self.n] = t
+		self.v[:self.n] = v
+
+	def series(self, since:float|None, n_out:int):
+		t = self.t[:self.n]
+		v = self.v[:self.n]
+		if since is not None:
+			i = numpy.searchsorted(t, since)
+			t = t[i:]
+			v = v[i:]
+		idx = lttb(t, v, n_out)
+		return t[idx], v[idx]
+
+
+class ClusterPowerHistory(object):
+	def __init__(self):
+		self.hosts = {}
+		self.total = SeriesHistory()
+		self.lock = threading.Lock()
+
+	def append(self, host_powers:dict):
+		with self.lock:
+			# taken under the lock, so every series stays in time order with sessions appending at once
+			t = time.time()
+			for host, power in host_powers.items():
+				if isinstance(power, bool) or not isinstance(power, (int, float)):
+					continue
+				if not host in self.hosts:
+					self.hosts[host] = SeriesHistory()
+				self.hosts[host].append(t, float(power))
+			# the latest reading of every host read recently by any session, so sessions
+			# with different active hosts add to one consistent total
+			total = sum(s.v[s.n - 1] for s in self.hosts.values() if s.n and t - s.t[s.n - 1] <= total_max_age)
+			self.total.append(t, float(total))
+
+	def latest(self) -> float|None:
+		with self.lock:
+			return float(self.total.t[self.total.n - 1]) if self.total.n else None
+
+	def bucket_seconds(self, chart_range:str, n_out:int) -> float:
+		# the time one point of a chart stands for
+		seconds = chart_ranges[chart_range]
+		if seconds is None:
+			with self.lock:
+				seconds = float(self.total.t[self.total.n - 1] - self.total.t[0]) if self.total.n else 0.0
+		return seconds / n_out
+
+	def host_frame(self, hosts:list, chart_range:str, n_out:int) -> pd.DataFrame:
+		since = range_since(chart_range)
+		frames = []
+		with self.lock:
+			for host in hosts:
+				if not host in self.hosts:
+					continue
+				t, v = self.hosts[host].series(since, n_out)
+				frames.append(pd.DataFrame({"time": t, "host": host, "power (W)": v}))
+		if not frames:
+			return to_frame([], host=True)
+		df = pd.concat(frames, ignore_index=True)
+		df["time"] = to_local_datetime(df["time"])
+		return df
+
+	def total_frame(self, chart_range:str, n_out:int) -> pd.DataFrame:
+		with self.lock:
+			t, v = self.total.series(range_since(chart_range), n_out)
+		df = pd.DataFrame({"time": t, "power (W)": v})
+		df["time"] = to_local_datetime(df["time"])
+		return df
+
+
+def range_since(chart_range:str) -> float|None:
+	seconds = chart_ranges[chart_range]
+	if seconds is None:
+		return None
+	return time.time() - seconds
+
+def to_local_datetime(t):
+	tz = datetime.now().astimezone().tzinfo
+	return pd.to_datetime(t, unit="s", utc=True).dt.tz_convert(tz).dt.tz_localize(None)
+
+def to_frame(rows:list, host:bool=False) -> pd.DataFrame:
+	if not rows:
+		df = pd.DataFrame({"time": pd.Series(dtype="datetime64[ns]"), "power (W)": pd.Series(dtype="float64")})
+		if host:
+			df.insert(1, "host", pd.Series(dtype="str"))
+		return df
+	df = pd.DataFrame(rows)
+	df["time"] = to_local_datetime(df["time"])
+	return df
+
+
+histories = {}
+histories_lock = threading.Lock()
+
+def get_power_history(name:str) -> ClusterPowerHistory:
+	with histories_lock:
+		if not name in histories:
+			histories[name] = ClusterPowerHistory()
+		return histories[name]
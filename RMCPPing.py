@@ -0,0 +1,88 @@
+#!/usr/bin/env python3
+
+# RMCP/ASF presence ping on UDP 623. A BMC answers without a session or
+# credentials, so it is a cheap way to tell whether a BMC is there:
+#
+#   RMCP header   0x06 version, 0x00, 0xff sequence (no ACK), 0x06 class ASF
+#   ASF message   IANA 0x000011be, type 0x80 ping / 0x40 pong, tag, 0x00, data length
+#   pong data     IANA and OEM of the responder, supported entities (bit 7: IPMI),
+#                 supported interactions, 6 reserved bytes
+#
+# All targets are pinged from one UDP socket and the answers are collected
+# with select, so sweeping a whole network takes about timeout * (retries + 1).
+
+import select
+import socket
+import struct
+import time
+
+rmcp_port = 623
+rmcp_header = bytes([0x06, 0x00, 0xff, 0x06])
+asf_iana = 0x000011be
+asf_message = struct.Struct("!IBBBB")
+presence_ping_type = 0x80
+presence_pong_type = 0x40
+
+vendor_names = {
+	2: "IBM", 11: "HPE", 343: "Intel", 674: "Dell", 2011: "Huawei", 4542: "ASF",
+	5771: "Cisco", 6653: "Tyan", 7244: "Quanta", 10368: "Fujitsu", 10876: "Supermicro",
+	15370: "Gigabyte", 19046: "Lenovo", 20301: "IBM", 37945: "Inspur",
+}
+
+def ping_packet(tag:int) -> bytes:
+	return rmcp_header + asf_message.pack(asf_iana, presence_ping_type, tag, 0, 0)
+
+def parse_pong(data:bytes) -> dict|None:
+	if len(data) < 4 + asf_message.size or data[0] != 0x06 or data[3] != 0x06:
+		return None
+	iana, message_type, tag, reserved, length = asf_message.unpack_from(data, 4)
+	if iana != asf_iana or message_type != presence_pong_type:
+		return None
+	body = data[4 + asf_message.size:4 + asf_message.size + length]
+	if len(body) < 10:
+		return {"tag": tag, "enterprise": None, "vendor": None, "ipmi": None}
+	enterprise, oem = struct.unpack_from("!II", body)
+	return {"tag": tag, "enterprise": enterprise, "vendor": vendor_names.get(enterprise),
+		"ipmi": bool(body[8] & 0x80), "interactions": body[9]}
+
+def presence_ping(ips:list, timeout:float=1.0, retries:int=1, port:int=rmcp_port) -> dict:
+	targets = [str(ip) for ip in ips]
+	results = {}
+	sent_at = {}
+	sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+	try:
+		for attempt in range(retries + 1):
+			pending = [ip for ip in targets if not ip in results]
+			if not pending:
+				break
+			for ip in pending:
+				try:
+					sock.sendto(ping_packet(attempt), (ip, port))
+					sent_at[ip] = time.monotonic()
+				except OSError:
+					continue
+			deadline = time.monotonic() + timeout
+			while len(results) < len(targets):
+				wait = deadline - time.monotonic()
+				if wait <= 0:
+					break
+				readable, _, _ = select.select([sock], [], [], wait)
+				if not readable:
+					break
+				try:
+					data, (addr, _) = sock.recvfrom(512)
+				except OSError:
+					continue
+				if not addr in sent_at or addr in results:
+					continue
+				pong = parse_pong(data)
+				if pong is None:
+					continue
+				pong["rtt"] = time.monotonic() - sent_at[addr]
+				results[addr] = pong
+	finally:
+		sock.close()
+	return results
+
+def is_present(ip:str, timeout:float=0.5, retries:int=1) -> bool:
+	return str(ip) in presence_ping([ip], timeout, retries)
@@ -0,0 +1,41 @@
+#!/usr/bin/env python3
+
+import pandas as pd
+import streamlit as st
+
+from ColumnarRecording import ColumnarRecording, list_recordings
+
+def analysis():
+	st.title("Recording Analysis")
+
+	recordings = list_recordings()
+	if not recordings:
+		st.text("No recordings yet. Turn on \"Record data\" on a watt page to create one.")
+		return
+
+	path = st.selectbox("Recording", recordings, format_func=lambda p: f"{p.parent.name} / {p.name}")
+	rec = ColumnarRecording(path)
+	first, last = rec.time_range()
+	if first is None:
+		st.text("The recording is empty.")
+		return
+
+	first = pd.Timestamp(first).to_pydatetime()
+	last = pd.Timestamp(last).to_pydatetime()
+	with st.container(horizontal=True, vertical_alignment="center"):
+		st.text(f"{rec.rows} rows / {len(rec.host_columns())} hosts")
+		st.text(f"{first:%Y/%m/%d %H:%M:%S} - {last:%Y/%m/%d %H:%M:%S}")
+	if first < last:
+		start, end = st.slider("Range", min_value=first, max_value=last, value=(first, last), format="MM/DD HH:mm:ss")
+	else:
+		start, end = first, last
+	i, j = rec.index_range(start, end)
+
+	st.subheader("Per host")
+	st.dataframe(rec.host_summary(i, j), hide_index=True)
+
+	st.subheader("Cluster total by hour")
+	hours, means = rec.hourly_total(i, j)
+	df = pd.DataFrame({"hour": hours.astype("datetime64[ns]"), "mean total power (W)": means})
+	st.bar_chart(df, x="hour", y="mean total power (W)")
+	st.dataframe(df, hide_index=True)
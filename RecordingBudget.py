@@ -0,0 +1,143 @@
+#!/usr/bin/env python3
+
+# Recordings kept in session state share one process-wide memory budget.
+# Each session and page records into a small in-memory chunk; the chunk is
+# pickled to spill/<pid>/ when it reaches chunk_rows or chunk_bytes, or when all
+# sessions together go over the budget. The budget in MB can be set in a RECORDING_BUDGET file.
+# Every dashboard process spills into its own directory, and removes only
+# those of processes that are gone.
+
+import io
+import os
+import shutil
+import threading
+import weakref
+from pathlib import Path
+
+import pandas as pd
+from streamlit.runtime.scriptrunner import get_script_run_ctx
+
+from EnergyAccumulator import pid_alive
+
+spill_root = Path("./spill")
+spill_dir = spill_root / str(os.getpid())
+default_budget = 256 * 1024 * 1024
+chunk_rows = 1000
+# wide recordings of many hosts reach this long before chunk_rows
+chunk_bytes = 4 * 1024 * 1024
+
+class RecordingBudget(object):
+	def __init__(self, limit:int):
+		self.limit = limit
+		self.memory = {}
+		self.disk = {}
+		self.lock = threading.Lock()
+
+	def set_memory(self, key:tuple, nbytes:int):
+		with self.lock:
+			self.memory[key] = nbytes
+
+	def add_disk(self, key:tuple, nbytes:int):
+		with self.lock:
+			self.disk[key] = self.disk.get(key, 0) + nbytes
+
+	def release(self, key:tuple):
+		with self.lock:
+			self.memory.pop(key, None)
+			self.disk.pop(key, None)
+
+	def is_over(self) -> bool:
+		with self.lock:
+			return sum(self.memory.values()) > self.limit
+
+	def usage(self, session_id:str|None=None) -> tuple:
+		with self.lock:
+			memory = sum(v for k, v in self.memory.items() if session_id is None or k[0] == session_id)
+			disk = sum(v for k, v in self.disk.items() if session_id is None or k[0] == session_id)
+		return memory, disk
+
+	def sessions(self) -> int:
+		with self.lock:
+			return len({k[0] for k in self.memory} | {k[0] for k in self.disk})
+
+
+budget = None
+budget_lock = threading.Lock()
+
+def get_budget() -> RecordingBudget:
+	global budget
+	with budget_lock:
+		if budget is None:
+			# no session survives its process, so the spills of dead processes are garbage
+			if spill_root.is_dir():
+				for d in spill_root.iterdir():
+					if d.is_dir() and d.name.isdigit() and (d == spill_dir or not pid_alive(int(d.name))):
+						shutil.rmtree(d, ignore_errors=True)
+			budget = RecordingBudget(default_budget)
+		return budget
+
+def set_budget_mb(mb:float):
+	get_budget().limit = int(mb * 1024 * 1024)
+
+def current_session_id() -> str:
+	ctx = get_script_run_ctx()
+	return ctx.session_id if ctx is not None else "local"
+
+def release_recording(key:tuple, files:list):
+	get_budget().release(key)
+	for f in files:
+		f.unlink(missing_ok=True)
+
+
+class SpilledRecording(object):
+	def __init__(self, page_name:str):
+		self.key = (current_session_id(), page_name)
+		self.df = pd.DataFrame()
+		self.files = []
+		# columns of the spilled chunks in order of appearance
+		self.columns = []
+		# the session state is dropped when the session ends; take its spill files with it
+		weakref.finalize(self, release_recording, self.key, self.files)
+
+	def rows(self) -> int:
+		return len(self.df)
+
+	def account(self):
+		b = get_budget()
+		nbytes = int(self.df.memory_usage(deep=True).sum())
+		b.set_memory(self.key, nbytes)
+		if len(self.df) >= chunk_rows or nbytes >= chunk_bytes or (len(self.df) > 0 and b.is_over()):
+			self.spill()
+
+	def spill(self):
+		spill_dir.mkdir(parents=True, exist_ok=True)
+		f = spill_dir / f"{self.key[0]}_{self.key[1]}_{len(self.files):05d}.pkl"
+		self.df.to_pickle(f)
+		self.files.append(f)
+		self.columns += [c for c in self.df.columns if not c in self.columns]
+		b = get_budget()
+		b.add_disk(self.key, f.stat().st_size)
+		b.set_memory(self.key, 0)
+		self.df = pd.DataFrame()
+
+	def clear(self):
+		release_recording(self.key, self.files)
+		# cleared in place: the finalizer holds the same list
+		self.files.clear()
+		self.columns = []
+		self.df = pd.DataFrame()
+
+	def chunks(self):
+		for f in self.files:
+			yield pd.read_pickle(f)
+		yield self.df
+
+	def to_csv(self) -> bytes:
+		# hosts switched on during the recording add columns to later chunks only
+		columns = self.columns + [c for c in self.df.columns if not c in self.columns]
+		buf = io.StringIO()
+		for n, chunk in enumerate(self.chunks()):
+			if n > 0 and len(chunk) == 0:
+				continue
+			chunk.reindex(columns=columns).to_csv(buf, header=(n == 0))
+		return buf.getvalue().encode("utf-8")
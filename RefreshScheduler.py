@@ -0,0 +1,196 @@
+#!/usr/bin/env python3
+
+# Timing of auto refresh on the watt pages, apart from Streamlit. The clock is
+# injectable, so simulate_refresh.py can run the same scheduler and controller
+# on a virtual clock. state is the PageStatisticsInterface of a session or a
+# plain dict.
+
+import time
+from datetime import datetime, timedelta
+
+import numpy
+
+from PIDController import PIDController
+
+pid_gains = (0.15, 0.05, 0.1)
+
+class Averager(object):
+	def __init__(self, num, num_outliers, precision):
+		self.hist = []
+		self.hist_take = []
+		self.hist_avg = []
+		self.num = num
+		if self.num < 3:
+			self.num = 3
+		self.num_outliers = num_outliers
+		if self.num_outliers % 2 != 0:
+			assert(True)
+		self.precision = precision
+		self.put_count = 0
+		self.count_until_max = 0
+
+	def put(self, val):
+		self.put_count += 1
+		self.count_until_max += 1
+		self.hist.append(val)
+		if len(self.hist) > self.num:
+			self.hist = self.hist[1:]
+		self.put_hist_avg(self.get())
+
+	def put_hist_avg(self, val):
+		self.hist_avg.append(val)
+		if len(self.hist_avg) > self.num:
+			self.hist_avg = self.hist_avg[1:]
+
+	def get_stddev(self):
+		return numpy.std(self.hist)
+
+	def get_rawavg(self):
+		if len(self.hist) == 0:
+			return 0.0
+		avg = round(sum(self.hist)/len(self.hist), self.precision)
+		return avg
+
+	def get_variance(self):
+		return numpy.var(self.hist)
+
+	def get(self):
+		if len(self.hist) == 0:
+			return 0.0
+		if len(self.hist) <= self.num_outliers:
+			avg = sum(self.hist)/len(self.hist)
+			return avg
+		self.hist_take = sorted(self.hist)
+		edgenum = int(self.num_outliers / 2)
+		self.hist_take = self.hist_take[edgenum:-(edgenum+1)]
+		self.c = len(self.hist_take)
+		if self.c == 0:
+			return 0.0
+		self.m = sum(self.hist_take)
+		avg = self.m/self.c
+		return avg
+
+	def get_str(self):
+		return f"{self.get():.3f}"
+
+	def stat(self):
+		return f"{self.n_effective()} eff. / {self.n_samples()} smpl. / {self.n_all()} tot."
+
+	def is_good(self):
+		if self.num == len(self.hist):
+			return True
+		return False
+
+	def n_all(self):
+		return self.put_count
+
+	def n_samples(self):
+		return len(self.hist)
+
+	def n_effective(self):
+		return len(self.hist_take)
+
+	def clear(self):
+		self.hist = []
+		self.hist_take = []
+		self.hist_avg = []
+		self.put_count = 0
+
+
+class SystemClock(object):
+	def now(self) -> datetime:
+		return datetime.now()
+
+	def sleep(self, seconds:float):
+		time.sleep(seconds)
+
+
+class VirtualClock(object):
+	def __init__(self, start:datetime=datetime(2000, 1, 1)):
+		self.t = start
+
+	def now(self) -> datetime:
+		return self.t
+
+	def sleep(self, seconds:float):
+		self.advance(seconds)
+
+	def advance(self, seconds:float):
+		self.t += timedelta(seconds=seconds)
+
+
+system_clock = SystemClock()
+
+def init_state(state, samples:int=10, outliers:int=0):
+	for name in ("ar_intl", "ar_dura", "ar_tgte"):
+		if not name in state:
+			state[name] = Averager(samples, outliers, 3)
+	for name, value in (("autorefresh", False), ("auto_correct", False), ("auto_since", None), ("auto_iec_amount", 0.0),
+			("interval", 0.0), ("target_interval", 0.0), ("interval_error_correction", 0.0), ("duration_start_previous", None)):
+		if not name in state:
+			state[name] = value
+
+
+class RefreshScheduler(object):
+	def __init__(self, state, clock=system_clock, gains:tuple=pid_gains):
+		init_state(state)
+		self.state = state
+		self.clock = clock
+		# the error history of the controller is kept in state, the controller is not
+		self.pidcon = PIDController(*gains, store=state)
+		self.ar_intl = state["ar_intl"]
+		self.ar_dura = state["ar_dura"]
+		self.ar_tgte = state["ar_tgte"]
+		self.restarted = False
+		self.interval = None
+
+	def stop(self):
+		self.state["autorefresh"] = False
+
+	def tick(self, start:datetime, target_interval:float, interval_error_correction:float, auto_correct:bool, touched:bool=False) -> float:
+		# start is when this rerun started; returns the seconds to sleep before the next one
+		s = self.state
+		self.restarted = (not s["autorefresh"] or touched
+			or s["target_interval"] != target_interval
+			or s["interval_error_correction"] != interval_error_correction)
+		init_auto_correct = auto_correct and not s["auto_correct"]
+		s["autorefresh"] = True
+		s["auto_correct"] = auto_correct
+		s["target_interval"] = target_interval
+		s["interval_error_correction"] = interval_error_correction
+
+		if self.restarted:
+			s["auto_since"] = self.clock.now().strftime("%Y/%m/%d %H:%M:%S")
+			s["duration_start_previous"] = None
+			self.ar_intl.clear()
+			self.ar_dura.clear()
+			self.ar_tgte.clear()
+
+		if init_auto_correct:
+			self.pidcon.clear()
+			s["auto_iec_amount"] = 0.0
+
+		self.interval = None
+		if s["duration_start_previous"] != None:
+			self.interval = (start - s["duration_start_previous"]).total_seconds()
+			s["interval"] = f"{self.interval:.3f}"
+			self.ar_intl.put(self.interval)
+			self.ar_tgte.put(self.interval - target_interval)
+			if auto_correct:
+				self.pidcon.put_data(target_interval, self.interval)
+		s["duration_start_previous"] = start
+
+		if auto_correct:
+			s["auto_iec_amount"] += self.pidcon.get_correction()
+
+		static_seconds = target_interval + interval_error_correction
+		seconds = static_seconds + s["auto_iec_amount"]
+		if seconds < 0:
+			seconds = static_seconds
+			s["auto_iec_amount"] = 0.0
+		return seconds
+
+	def finish(self, start:datetime) -> float:
+		duration = (self.clock.now() - start).total_seconds()
+		self.ar_dura.put(duration)
+		return duration
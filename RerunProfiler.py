@@ -0,0 +1,173 @@
+#!/usr/bin/env python3
+
+# Timing breakdown of every rerun, enabled by the DEBUG file. Phases are
+# exclusive: while a nested phase runs, the enclosing phase is paused, so the
+# phases of a rerun and "other" (Streamlit itself) add up to its total.
+#
+# With sampling on, a background thread samples the stacks of the threads
+# running a rerun. The folded stacks ("a;b;c count" per line, the input of
+# flamegraph.pl and speedscope) of the slowest reruns are kept.
+
+import collections
+import os
+import sys
+import threading
+import time
+from contextlib import contextmanager
+
+enabled = False
+sampling = False
+sample_interval = 0.005
+history_size = 300
+keep_slowest = 5
+
+class RerunRecord(object):
+	def __init__(self, page:str):
+		self.page = page
+		self.started_at = time.time()
+		self.start = time.perf_counter()
+		self.total = None
+		self.phases = collections.defaultdict(float)
+		self.stack = []
+		self.samples = collections.Counter()
+		self.folded = None
+
+	def push(self, name:str):
+		now = time.perf_counter()
+		if self.stack:
+			top = self.stack[-1]
+			self.phases[top[0]] += now - top[1]
+		self.stack.append([name, now])
+
+	def pop(self):
+		now = time.perf_counter()
+		name, start = self.stack.pop()
+		self.phases[name] += now - start
+		if self.stack:
+			self.stack[-1][1] = now
+
+	def row(self) -> dict:
+		r = {"time": time.strftime("%H:%M:%S", time.localtime(self.started_at)), "page": self.page, "total": self.total}
+		r.update(self.phases)
+		r["other"] = self.total - sum(self.phases.values())
+		return r
+
+
+class RerunProfiler(object):
+	def __init__(self):
+		self.history = collections.deque(maxlen=history_size)
+		self.slowest = []
+		self.active = {}
+		self.local = threading.local()
+		self.lock = threading.Lock()
+		self.sampler = None
+
+	def current(self) -> RerunRecord|None:
+		return getattr(self.local, "record", None)
+
+	def begin(self, page:str):
+		rec = RerunRecord(page)
+		self.local.record = rec
+		with self.lock:
+			self.active[threading.get_ident()] = rec
+		if sampling:
+			self.start_sampler()
+
+	def end(self):
+		rec = self.current()
+		self.local.record = None
+		with self.lock:
+			self.active.pop(threading.get_ident(), None)
+		if rec is None:
+			return
+		while rec.stack:
+			rec.pop()
+		rec.total = time.perf_counter() - rec.start
+		with self.lock:
+			self.history.append(rec)
+			if rec.samples:
+				self.slowest.append(rec)
+				self.slowest.sort(key=lambda r: r.total, reverse=True)
+				for r in self.slowest[keep_slowest:]:
+					r.samples = collections.Counter()
+				del self.slowest[keep_slowest:]
+
+	def start_sampler(self):
+		with self.lock:
+			if self.sampler is not None and self.sampler.is_alive():
+				return
+			self.sampler = threading.Thread(target=self.sample_loop, daemon=True)
+			self.sampler.start()
+
+	def sample_loop(self):
+		while sampling:
+			time.sleep(sample_interval)
+			with self.lock:
+				active = dict(self.active)
+			if not active:
+				continue
+			frames = sys._current_frames()
+			for ident, rec in active.items():
+				frame = frames.get(ident)
+				if frame is not None:
+					rec.samples[fold(frame)] += 1
+
+	def rows(self) -> list:
+		with self.lock:
+			return [r.row() for r in self.history]
+
+	def slowest_reruns(self) -> list:
+		with self.lock:
+			return list(self.slowest)
+
+
+def fold(frame) -> str:
+	names = []
+	while frame is not None:
+		code = frame.f_code
+		names.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+		frame = frame.f_back
+	return ";".join(reversed(names))
+
+def folded_text(rec:RerunRecord) -> str:
+	return "".join(f"{stack} {count}\n" for stack, count in rec.samples.most_common())
+
+
+profiler = RerunProfiler()
+
+def enable():
+	global enabled
+	enabled = True
+
+def set_page(page:str):
+	rec = profiler.current() if enabled else None
+	if rec is not None:
+		rec.page = page
+
+def set_sampling(on:bool):
+	global sampling
+	sampling = on
+
+@contextmanager
+def rerun(page:str):
+	if not enabled:
+		yield
+		return
+	profiler.begin(page)
+	try:
+		yield
+	finally:
+		# st.rerun() and st.stop() end a rerun with an exception
+		profiler.end()
+
+@contextmanager
+def phase(name:str):
+	rec = profiler.current() if enabled else None
+	if rec is None:
+		yield
+		return
+	rec.push(name)
+	try:
+		yield
+	finally:
+		rec.pop()
@@ -0,0 +1,109 @@
+#!/usr/bin/env python3
+
+import json
+import threading
+import time
+from pathlib import Path
+
+import pyipmi
+import pyipmi.sdr
+
+sdr_cache_dir = Path("./sdr_cache")
+
+SENSOR_TYPE_TEMPERATURE = 0x01
+SENSOR_TYPE_FAN = 0x04
+SENSOR_TYPE_POWER_SUPPLY = 0x08
+
+class SDRCache(object):
+	def __init__(self, ip:str, check_interval:float=600.0):
+		self.ip = ip
+		self.check_interval = check_interval
+		self.addition = None
+		self.erase = None
+		self.checked_at = 0.0
+		self.raw_records = []
+		self.records = []
+		self.by_name = {}
+		self.lock = threading.Lock()
+		self.load()
+
+	def fname(self) -> Path:
+		return sdr_cache_dir / f"{self.ip.replace(':', '_')}.json"
+
+	def load(self):
+		if not self.fname().exists():
+			return
+		try:
+			with open(self.fname()) as f:
+				d = json.load(f)
+			raw_records = [bytes.fromhex(x) for x in d["records"]]
+			addition, erase = d["addition"], d["erase"]
+		except (OSError, ValueError, KeyError, TypeError):
+			# a truncated or corrupt copy is ignored, and the repository is read again
+			return
+		self.addition = addition
+		self.erase = erase
+		self.set_records(raw_records)
+
+	def save(self):
+		sdr_cache_dir.mkdir(exist_ok=True)
+		d = {"addition": self.addition, "erase": self.erase, "records": [x.hex() for x in self.raw_records]}
+		tmp = self.fname().with_suffix(".tmp")
+		with open(tmp, "w") as f:
+			json.dump(d, f)
+		tmp.replace(self.fname())
+
+	def set_records(self, raw_records:list):
+		self.raw_records = raw_records
+		self.records = []
+		self.by_name = {}
+		for data in raw_records:
+			try:
+				record = pyipmi.sdr.SdrCommon.from_data(data)
+			except (pyipmi.errors.DecodingError, ValueError, IndexError):
+				continue
+			self.records.append(record)
+			name = getattr(record, "device_id_string", None)
+			if name:
+				self.by_name[name.strip()] = record
+
+	def refresh(self, connection):
+		with self.lock:
+			self.refresh_locked(connection)
+
+	def refresh_locked(self, connection):
+		# the repository is read again only when the BMC reports an addition or erase since the cached copy
+		if self.raw_records and time.monotonic() - self.checked_at < self.check_interval:
+			return
+		info = connection.get_sdr_repository_info()
+		self.checked_at = time.monotonic()
+		if self.raw_records and (info.most_recent_addition, info.most_recent_erase) == (self.addition, self.erase):
+			return
+		raw_records = []
+		for record in connection.sdr_repository_entries():
+			raw_records.append(bytes(record.data))
+		self.addition = info.most_recent_addition
+		self.erase = info.most_recent_erase
+		self.set_records(raw_records)
+		self.save()
+
+	def find(self, name:str):
+		# only records with a sensor number and conversion factors can be read as a value;
+		# compact, event-only, OEM and locator records are skipped
+		record = self.by_name.get(name)
+		if not hasattr(record, "number") or not hasattr(record, "convert_sensor_raw_to_value"):
+			return None
+		return record
+
+	def of_type(self, sensor_type_code:int) -> list:
+		return [r for r in self.records if isinstance(r, pyipmi.sdr.SdrFullSensorRecord) and r.sensor_type_code == sensor_type_code]
+
+
+caches = {}
+caches_lock = threading.Lock()
+
+def get_sdr_cache(ip:str) -> SDRCache:
+	with caches_lock:
+		if not ip in caches:
+			caches[ip] = SDRCache(ip)
+		return caches[ip]
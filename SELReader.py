@@ -0,0 +1,180 @@
+#!/usr/bin/env python3
+
+# System Event Log entries are cached in sel.sqlite3. A cursor per BMC keeps
+# the last record ID read and the SEL's last addition and erase timestamps:
+#
+#   nothing added since the cursor    one Get SEL Info request
+#   entries added                     the entries after the last record ID
+#   SEL erased or last entry deleted  the whole SEL again
+#
+# Entries read again after an erase are stored only once.
+
+import sqlite3
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+import pyipmi
+import pyipmi.sel
+
+from IPMIManager import IPMIManager, connection_error_cause
+
+sel_db = "./sel.sqlite3"
+last_record_id = 0xffff
+cc_reservation_canceled = 0xc5
+# timestamps up to this value count seconds from BMC initialization, not from the epoch
+pre_init_timestamp = 0x20000000
+
+sensor_type_names = {
+	0x01: "Temperature", 0x02: "Voltage", 0x03: "Current", 0x04: "Fan",
+	0x05: "Physical Security", 0x06: "Platform Security", 0x07: "Processor",
+	0x08: "Power Supply", 0x09: "Power Unit", 0x0c: "Memory", 0x0d: "Drive Slot",
+	0x0f: "System Firmware Progress", 0x10: "Event Logging Disabled", 0x12: "System Event",
+	0x13: "Critical Interrupt", 0x14: "Button / Switch", 0x1d: "System Boot Initiated",
+	0x1f: "OS Boot", 0x20: "OS Stop / Shutdown", 0x23: "Watchdog", 0x2b: "Version Change",
+}
+
+schema = """
+create table if not exists events (
+	bmc text, cluster text, host text, record_id integer, timestamp integer, type integer,
+	sensor_type integer, sensor_number integer, event_type integer, deasserted integer,
+	event_data text, raw text, unique (bmc, record_id, raw));
+create index if not exists events_host_time on events (host, timestamp);
+create index if not exists events_cluster_time on events (cluster, timestamp);
+create table if not exists cursors (
+	bmc text primary key, last_record_id integer, addition integer, erase integer, polled_at real);
+"""
+
+class SELStore(object):
+	def __init__(self, path:str=sel_db):
+		self.path = path
+		self.lock = threading.Lock()
+		with self.connect() as db:
+			db.executescript(schema)
+
+	def connect(self):
+		return sqlite3.connect(self.path, timeout=30)
+
+	def get_cursor(self, bmc:str) -> dict|None:
+		with self.connect() as db:
+			row = db.execute("select last_record_id, addition, erase from cursors where bmc = ?", (bmc,)).fetchone()
+		if row is None:
+			return None
+		return {"last_record_id": row[0], "addition": row[1], "erase": row[2]}
+
+	def save(self, bmc:str, cluster:str, host:str, entries:list, cursor:dict) -> int:
+		rows = []
+		for e in entries:
+			raw = bytes(e.data).hex()
+			rows.append((bmc, cluster, host, e.record_id, e.timestamp, e.type, e.sensor_type,
+				e.sensor_number, e.event_type, e.event_direction, bytes(e.event_data).hex(), raw))
+		with self.lock, self.connect() as db:
+			before = db.total_changes
+			db.executemany("insert or ignore into events values (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)", rows)
+			added = db.total_changes - before
+			db.execute("insert or replace into cursors values (?, ?, ?, ?, ?)",
+				(bmc, cursor["last_record_id"], cursor["addition"], cursor["erase"], time.time()))
+		return added
+
+	def recent(self, cluster:str, hosts:list|None=None, since:float=0.0, limit:int=500) -> list:
+		query = "select host, record_id, timestamp, type, sensor_type, sensor_number, event_type, deasserted, event_data, bmc " \
+			"from events where cluster = ? and (timestamp >= ? or timestamp <= ?)"
+		args = [cluster, since, pre_init_timestamp]
+		if hosts:
+			query += f" and host in ({','.join('?' * len(hosts))})"
+			args += hosts
+		query += " order by timestamp desc, record_id desc limit ?"
+		args.append(limit)
+		with self.connect() as db:
+			return db.execute(query, args).fetchall()
+
+	def cursors(self) -> dict:
+		with self.connect() as db:
+			rows = db.execute("select bmc, last_record_id, polled_at from cursors").fetchall()
+		return {bmc: {"last_record_id": r, "polled_at": t} for bmc, r, t in rows}
+
+
+def read_entries(ipmiman:IPMIManager, start:int) -> list:
+	reservation = ipmiman.getSelReservation()
+	entries = []
+	record_id = start
+	while record_id != last_record_id:
+		entry, record_id = ipmiman.getSelEntry(record_id, reservation)
+		entries.append(entry)
+	return entries
+
+def read_new_entries(ipmiman:IPMIManager, cursor:dict|None) -> tuple:
+	info = ipmiman.getSelInfo()
+	new_cursor = {"last_record_id": None, "addition": info.most_recent_addition, "erase": info.most_recent_erase}
+	if cursor and (cursor["addition"], cursor["erase"]) == (info.most_recent_addition, info.most_recent_erase):
+		new_cursor["last_record_id"] = cursor["last_record_id"]
+		return [], new_cursor
+	if info.entries == 0:
+		return [], new_cursor
+
+	incremental = cursor is not None and cursor["erase"] == info.most_recent_erase and cursor["last_record_id"] is not None
+	for attempt in range(3):
+		try:
+			# the last entry of the previous poll is read again for its next record ID;
+			# the store keeps it once unless the BMC reused the record ID
+			entries = read_entries(ipmiman, cursor["last_record_id"] if incremental else 0)
+			break
+		except pyipmi.errors.CompletionCodeError as e:
+			if getattr(e, "cc", None) == cc_reservation_canceled:
+				# the SEL changed while reading; reserve it again
+				continue
+			if not incremental:
+				raise
+			# the last entry was deleted, so its next record ID is unknown
+			incremental = False
+	else:
+		raise pyipmi.errors.CompletionCodeError(cc_reservation_canceled)
+	if entries:
+		new_cursor["last_record_id"] = entries[-1].record_id
+	elif cursor:
+		new_cursor["last_record_id"] = cursor["last_record_id"]
+	return entries, new_cursor
+
+def poll_host(store:SELStore, cluster:str, d:dict) -> dict:
+	ipmiman = IPMIManager(d["ipmi_ip"], d["ipmi_user"], d["ipmi_pass"], d["if_type"])
+	t0 = time.monotonic()
+	try:
+		entries, cursor = read_new_entries(ipmiman, store.get_cursor(d["ipmi_ip"]))
+		ipmiman.setSucceeded()
+	except pyipmi.errors.CompletionCodeError as e:
+		ipmiman.setCompletionCodeError(e)
+		return {"host": d["hostname"], "new": None, "error": "Completion Code Error", "seconds": time.monotonic() - t0}
+	except pyipmi.errors.IpmiConnectionError as e:
+		ipmiman.setConnectionError(e)
+		return {"host": d["hostname"], "new": None, "error": connection_error_cause(e), "seconds": time.monotonic() - t0}
+	except pyipmi.errors.DecodingError:
+		return {"host": d["hostname"], "new": None, "error": "Invalid SEL entry", "seconds": time.monotonic() - t0}
+	added = store.save(d["ipmi_ip"], cluster, d["hostname"], entries, cursor)
+	return {"host": d["hostname"], "new": added, "error": None, "seconds": time.monotonic() - t0}
+
+def poll_cluster(store:SELStore, cluster:str, hostdics:list, max_workers:int=16) -> list:
+	with ThreadPoolExecutor(max_workers=max_workers) as executor:
+		return list(executor.map(lambda d: poll_host(store, cluster, d), hostdics))
+
+def timestamp_str(timestamp:int) -> str:
+	if timestamp <= pre_init_timestamp:
+		return f"pre-init +{timestamp} sec."
+	return datetime.fromtimestamp(timestamp).strftime("%Y-%m-%d %H:%M:%S")
+
+def event_str(record_type:int, sensor_type:int, event_type:int, deasserted:int) -> str:
+	if record_type != pyipmi.sel.SelEntry.TYPE_SYSTEM_EVENT:
+		return f"OEM record (0x{record_type:02x})"
+	name = sensor_type_names.get(sensor_type, f"Sensor type 0x{sensor_type:02x}")
+	return f"{name}, event type 0x{event_type:02x} {'deasserted' if deasserted else 'asserted'}"
+
+
+sel_store = None
+sel_store_lock = threading.Lock()
+
+def get_sel_store() -> SELStore:
+	global sel_store
+	with sel_store_lock:
+		if sel_store is None:
+			sel_store = SELStore()
+		return sel_store
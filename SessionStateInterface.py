@@ -1,9 +1,14 @@
 #!/usr/bin/env python3
 
+import numpy
 import pandas as pd
 from streamlit import session_state as ss
 from datetime import datetime
 
+from ColumnarRecording import get_writer, close_writer
+from RecordingBudget import SpilledRecording, get_budget, current_session_id
+from RerunProfiler import phase
+
 class SessionStateInterface(object):
 	def _tag_prefix(self):
 		raise NotImplementedError
@@ -62,101 +67,89 @@ class PageStatisticsInterface(SessionStateInterface):
 		return self.obj.get_urlpath() + "_page_"
 
 
+class ClusterStatistics(object):
+	def __init__(self, hosts:list):
+		n = len(hosts)
+		self.index = {host: i for i, host in enumerate(hosts)}
+		self.power = numpy.zeros(n, dtype=numpy.float64)
+		self.power_valid = numpy.zeros(n, dtype=bool)
+		self.act = numpy.zeros(n, dtype=bool)
+		# display value of hosts without a numeric reading, e.g. "n/a" or an error
+		self.label = ["n/a"] * n
+
+	def host_index(self, host:str) -> int:
+		i = self.index.get(host)
+		if i is None:
+			i = len(self.index)
+			self.index[host] = i
+			self.power = numpy.append(self.power, 0.0)
+			self.power_valid = numpy.append(self.power_valid, False)
+			self.act = numpy.append(self.act, False)
+			self.label.append("n/a")
+		return i
+
+
 class ClusterStatisticsInterface(SessionStateInterface):
 	def __init__(self, cluster_watt_page_obj):
 		self.obj = cluster_watt_page_obj
-		self.power_tag = self.obj.get_urlpath() + "_cluster_total_power"
-		self.nhost_tag = self.obj.get_urlpath() + "_cluster_n_hosts"
-		if not self.power_tag in ss:
-			ss[self.power_tag] = 0
-		if not self.nhost_tag in ss:
-			ss[self.nhost_tag] = 0
-		self.host_act_tag_prefix = self.obj.get_urlpath() + "_cluster_host_act-"
-		self.host_power_tag_prefix = self.obj.get_urlpath() + "_cluster_host_power-"
-		self.act_tagset_tag = self.obj.get_urlpath() + "_cluster_host_act_tags"
-		self.power_tagset_tag = self.obj.get_urlpath() + "_cluster_host_power_tags"
-		if not self.act_tagset_tag in ss:
-			ss[self.act_tagset_tag] = set()
-		if not self.power_tagset_tag in ss:
-			ss[self.power_tagset_tag] = set()
+		self.stat_tag = self.obj.get_urlpath() + "_cluster_statistics"
+		if not self.stat_tag in ss:
+			ss[self.stat_tag] = ClusterStatistics([d["hostname"] for d in self.obj.get_hosts_dic()])
+		self.stat = ss[self.stat_tag]
 		self.hosts_touched = False
 
-	def _host_power_tag(self, host:str) -> str:
-		tag = self.host_power_tag_prefix + host.replace(".", "_")
-		ss[self.power_tagset_tag].add(tag)
-		return tag
-
-	def _host_act_tag(self, host:str) -> str:
-		tag = self.host_act_tag_prefix + host.replace(".", "_")
-		ss[self.act_tagset_tag].add(tag)
-		return tag
-
 	def set_host_power(self, host:str, power:float|str):
-		tag = self._host_power_tag(host)
-		ss[tag] = power
+		i = self.stat.host_index(host)
+		if power is None or isinstance(power, (bool, str)):
+			self.stat.power_valid[i] = False
+			self.stat.label[i] = power
+		else:
+			self.stat.power[i] = power
+			self.stat.power_valid[i] = True
 
 	def host_power(self, host:str) -> float|str:
-		tag = self._host_power_tag(host)
-		if not tag in ss:
-			ss[tag] = "n/a"
-		return ss[tag]
+		i = self.stat.host_index(host)
+		if not self.stat.power_valid[i]:
+			return self.stat.label[i]
+		power = self.stat.power[i]
+		return int(power) if power.is_integer() else float(power)
 
 	def total_power(self) -> float:
-		total = 0.0
-		for tag in ss[self.power_tagset_tag]:
-			if ss[tag] is None:
-				continue
-			try:
-				total += ss[tag]
-			except TypeError:
-				pass
-		return total
+		return float(self.stat.power.sum(where=self.stat.power_valid))
 
 	def init_host_act(self, host:str):
-		tag = self._host_act_tag(host)
-		if not tag in ss:
-			ss[tag] = False
+		self.stat.host_index(host)
 
 	def set_host_act(self, host:str):
-		self.init_host_act(host)
-		tag = self._host_act_tag(host)
-		if ss[tag] == False:
+		i = self.stat.host_index(host)
+		if not self.stat.act[i]:
 			self.hosts_touched = True
-		ss[tag] = True
+		self.stat.act[i] = True
 
 	def unset_host_act(self, host:str):
-		self.init_host_act(host)
-		tag = self._host_act_tag(host)
-		if ss[tag] == True:
+		i = self.stat.host_index(host)
+		if self.stat.act[i]:
 			self.hosts_touched = True
-		ss[tag] = False
+		self.stat.act[i] = False
 
 	def is_host_act(self, host:str) -> bool:
-		self.init_host_act(host)
-		tag = self._host_act_tag(host)
-		return ss[tag]
+		return bool(self.stat.act[self.stat.host_index(host)])
 
 	def is_host_skipped(self, host:str) -> bool:
-		tag = self._host_act_tag(host)
-		return not self.is_host_act(tag)
-	
+		return not self.is_host_act(host)
+
 	def are_hosts_touched(self):
 		return self.hosts_touched
 
 	def total_nhost(self) -> int:
-		nhost = 0
-		for tag in ss[self.act_tagset_tag]:
-			if ss[tag] == True:
-				nhost += 1
-		return nhost
+		return int(numpy.count_nonzero(self.stat.act))
 
 	def clear_host_power(self):
-		for tag in ss[self.power_tagset_tag]:
-			ss[tag] = "n/a"
+		self.stat.power_valid[:] = False
+		self.stat.label = ["n/a"] * len(self.stat.label)
 
 	def clear_host_act(self):
-		for tag in ss[self.act_tagset_tag]:
-			ss[tag] = False
+		self.stat.act[:] = False
 
 	def clear_touched(self):
 		self.hosts_touched = False
@@ -168,6 +161,7 @@ class DataRecorderInterface(SessionStateInterface):
 		self.id_tag = self.obj.get_urlpath() + "_drec_id"
 		self.data_tag = self.obj.get_urlpath() + "_drec_df"
 		self.since_tag = self.obj.get_urlpath() + "_drec_since"
+		self.row = {}
 
 	def get_id(self) -> int:
 		if not self.id_tag in ss:
@@ -180,19 +174,25 @@ class DataRecorderInterface(SessionStateInterface):
 	def inc_id(self, count:int=1):
 		ss[self.id_tag] += count
 
-	def get_data_df(self) -> pd.DataFrame:
+	def get_recording(self) -> SpilledRecording:
 		if not self.data_tag in ss:
-			ss[self.data_tag] = pd.DataFrame()
+			ss[self.data_tag] = SpilledRecording(self.obj.get_urlpath())
 		return ss[self.data_tag]
 
+	def get_data_df(self) -> pd.DataFrame:
+		return self.get_recording().df
+
 	def reset_data(self):
-		ss[self.data_tag] = pd.DataFrame()
+		if ss.get(self.since_tag) is not None:
+			close_writer(self.obj.get_urlpath(), ss[self.since_tag], current_session_id())
+		self.get_recording().clear()
 		ss[self.since_tag] = None
 
 	def set_record_data(self, name:str, val:float):
 		df = self.get_data_df()
 		i = self.get_id()
 		df.loc[i, name] = val
+		self.row[name] = val
 	
 	def set_record_datetime(self, dtobj: datetime):
 		if ss.get(self.since_tag) == None:
@@ -205,13 +205,25 @@ class DataRecorderInterface(SessionStateInterface):
 		df.loc[i, "time:hour"] = dtobj.hour
 		df.loc[i, "time:minute"] = dtobj.minute
 		df.loc[i, "time:second"] = dtobj.second + dtobj.microsecond / 1000000
+		df.loc[i, "time"] = pd.Timestamp(dtobj)
+		get_writer(self.obj.get_urlpath(), ss[self.since_tag], current_session_id()).append_row(dtobj, self.row)
+		self.row = {}
+		self.get_recording().account()
 
 	def reset(self):
 		self.reset_data()
 		self.reset_id()
 
 	def to_download(self):
-		return self.get_data_df().to_csv().encode("utf-8")
+		with phase("csv export"):
+			return self.get_recording().to_csv()
+
+	def usage(self) -> dict:
+		b = get_budget()
+		memory, disk = b.usage(current_session_id())
+		total_memory, total_disk = b.usage()
+		return {"memory": memory, "disk": disk, "total_memory": total_memory,
+			"total_disk": total_disk, "limit": b.limit, "sessions": b.sessions()}
 	
 	def get_fname(self) -> str:
 		ts = ss.get(self.since_tag)
@@ -0,0 +1,188 @@
+#!/usr/bin/env python3
+
+# Latest reading per host in one shared memory segment, written by a single
+# publisher (HeadlessCollector.py --shm) and read in place by any number of
+# dashboard processes:
+#
+#   header  magic, capacity, count, pid, heartbeat and interval of the publisher
+#   slots   one per (cluster, host), appended and never moved
+#
+# Each slot has its own sequence number. The publisher makes it odd while it
+# writes the slot and even again afterwards; a reader retries when the number
+# was odd or changed while it copied the slot. Slots are found by a hash of
+# the full cluster and host names; the names stored next to it are only
+# for display and may be cut short.
+#
+# A publisher that exits, or one that replaces a segment left behind, clears
+# the magic of the old segment, so readers know to attach to the new one.
+
+import hashlib
+import os
+import threading
+import time
+from multiprocessing import resource_tracker, shared_memory
+
+import numpy
+
+default_name = "streamlit_ipmi_readings"
+default_capacity = 4096
+magic = 0x50574d32
+# a segment whose publisher beat more recently than this, or three of its intervals, is in use
+stale_after = 30.0
+
+header_dtype = numpy.dtype([
+	("magic", "<u4"), ("capacity", "<u4"), ("count", "<u4"), ("pid", "<u4"), ("heartbeat", "<f8"), ("interval", "<f8")], align=True)
+slot_dtype = numpy.dtype([
+	("seq", "<u8"), ("key", "<u8"), ("t", "<f8"), ("power", "<f8"), ("valid", "u1"),
+	("cluster", "S32"), ("host", "S64"), ("error", "S96")], align=True)
+
+def slot_key(cluster:str, host:str) -> int:
+	return int.from_bytes(hashlib.blake2b(f"{cluster}\n{host}".encode(), digest_size=8).digest(), "little")
+
+def fit(text:str, n:int) -> bytes:
+	# cut at a character boundary so that the bytes still decode
+	return text.encode()[:n].decode(errors="ignore").encode()
+
+class SharedReadingTable(object):
+	def __init__(self, shm:shared_memory.SharedMemory, owner:bool):
+		self.shm = shm
+		self.owner = owner
+		self.header = numpy.ndarray((1,), dtype=header_dtype, buffer=shm.buf)[0:1]
+		if self.header["magic"][0] != magic:
+			raise ValueError(f"{shm.name} is not a reading table")
+		capacity = int(self.header["capacity"][0])
+		self.slots = numpy.ndarray((capacity,), dtype=slot_dtype, buffer=shm.buf, offset=header_dtype.itemsize)
+		self.index = {}
+
+	@classmethod
+	def create(cls, name:str=default_name, capacity:int=default_capacity, interval:float=1.0):
+		size = header_dtype.itemsize + capacity * slot_dtype.itemsize
+		try:
+			shm = shared_memory.SharedMemory(name=name, create=True, size=size)
+		except FileExistsError:
+			old = shared_memory.SharedMemory(name=name)
+			if old.size >= header_dtype.itemsize:
+				header = numpy.ndarray((1,), dtype=header_dtype, buffer=old.buf)
+				age = time.time() - float(header["heartbeat"][0])
+				if header["magic"][0] == magic and age < max(stale_after, 3 * float(header["interval"][0])):
+					pid = int(header["pid"][0])
+					del header
+					old.close()
+					raise FileExistsError(f"{name} is published by pid {pid}, last {age:.0f} s ago")
+				# left behind by a publisher that did not exit cleanly
+				header["magic"] = 0
+				del header
+			old.close()
+			old.unlink()
+			shm = shared_memory.SharedMemory(name=name, create=True, size=size)
+		header = numpy.ndarray((1,), dtype=header_dtype, buffer=shm.buf)
+		header[0] = (magic, capacity, 0, os.getpid(), time.time(), interval)
+		del header
+		return cls(shm, True)
+
+	@classmethod
+	def attach(cls, name:str=default_name):
+		shm = shared_memory.SharedMemory(name=name)
+		# the resource tracker would unlink the segment when this reader exits
+		resource_tracker.unregister(shm._name, "shared_memory")
+		return cls(shm, False)
+
+	def close(self):
+		if self.owner:
+			# readers still mapping this segment attach again
+			self.header["magic"] = 0
+		self.header = None
+		self.slots = None
+		self.shm.close()
+		if self.owner:
+			self.shm.unlink()
+
+	def retired(self) -> bool:
+		return self.header["magic"][0] != magic
+
+	def refresh_index(self):
+		count = int(self.header["count"][0])
+		for i in range(len(self.index), count):
+			self.index[int(self.slots["key"][i])] = i
+
+	def slot_of(self, cluster:str, host:str) -> int|None:
+		key = slot_key(cluster, host)
+		if not key in self.index:
+			self.refresh_index()
+		return self.index.get(key)
+
+	def publish(self, readings:list):
+		slots = self.slots
+		for cluster, host, t, power, error in readings:
+			i = self.slot_of(cluster, host)
+			if i is None:
+				i = len(self.index)
+				if i >= len(slots):
+					continue
+				key = slot_key(cluster, host)
+				slots["key"][i] = key
+				slots["cluster"][i] = fit(cluster, 32)
+				slots["host"][i] = fit(host, 64)
+				# readers only look at slots below count, so the key is complete
+				self.header["count"] = i + 1
+				self.index[key] = i
+			slots["seq"][i] += 1
+			slots["t"][i] = t
+			slots["valid"][i] = power is not None
+			slots["power"][i] = power if power is not None else numpy.nan
+			slots["error"][i] = fit(error or "", 96)
+			slots["seq"][i] += 1
+		self.header["heartbeat"] = time.time()
+
+	def read_slot(self, i:int, retries:int=1000):
+		slots = self.slots
+		for n in range(retries):
+			seq = int(slots["seq"][i])
+			if seq & 1:
+				time.sleep(0)
+				continue
+			row = slots[i].copy()
+			if int(slots["seq"][i]) == seq:
+				return row
+		return None
+
+	def get(self, cluster:str, host:str) -> dict|None:
+		i = self.slot_of(cluster, host)
+		if i is None:
+			return None
+		row = self.read_slot(i)
+		if row is None or row["seq"] == 0:
+			return None
+		power = float(row["power"]) if row["valid"] else None
+		if power is not None and power.is_integer():
+			power = int(power)
+		return {"t": float(row["t"]), "power": power, "error": row["error"].decode() or None, "agent": "shared memory"}
+
+	def snapshot(self) -> numpy.ndarray:
+		count = int(self.header["count"][0])
+		seq = self.slots["seq"][:count].copy()
+		rows = self.slots[:count].copy()
+		# slots written while copying are read again one by one
+		for i in numpy.nonzero((seq & 1) | (self.slots["seq"][:count] != seq))[0]:
+			row = self.read_slot(i)
+			if row is not None:
+				rows[i] = row
+		return rows
+
+
+shared_table = None
+shared_table_lock = threading.Lock()
+
+def get_shared_table(name:str=default_name) -> SharedReadingTable|None:
+	global shared_table
+	with shared_table_lock:
+		if shared_table is not None and shared_table.retired():
+			# the publisher exited or a new one replaced the segment under the same name;
+			# the old mapping is left to the garbage collector as other sessions may still hold it
+			shared_table = None
+		if shared_table is None:
+			try:
+				shared_table = SharedReadingTable.attach(name)
+			except (FileNotFoundError, ValueError):
+				return None
+		return shared_table
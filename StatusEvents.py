@@ -0,0 +1,104 @@
+#!/usr/bin/env python3
+
+# Changes of host status and power as one stream of events for all sessions:
+# a host went down, its OS came up, its power changed (by power_delta or more when
+# its cluster sets one), or it reports a new error. Other detectors add their own kinds
+# with publish(). Every event gets a sequence
+# number; a page keeps the number it has seen and asks for the hosts changed
+# since, so it redraws only those. The latest history_size events are kept.
+
+import collections
+import threading
+import time
+
+history_size = 5000
+# watts; 0 makes every change of the reading an event
+default_power_delta = 0.0
+
+def is_number(x) -> bool:
+	return isinstance(x, (int, float)) and not isinstance(x, bool)
+
+
+class StatusEventStream(object):
+	def __init__(self, size:int=history_size):
+		self.events = collections.deque(maxlen=size)
+		self.seq = 0
+		self.status = {}
+		self.power = {}
+		self.lock = threading.Lock()
+
+	def append_locked(self, cluster:str, host:str, kind:str, old, new):
+		self.seq += 1
+		self.events.append({"seq": self.seq, "t": time.time(), "cluster": cluster, "host": host, "kind": kind, "old": old, "new": new})
+
+	def publish(self, cluster:str, host:str, kind:str, old, new):
+		with self.lock:
+			self.append_locked(cluster, host, kind, old, new)
+
+	def update_status(self, cluster:str, host:str, state:str) -> bool:
+		if not state:
+			return False
+		with self.lock:
+			old, since = self.status.get((cluster, host), (None, None))
+			if old == state:
+				return False
+			self.status[(cluster, host)] = (state, time.time())
+			# the first status seen of a host is not a change
+			if old is not None:
+				self.append_locked(cluster, host, "status", old, state)
+			return True
+
+	def status_since(self, cluster:str, host:str) -> float|None:
+		# when the status of the host last changed, or was first seen
+		with self.lock:
+			return self.status.get((cluster, host), (None, None))[1]
+
+	def update_power(self, cluster:str, host:str, power, delta:float=default_power_delta) -> bool:
+		# power is watts, or the error text shown instead
+		if power is None:
+			return False
+		with self.lock:
+			key = (cluster, host)
+			old = self.power.get(key)
+			if old is None:
+				self.power[key] = power
+				return True
+			if old == power:
+				return False
+			if is_number(old) and is_number(power):
+				# the reference moves only with an event, so a slow drift adds up to one
+				if abs(power - old) < delta:
+					return False
+				kind = "power"
+			else:
+				kind = "error" if not is_number(power) else "recovered"
+			self.power[key] = power
+			self.append_locked(cluster, host, kind, old, power)
+			return True
+
+	def since(self, cursor:int, cluster:str|None=None) -> tuple:
+		# (events after cursor, whether some were already dropped, the new cursor)
+		with self.lock:
+			overflow = bool(self.events) and self.events[0]["seq"] > cursor + 1
+			events = [e for e in self.events if e["seq"] > cursor and (cluster is None or e["cluster"] == cluster)]
+			return events, overflow, self.seq
+
+	def changed_hosts(self, cursor:int, cluster:str) -> tuple:
+		events, overflow, cursor = self.since(cursor, cluster)
+		return set(e["host"] for e in events), overflow, cursor
+
+	def latest(self, cluster:str|None=None, n:int=100) -> list:
+		with self.lock:
+			events = [e for e in reversed(self.events) if cluster is None or e["cluster"] == cluster]
+		return events[:n]
+
+
+stream = None
+stream_lock = threading.Lock()
+
+def get_event_stream() -> StatusEventStream:
+	global stream
+	with stream_lock:
+		if stream is None:
+			stream = StatusEventStream()
+		return stream
@@ -46,6 +46,102 @@ def read_dhcpleases():
 	table.sort_values('IP Address', inplace=True)
 	table.reset_index(inplace=True, drop=True)
 
+def known_bmcs() -> set:
+	from ClusterBasePage import ClusterBasePage
+	known = set()
+	for f in Path(".").glob("*.ini"):
+		known |= {d["ipmi_ip"] for d in ClusterBasePage(f).get_hosts_dic()}
+	return known
+
+def get_device_ids(ips:list, user:str, passwd:str, iftype:str) -> dict:
+	from concurrent.futures import ThreadPoolExecutor
+	from IPMIManager import IPMIManager
+	def get(ip):
+		try:
+			return ip, IPMIManager(ip, user, passwd, iftype).getDeviceID()
+		except Exception as e:
+			return ip, type(e).__name__
+	with ThreadPoolExecutor(max_workers=64) as executor:
+		return dict(executor.map(get, ips))
+
+def discover_bmcs(ips:list, device_id:bool, user:str, passwd:str, iftype:str) -> list:
+	from RMCPPing import presence_ping, vendor_names
+	pongs = presence_ping(ips)
+	ids = get_device_ids(sorted(pongs), user, passwd, iftype) if device_id else {}
+	names = {}
+	if table is not None and len(table) > 0:
+		names = {str(ip): host for ip, host in zip(table["IP Address"], table["Host name"])}
+	known = known_bmcs()
+	rows = []
+	for ip in sorted(pongs, key=ipaddress.ip_address):
+		pong = pongs[ip]
+		r = {"IP Address": ip, "Host name": names.get(ip, ""), "Vendor": pong["vendor"] or "",
+			"IPMI": pong["ipmi"], "RTT (ms)": round(pong["rtt"] * 1000, 1), "Device ID": "", "In ini": ip in known}
+		dev = ids.get(ip)
+		if isinstance(dev, str):
+			r["Device ID"] = dev
+		elif dev is not None:
+			r["Vendor"] = vendor_names.get(dev.manufacturer_id, f"IANA {dev.manufacturer_id}")
+			r["Device ID"] = f"product {dev.product_id}, firmware {dev.fw_revision}"
+		rows.append(r)
+	return rows
+
+def suggest_ini(rows:list, user:str, iftype:str) -> str:
+	lines = []
+	for r in rows:
+		if r["In ini"]:
+			continue
+		name = r["Host name"] or "bmc-" + r["IP Address"].replace(".", "-")
+		lines += [f"[{name}]", "IP=", f"IPMI_IP={r['IP Address']}", f"IPMI_USER={user}", "IPMI_PASS=", f"IF_TYPE={iftype}"]
+		if r["Vendor"] or r["Device ID"]:
+			lines.append(f"NOTE={r['Vendor']} {r['Device ID']}".strip())
+		lines.append("")
+	return "\n".join(lines)
+
+# a /22 is 1022 addresses; wider networks are refused rather than pinged address by address
+max_sweep_addresses = 1024
+
+def bmc_discovery():
+	st.subheader("BMC discovery")
+	st.caption("Leased addresses, and optionally a whole network, are probed with an RMCP presence ping on UDP 623. "
+		"Get Device ID needs credentials and identifies the vendor and product.")
+	with st.container(horizontal=True, vertical_alignment="bottom", horizontal_alignment="left"):
+		network = st.text_input("Also sweep network", placeholder="e.g. 192.168.8.0/22")
+		device_id = st.toggle("Get Device ID")
+		user = st.text_input("IPMI user", disabled=not device_id)
+		passwd = st.text_input("IPMI password", type="password", disabled=not device_id)
+		iftype = st.selectbox("Interface", ["lanplus", "lan"], disabled=not device_id)
+		start = st.button("Discover", icon=":material/search:")
+
+	if start:
+		ips = [str(ip) for ip in table["IP Address"] if ip.version == 4] if table is not None and len(table) > 0 else []
+		if network:
+			try:
+				net = ipaddress.ip_network(network.strip(), strict=False)
+			except ValueError as e:
+				st.error(str(e))
+				return
+			if net.num_addresses > max_sweep_addresses:
+				st.error(f"{net} has {net.num_addresses} addresses; sweep at most {max_sweep_addresses} (a /22 for IPv4) at a time.")
+				return
+			ips += [str(ip) for ip in net.hosts()]
+		ips = sorted(set(ips), key=ipaddress.ip_address)
+		t0 = datetime.datetime.now()
+		with st.spinner(f"Probing {len(ips)} addresses..."):
+			rows = discover_bmcs(ips, device_id, user, passwd, iftype)
+		st.session_state["bmc_discovery"] = (rows, len(ips), (datetime.datetime.now() - t0).total_seconds(), user, iftype)
+
+	if not "bmc_discovery" in st.session_state:
+		return
+	rows, n, seconds, user, iftype = st.session_state["bmc_discovery"]
+	st.text(f"{len(rows)} BMCs answered out of {n} addresses in {seconds:.1f} sec.")
+	if rows:
+		st.dataframe(pandas.DataFrame(rows), hide_index=True, width="stretch")
+	suggestion = suggest_ini(rows, user, iftype)
+	if suggestion:
+		st.text("Suggested ini entries for BMCs not in any ini file (fill in IP and IPMI_PASS):")
+		st.code(suggestion, language="ini")
+
 def dhcp_monitor():
 	read_dhcpleases()
 	st.title("DHCP leases")
@@ -54,6 +150,7 @@ def dhcp_monitor():
 		if st.button("Refresh"):
 			st.rerun()
 	st.table(table)
+	bmc_discovery()
 
 class UDCHPMonitor(object):
 	def __init__(self):
@@ -0,0 +1,225 @@
+#!/usr/bin/env python3
+
+import heapq
+import math
+import threading
+import time
+from collections import deque
+
+import numpy
+
+default_windows = {"1 min": 60.0, "15 min": 900.0, "1 h": 3600.0}
+# seconds without a reading before another session takes over the feeding
+feeder_timeout = 30.0
+
+class RollingQuantile(object):
+	# the q-quantile of a window in O(log n) per sample: a max-heap of the lowest
+	# ceil(q * n) values and a min-heap of the rest; removed values are dropped
+	# lazily once they reach the top of their heap
+	def __init__(self, q:float):
+		self.q = q
+		self.lo = []
+		self.hi = []
+		self.lo_n = 0
+		self.hi_n = 0
+		self.removed = {}
+
+	def prune(self, heap:list, sign:float):
+		while heap and self.removed.get(sign * heap[0], 0):
+			v = sign * heapq.heappop(heap)
+			self.removed[v] -= 1
+			if not self.removed[v]:
+				del self.removed[v]
+
+	def rebalance(self):
+		k = max(1, math.ceil(self.q * (self.lo_n + self.hi_n))) if self.lo_n + self.hi_n else 0
+		while self.lo_n > k:
+			heapq.heappush(self.hi, -heapq.heappop(self.lo))
+			self.lo_n -= 1
+			self.hi_n += 1
+			self.prune(self.lo, -1.0)
+		while self.lo_n < k:
+			heapq.heappush(self.lo, -heapq.heappop(self.hi))
+			self.lo_n += 1
+			self.hi_n -= 1
+			self.prune(self.hi, 1.0)
+
+	def add(self, v:float):
+		if self.lo_n and v > -self.lo[0]:
+			heapq.heappush(self.hi, v)
+			self.hi_n += 1
+		else:
+			heapq.heappush(self.lo, -v)
+			self.lo_n += 1
+		self.rebalance()
+
+	def remove(self, v:float):
+		self.removed[v] = self.removed.get(v, 0) + 1
+		if v <= -self.lo[0]:
+			self.lo_n -= 1
+			self.prune(self.lo, -1.0)
+		else:
+			self.hi_n -= 1
+			self.prune(self.hi, 1.0)
+		self.rebalance()
+
+	def value(self) -> float:
+		return -self.lo[0]
+
+
+class RollingWindow(object):
+	def __init__(self, length:float):
+		self.length = length
+		self.head = 0
+		self.n = 0
+		# Welford's running mean and sum of squared deviations, which unlike
+		# sumsq/n - mean² do not cancel out at hundreds of watts with a small spread
+		self.mean = 0.0
+		self.m2 = 0.0
+		# monotonic deques of sample sequence numbers for O(1) amortized min/max
+		self.minq = deque()
+		self.maxq = deque()
+		self.p95 = RollingQuantile(0.95)
+
+	def add(self, buf, seq:int, v:float):
+		self.n += 1
+		d = v - self.mean
+		self.mean += d / self.n
+		self.m2 += d * (v - self.mean)
+		while self.minq and buf.value(self.minq[-1]) >= v:
+			self.minq.pop()
+		self.minq.append(seq)
+		while self.maxq and buf.value(self.maxq[-1]) <= v:
+			self.maxq.pop()
+		self.maxq.append(seq)
+		self.p95.add(v)
+
+	def evict(self, buf, t_now:float):
+		while self.head < buf.seq and buf.time(self.head) < t_now - self.length:
+			v = buf.value(self.head)
+			self.n -= 1
+			if self.n:
+				mean = self.mean
+				self.mean -= (v - mean) / self.n
+				self.m2 -= (v - mean) * (v - self.mean)
+			if self.minq and self.minq[0] == self.head:
+				self.minq.popleft()
+			if self.maxq and self.maxq[0] == self.head:
+				self.maxq.popleft()
+			self.p95.remove(v)
+			self.head += 1
+		if self.n == 0:
+			self.mean = 0.0
+			self.m2 = 0.0
+
+	def stats(self, buf) -> dict:
+		if self.n == 0:
+			return {"n": 0, "min": None, "max": None, "mean": None, "stddev": None, "p95": None}
+		mean = self.mean
+		var = max(0.0, self.m2 / self.n)
+		return {
+			"n": self.n,
+			"min": float(buf.value(self.minq[0])),
+			"max": float(buf.value(self.maxq[0])),
+			"mean": round(mean, 3),
+			"stddev": round(math.sqrt(var), 3),
+			"p95": float(self.p95.value()),
+		}
+
+
+class SampleRingBuffer(object):
+	def __init__(self, capacity:int=256):
+		self.t = numpy.empty(capacity, dtype=numpy.float64)
+		self.v = numpy.empty(capacity, dtype=numpy.float64)
+		self.seq = 0
+
+	def capacity(self) -> int:
+		return len(self.t)
+
+	def time(self, seq:int) -> float:
+		return self.t[seq % len(self.t)]
+
+	def value(self, seq:int) -> float:
+		return self.v[seq % len(self.v)]
+
+	def append(self, t:float, v:float, oldest:int) -> int:
+		if self.seq - oldest >= len(self.t):
+			self.grow(oldest)
+		i = self.seq % len(self.t)
+		self.t[i] = t
+		self.v[i] = v
+		self.seq += 1
+		return self.seq - 1
+
+	def grow(self, oldest:int):
+		cap = len(self.t) * 2
+		t = numpy.empty(cap, dtype=numpy.float64)
+		v = numpy.empty(cap, dtype=numpy.float64)
+		seqs = numpy.arange(oldest, self.seq)
+		t[seqs % cap] = self.t[seqs % len(self.t)]
+		v[seqs % cap] = self.v[seqs % len(self.v)]
+		self.t = t
+		self.v = v
+
+
+class HostWindowStatistics(object):
+	def __init__(self, windows:dict):
+		self.buf = SampleRingBuffer()
+		self.windows = {name: RollingWindow(length) for name, length in windows.items()}
+
+	def put(self, t:float, v:float):
+		oldest = min(w.head for w in self.windows.values())
+		seq = self.buf.append(t, v, oldest)
+		for w in self.windows.values():
+			w.add(self.buf, seq, v)
+			w.evict(self.buf, t)
+
+	def stats(self, window:str, t_now:float) -> dict:
+		w = self.windows[window]
+		w.evict(self.buf, t_now)
+		return w.stats(self.buf)
+
+
+class ClusterWindowStatistics(object):
+	def __init__(self, windows:dict=default_windows):
+		self.windows = windows
+		self.hosts = {}
+		self.feeder = None
+		self.fed_at = None
+		self.lock = threading.Lock()
+
+	def put(self, host:str, power, feeder:str):
+		# one session at a time feeds the statistics, so each host gets one sample per collection
+		t = time.monotonic()
+		with self.lock:
+			if feeder != self.feeder and self.fed_at is not None and t - self.fed_at < feeder_timeout:
+				return
+			self.feeder = feeder
+			self.fed_at = t
+			if isinstance(power, bool) or not isinstance(power, (int, float)):
+				return
+			if not host in self.hosts:
+				self.hosts[host] = HostWindowStatistics(self.windows)
+			self.hosts[host].put(t, float(power))
+
+	def table(self, hosts:list, window:str) -> list:
+		rows = []
+		t_now = time.monotonic()
+		with self.lock:
+			for host in hosts:
+				if host in self.hosts:
+					s = self.hosts[host].stats(window, t_now)
+				else:
+					s = RollingWindow(0).stats(None)
+				rows.append(dict(host=host, **s))
+		return rows
+
+
+cluster_statistics = {}
+cluster_statistics_lock = threading.Lock()
+
+def get_window_statistics(name:str) -> ClusterWindowStatistics:
+	with cluster_statistics_lock:
+		if not name in cluster_statistics:
+			cluster_statistics[name] = ClusterWindowStatistics()
+		return cluster_statistics[name]
@@ -1,12 +1,33 @@
 #!/usr/bin/env python3
 
 import streamlit as st
+import importlib
 from pathlib import Path
 
 from page_index import index, debug_state
-from UDHCPMonitor import UDCHPMonitor
-from ClusterWattPage import ClusterWattPage
-from ClusterPowerPage import ClusterPowerPage, readme1st
+from ClusterBasePage import ClusterBasePage
+import RerunProfiler
+from RerunProfiler import phase
+
+# Page modules pull in pandas, numpy, pyipmi and pings. They are imported
+# when a page is rendered for the first time, not at startup.
+def lazy_function(module_name, function_name):
+	def render():
+		with phase("import"):
+			module = importlib.import_module(module_name)
+		getattr(module, function_name)()
+	render.__name__ = function_name
+	return render
+
+def lazy_cluster_page(module_name, class_name, fname, urlpath_prefix):
+	def render():
+		with phase("import"):
+			module = importlib.import_module(module_name)
+		with phase("ini parsing"):
+			page = getattr(module, class_name)(fname)
+		page.set_urlpath_prefix(urlpath_prefix)
+		page.render()
+	return render
 
 debug_pages = False
 
@@ -14,6 +35,17 @@ def check_debug():
 	global debug_pages
 	if Path("./DEBUG").exists():
 		debug_pages = True
+		RerunProfiler.enable()
+
+def check_collector():
+	if Path("./COLLECTOR").exists():
+		from CollectorAgent import get_receiver, parse_address, read_secret
+		get_receiver(parse_address(Path("./COLLECTOR").read_text()), read_secret())
+
+def check_recording_budget():
+	if Path("./RECORDING_BUDGET").exists():
+		from RecordingBudget import set_budget_mb
+		set_budget_mb(float(Path("./RECORDING_BUDGET").read_text()))
 
 def get_ini_files():
 	curdir = Path(".")
@@ -21,53 +53,60 @@ def get_ini_files():
 	st.session_state["inifiles_name"] = inifiles_name
 	return sorted(inifiles_name)
 
-def get_cluster_watt_page_list():
+def get_cluster_page_list(module_name, class_name, urlpath_prefix):
 	inifiles_name = get_ini_files()
-	cluster_objlist = []
+	pages = []
 	for fname in inifiles_name:
-		cluster_objlist.append(ClusterWattPage(fname))
-	pmpages = []
-	for p in cluster_objlist:
-		p.set_urlpath_prefix("wattmon_")
-		pmpages.append(st.Page(p.render, title=p.get_title(), url_path=p.get_urlpath()))
-	return pmpages
+		p = ClusterBasePage(fname)
+		p.set_urlpath_prefix(urlpath_prefix)
+		render = lazy_cluster_page(module_name, class_name, fname, urlpath_prefix)
+		pages.append(st.Page(render, title=p.title_str, url_path=p.get_urlpath()))
+	return pages
+
+def get_cluster_watt_page_list():
+	return get_cluster_page_list("ClusterWattPage", "ClusterWattPage", "wattmon_")
 
 def get_cluster_power_page_list():
-	inifiles_name = get_ini_files()
-	cluster_objlist = []
-	for fname in inifiles_name:
-		cluster_objlist.append(ClusterPowerPage(fname))
-	pmpages = []
-	for p in cluster_objlist:
-		p.set_urlpath_prefix("powerman_")
-		pmpages.append(st.Page(p.render, title=p.get_title(), url_path=p.get_urlpath()))
-	return pmpages
+	return get_cluster_page_list("ClusterPowerPage", "ClusterPowerPage", "powerman_")
 
-def main():
-	check_debug()
+def get_cluster_event_page_list():
+	return get_cluster_page_list("ClusterEventPage", "ClusterEventPage", "events_")
 
+def build_navigation():
 	pmpages = get_cluster_power_page_list()
 	pcpages = get_cluster_watt_page_list()
-	pmpages.insert(0, st.Page(readme1st, title="Readme 1st"))
-
-	dhcpmon = UDCHPMonitor()
+	pmpages.insert(0, st.Page(lazy_function("ClusterPowerPage", "readme1st"), title="Readme 1st"))
 
 	navi_structure = {
 		"": [
 			st.Page(index, title="Dashboard Home"),
 		],
 		"Network": [
-			st.Page(dhcpmon.render, title=dhcpmon.get_title()),
+			st.Page(lazy_function("UDHCPMonitor", "dhcp_monitor"), title="DHCP leases", url_path="dhcpleases"),
 		],
 		"Server Power Management": pmpages,
-		"Server Watt Monitor": pcpages
+		"Server Watt Monitor": pcpages,
+		"Server Events": get_cluster_event_page_list(),
+		"Analysis": [
+			st.Page(lazy_function("RecordingAnalysisPage", "analysis"), title="Recordings", url_path="recordings"),
+		],
 	}
 
 	if debug_pages:
 		navi_structure["Etc"] = [st.Page(debug_state, title="Debug Session State")]
 
-	pg = st.navigation(navi_structure)
-	pg.run()
+	return st.navigation(navi_structure)
+
+def main():
+	check_debug()
+	with RerunProfiler.rerun(""):
+		check_collector()
+		check_recording_budget()
+
+		with phase("navigation"):
+			pg = build_navigation()
+		RerunProfiler.set_page(pg.url_path or pg.title)
+		pg.run()
 
 if __name__=="__main__":
 	main()
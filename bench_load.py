@@ -0,0 +1,321 @@
+#!/usr/bin/env python3
+
+# Rerun load test. N simulated sessions, each an AppTest of app.py on its own
+# thread, rerun the Dashboard Home, the watt pages and the power pages against
+# a stub IPMI backend in this process, the way one Streamlit server serves
+# many browsers. The stub answers every BMC after --bmc-latency seconds.
+#
+# AppTest can not follow the st.rerun() of auto refresh, so every session
+# reruns its page every --interval seconds instead, with the host toggles on.
+#
+#   python bench_load.py --sessions 1,4,16 --save bench_load.json
+#   python bench_load.py --sessions 1,4,16 --baseline bench_load.json --tolerance 0.25
+
+import argparse
+import json
+import os
+import random
+import resource
+import sys
+import tempfile
+import threading
+import time
+import types
+from pathlib import Path
+
+repo = Path(__file__).resolve().parent
+bmc_latency = 0.02
+
+def stub_ipmi():
+	# replaces python-ipmi and pings in this process only
+	pyipmi = types.ModuleType("pyipmi")
+	errors = types.ModuleType("pyipmi.errors")
+	class IpmiConnectionError(Exception): pass
+	class CompletionCodeError(Exception):
+		def __init__(self, cc=0xc1):
+			super().__init__(cc)
+			self.cc = cc
+	class DecodingError(Exception): pass
+	errors.IpmiConnectionError = IpmiConnectionError
+	errors.CompletionCodeError = CompletionCodeError
+	errors.DecodingError = DecodingError
+
+	class Session(object):
+		def set_session_type_rmcp(self, *args, **kwargs): pass
+		def set_auth_type_user(self, *args, **kwargs): pass
+		def set_priv_level(self, *args): pass
+		def establish(self):
+			time.sleep(bmc_latency)
+
+	class PowerReading(object):
+		def __init__(self):
+			self.current_power = random.randint(100, 400)
+			self.average_power = 250
+			self.minimum_power = 100
+			self.maximum_power = 400
+			self.period = 60
+
+	class ChassisStatus(object):
+		power_on = True
+
+	class Connection(object):
+		def __init__(self):
+			self.session = Session()
+		def get_power_reading(self, mode, attributes=0):
+			time.sleep(bmc_latency)
+			return PowerReading()
+		def get_chassis_status(self):
+			time.sleep(bmc_latency)
+			return ChassisStatus()
+		def get_device_id(self):
+			time.sleep(bmc_latency)
+			return None
+		def send_message_with_name(self, name, **kwargs):
+			raise CompletionCodeError(0xc1)
+		def get_sel_entry(self, record_id, reservation):
+			raise CompletionCodeError(0xcb)
+		def get_sel_reservation_id(self):
+			return 1
+
+	pyipmi.errors = errors
+	pyipmi.create_connection = lambda interface: Connection()
+	interfaces = types.ModuleType("pyipmi.interfaces")
+	interfaces.create_interface = lambda *args, **kwargs: None
+	sdr = types.ModuleType("pyipmi.sdr")
+	class SdrFullSensorRecord(object): pass
+	class SdrCommon(object):
+		@staticmethod
+		def from_data(data, next_id=None): return SdrFullSensorRecord()
+	sdr.SdrCommon = SdrCommon
+	sdr.SdrFullSensorRecord = SdrFullSensorRecord
+	sel = types.ModuleType("pyipmi.sel")
+	class SelInfo(object):
+		def __init__(self, rsp): pass
+	class SelEntry(object):
+		TYPE_SYSTEM_EVENT = 0x02
+	sel.SelInfo = SelInfo
+	sel.SelEntry = SelEntry
+	pyipmi.interfaces, pyipmi.sdr, pyipmi.sel = interfaces, sdr, sel
+
+	pings = types.ModuleType("pings")
+	class Reply(object):
+		def is_reached(self): return True
+	class Ping(object):
+		def ping(self, ip): return Reply()
+	pings.Ping = Ping
+
+	for name, module in (("pyipmi", pyipmi), ("pyipmi.errors", errors), ("pyipmi.interfaces", interfaces),
+			("pyipmi.sdr", sdr), ("pyipmi.sel", sel), ("pings", pings)):
+		sys.modules[name] = module
+
+	import RMCPPing, BMCLiveness
+	pong = lambda ips, *args, **kwargs: {str(ip): {"tag": 0, "enterprise": 343, "vendor": "Intel", "ipmi": True, "rtt": 0.001} for ip in ips}
+	RMCPPing.presence_ping = pong
+	BMCLiveness.presence_ping = pong
+
+def share_runtime():
+	# AppTest installs a mock Runtime for the length of one run and removes it
+	# afterwards, which breaks the runs of the other sessions. Keep the last
+	# one installed instead, as a server has one Runtime for all sessions.
+	from streamlit.runtime import Runtime
+	last = [None]
+	def instance(cls):
+		if cls._instance is not None:
+			last[0] = cls._instance
+		if last[0] is None:
+			raise RuntimeError("Runtime hasn't been created!")
+		return last[0]
+	Runtime.instance = classmethod(instance)
+	Runtime.exists = classmethod(lambda cls: cls._instance is not None or last[0] is not None)
+
+def write_inifiles(workdir:Path, clusters:int, hosts:int):
+	for c in range(clusters):
+		lines = ["[Page]", f"title = Load test {c}", ""]
+		for h in range(hosts):
+			lines += [f"[c{c}h{h}]", f"ip = 127.0.{c}.{h + 1}", f"ipmi_ip = 10.{c}.{h // 250}.{h % 250 + 1}",
+				"ipmi_user = admin", "ipmi_pass = admin", "if_type = lanplus", ""]
+		(workdir / f"load{c}.ini").write_text("\n".join(lines))
+
+def select_page(at, url_path:str):
+	if url_path == "":
+		return
+	if hasattr(at, "_registered_pages"):
+		at._page_hash = [h for h, info in at._registered_pages.items() if info.get("url_pathname") == url_path][0]
+	else:
+		from streamlit.util import calc_md5
+		at._page_hash = calc_md5(url_path)
+
+def turn_on_hosts(at, record:bool):
+	changed = False
+	for t in at.toggle:
+		key = t.key or ""
+		if key.endswith("-skip") or (record and t.label == "Record data"):
+			if not t.value:
+				t.set_value(True)
+				changed = True
+	return changed
+
+def rss_bytes() -> int:
+	try:
+		return int(Path("/proc/self/statm").read_text().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+	except (OSError, ValueError):
+		return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+def session_loop(at, url_path:str, args, stop:threading.Event, out:dict):
+	out["page"] = url_path or "home"
+	out["latency"] = []
+	out["errors"] = []
+	try:
+		rerun_loop(at, url_path, args, stop, out)
+	except Exception as e:
+		out["errors"].append(f"{type(e).__name__}: {e}")
+
+def rerun_loop(at, url_path:str, args, stop:threading.Event, out:dict):
+	at.run()
+	select_page(at, url_path)
+	at.run()
+	if turn_on_hosts(at, args.record):
+		at.run()
+	while not stop.is_set() and len(out["latency"]) < args.reruns:
+		t0 = time.perf_counter()
+		try:
+			at.run()
+		except Exception as e:
+			out["errors"].append(f"{type(e).__name__}: {e}")
+			continue
+		out["latency"].append(time.perf_counter() - t0)
+		out["errors"] += [str(x.value) for x in at.exception]
+		stop.wait(max(0.0, args.interval - (time.perf_counter() - t0)))
+
+def percentile(samples:list, p:float) -> float:
+	s = sorted(samples)
+	return s[min(len(s) - 1, int(round(p / 100 * (len(s) - 1))))]
+
+def run_round(n:int, pages:list, args) -> dict:
+	import streamlit.logger
+	from streamlit.testing.v1 import AppTest
+	# the runs reload the config and with it the log level
+	streamlit.logger.set_log_level("error")
+	stop = threading.Event()
+	outs = [{} for i in range(n)]
+	threads = []
+	for i in range(n):
+		# AppTest sets up its session state outside a script thread, so in the main thread
+		url_path = pages[i % len(pages)]
+		at = AppTest.from_file(str(repo / "app.py"), default_timeout=args.timeout)
+		if url_path.startswith("powerman_"):
+			at.session_state["auto_status"] = True
+		threads.append(threading.Thread(target=session_loop, args=(at, url_path, args, stop, outs[i]), daemon=True))
+	rss0 = rss_bytes()
+	cpu0 = time.process_time()
+	t0 = time.perf_counter()
+	for t in threads:
+		t.start()
+	for t in threads:
+		t.join(max(0.0, t0 + args.duration - time.perf_counter()))
+	stop.set()
+	for t in threads:
+		t.join()
+	wall = time.perf_counter() - t0
+	cpu = time.process_time() - cpu0
+	rss = rss_bytes() - rss0
+
+	latency = [x for o in outs for x in o.get("latency", [])]
+	reruns = max(1, len(latency))
+	r = {
+		"sessions": n,
+		"reruns": len(latency),
+		"p50": percentile(latency, 50) if latency else None,
+		"p90": percentile(latency, 90) if latency else None,
+		"p99": percentile(latency, 99) if latency else None,
+		"max": max(latency) if latency else None,
+		"cpu per rerun": cpu / reruns,
+		"cpu per session": cpu / n,
+		"cpu utilization": cpu / wall,
+		"rss per session": rss / n,
+		"pages": {},
+		"errors": sorted(set(e for o in outs for e in o.get("errors", []))),
+	}
+	for page in sorted(set(o.get("page", "?") for o in outs)):
+		samples = [x for o in outs if o.get("page") == page for x in o["latency"]]
+		if samples:
+			r["pages"][page] = {"p50": percentile(samples, 50), "p99": percentile(samples, 99)}
+	return r
+
+def print_round(r:dict):
+	ms = lambda s: f"{s * 1000:8.1f}" if s is not None else "       -"
+	print(f"{r['sessions']:4} sessions {r['reruns']:5} reruns  p50 {ms(r['p50'])}  p90 {ms(r['p90'])}  p99 {ms(r['p99'])}  max {ms(r['max'])} ms"
+		f"  cpu/rerun {ms(r['cpu per rerun'])} ms  cpu/session {r['cpu per session']:6.2f} s"
+		f"  cpu {r['cpu utilization'] * 100:4.0f}%  rss/session {r['rss per session'] / 2**20:6.1f} MiB")
+	for page, p in r["pages"].items():
+		print(f"       {page:30} p50 {ms(p['p50'])}  p99 {ms(p['p99'])} ms")
+	for e in r["errors"][:5]:
+		print(f"       error: {e}")
+
+def main():
+	global bmc_latency
+	parser = argparse.ArgumentParser(description="Rerun the dashboard pages from many simulated sessions and report latency, CPU and memory.")
+	parser.add_argument("--sessions", default="1,4,16", help="comma separated numbers of concurrent sessions, one round each")
+	parser.add_argument("--pages", default="home,watt,power", help="pages the sessions are spread over: home, watt, power")
+	parser.add_argument("--clusters", type=int, default=2, help="number of generated ini files")
+	parser.add_argument("--hosts", type=int, default=16, help="hosts per ini file")
+	parser.add_argument("--bmc-latency", type=float, default=0.02, help="seconds the stub BMC takes per request")
+	parser.add_argument("--interval", type=float, default=1.0, help="seconds between reruns of a session")
+	parser.add_argument("--duration", type=float, default=20.0, help="seconds per round")
+	parser.add_argument("--reruns", type=int, default=1000, help="maximum reruns per session and round")
+	parser.add_argument("--timeout", type=float, default=60.0, help="AppTest timeout of one rerun")
+	parser.add_argument("--record", action="store_true", help="turn on Record data on the watt pages")
+	parser.add_argument("--save", help="write the results to this JSON file")
+	parser.add_argument("--baseline", help="compare against the results in this JSON file")
+	parser.add_argument("--tolerance", type=float, default=0.25, help="allowed slowdown against the baseline (0.25 = 25%%)")
+	args = parser.parse_args()
+	bmc_latency = args.bmc_latency
+
+	save = Path(args.save).resolve() if args.save else None
+	baseline = json.loads(Path(args.baseline).read_text()) if args.baseline else None
+	workdir = Path(tempfile.mkdtemp(prefix="bench_load_"))
+	write_inifiles(workdir, args.clusters, args.hosts)
+	os.chdir(workdir)
+	sys.path.insert(0, str(repo))
+	stub_ipmi()
+	share_runtime()
+
+	stems = [f"load{c}" for c in range(args.clusters)]
+	pages = []
+	for name in args.pages.split(","):
+		if name == "home":
+			pages.append("")
+		elif name == "watt":
+			pages += [f"wattmon_{s}" for s in stems]
+		elif name == "power":
+			pages += [f"powerman_{s}" for s in stems]
+		else:
+			parser.error(f"unknown page {name}")
+
+	print(f"{args.clusters} clusters x {args.hosts} hosts, BMC latency {args.bmc_latency * 1000:.0f} ms, rerun every {args.interval} sec., {args.duration} sec. per round")
+	# imports, SDR caches and first renders are not part of a round
+	run_round(len(pages), pages, argparse.Namespace(**dict(vars(args), duration=0.0)))
+	results = {}
+	for n in [int(x) for x in args.sessions.split(",")]:
+		r = run_round(n, pages, args)
+		print_round(r)
+		results[str(n)] = r
+
+	if save:
+		save.write_text(json.dumps(results, indent=1))
+
+	if baseline:
+		regressions = []
+		for n, r in results.items():
+			for key in ("p50", "p99", "cpu per rerun"):
+				b = baseline.get(n, {}).get(key)
+				if b and r[key] is not None and r[key] > b * (1 + args.tolerance):
+					regressions.append(f"{n} sessions {key}: {b * 1000:.1f} ms -> {r[key] * 1000:.1f} ms")
+		if regressions:
+			print("Regressions:")
+			for r in regressions:
+				print("  " + r)
+			sys.exit(1)
+
+if __name__=="__main__":
+	main()
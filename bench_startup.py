@@ -0,0 +1,89 @@
+#!/usr/bin/env python3
+
+# Import-time and first-render benchmark. Every case runs in a fresh
+# interpreter so module caches do not hide cold-start costs.
+#
+#   python bench_startup.py --save bench_startup.json
+#   python bench_startup.py --baseline bench_startup.json --tolerance 0.25
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+from pathlib import Path
+
+prelude = """
+import time, logging
+import streamlit
+logging.getLogger("streamlit").setLevel(logging.ERROR)
+t0 = time.perf_counter()
+"""
+
+cases = {
+	"import app": "import app",
+	"first run app.py (Dashboard Home)": """
+from streamlit.testing.v1 import AppTest
+t0 = time.perf_counter()
+AppTest.from_file("app.py", default_timeout=60).run()
+""",
+	"first render DHCP leases": "import UDHCPMonitor; UDHCPMonitor.dhcp_monitor()",
+	"first render Readme 1st": "import ClusterPowerPage; ClusterPowerPage.readme1st()",
+	"first render power page": """
+import ClusterPowerPage, glob
+for f in sorted(glob.glob("*.ini"))[:1]:
+	ClusterPowerPage.ClusterPowerPage(f).render()
+""",
+	"first render watt page": """
+import ClusterWattPage, glob
+for f in sorted(glob.glob("*.ini"))[:1]:
+	p = ClusterWattPage.ClusterWattPage(f)
+	p.render_init()
+	p.render_ui()
+""",
+}
+
+def run_case(code:str) -> float:
+	script = prelude + code + "\nprint(time.perf_counter() - t0)\n"
+	env = dict(os.environ, STREAMLIT_LOGGER_LEVEL="error")
+	res = subprocess.run([sys.executable, "-c", script], capture_output=True, text=True, env=env)
+	if res.returncode != 0:
+		raise RuntimeError(res.stderr.strip().splitlines()[-1])
+	return float(res.stdout.strip().splitlines()[-1])
+
+def main():
+	parser = argparse.ArgumentParser(description="Measure import time and first-render time of the dashboard pages.")
+	parser.add_argument("-n", "--repeat", type=int, default=5, help="runs per case (median is reported)")
+	parser.add_argument("--save", help="write the results to this JSON file")
+	parser.add_argument("--baseline", help="compare against the results in this JSON file")
+	parser.add_argument("--tolerance", type=float, default=0.25, help="allowed slowdown against the baseline (0.25 = 25%%)")
+	args = parser.parse_args()
+
+	results = {}
+	for name, code in cases.items():
+		try:
+			samples = [run_case(code) for i in range(args.repeat)]
+		except RuntimeError as e:
+			print(f"{name:40} failed: {e}")
+			continue
+		results[name] = statistics.median(samples)
+		print(f"{name:40} {results[name] * 1000:9.1f} ms")
+
+	if args.save:
+		Path(args.save).write_text(json.dumps(results, indent=1))
+
+	if args.baseline:
+		baseline = json.loads(Path(args.baseline).read_text())
+		regressions = []
+		for name, seconds in results.items():
+			if name in baseline and seconds > baseline[name] * (1 + args.tolerance):
+				regressions.append(f"{name}: {baseline[name] * 1000:.1f} ms -> {seconds * 1000:.1f} ms")
+		if regressions:
+			print("Regressions:")
+			for r in regressions:
+				print("  " + r)
+			sys.exit(1)
+
+if __name__=="__main__":
+	main()
@@ -6,9 +6,104 @@ def index():
 	st.title("Dashboard")
 	st.text("Welcome. Use the menu on the left to navigate.")
 
+	# imported here so that the app starts without pulling in the IPMI modules
+	from datetime import datetime
+	from FleetOverview import get_fleet_overview, default_max_age
+	from RerunProfiler import phase
+
+	st.subheader("Overview")
+	with st.container(horizontal=True, vertical_alignment="center", horizontal_alignment="left"):
+		refresh = st.button("Refresh", icon=":material/refresh:")
+		with phase("ipmi"):
+			overview = get_fleet_overview().get(force=refresh)
+		if overview.swept_at is not None:
+			st.caption(
+				f"Updated {datetime.fromtimestamp(overview.swept_at):%Y-%m-%d %H:%M:%S} "
+				f"in {overview.seconds:.1f} sec. Shared by all sessions for {default_max_age:.0f} sec.")
+		if overview.sweeping:
+			wait_for_sweep(overview)
+	if overview.swept_at is None:
+		return
+	summary = overview.summary()
+	if not summary:
+		st.text("No cluster ini files.")
+		return
+	st.dataframe(summary, hide_index=True, width="stretch")
+	errors = overview.errors()
+	if errors:
+		with st.expander(f"Hosts in error ({len(errors)})"):
+			st.dataframe(errors, hide_index=True, width="stretch")
+
+def wait_for_sweep(overview):
+	# polls without rerunning the page and reruns it once the sweep has finished
+	@st.fragment(run_every=1.0)
+	def poll():
+		if not overview.sweeping:
+			st.rerun()
+		st.caption("Querying all clusters in the background...")
+	poll()
+
 def debug_state():
 	st.title("Debug Session State")
 
+	rerun_profile()
+	power_backend_table()
+
+	st.subheader("Session state")
 	sorted_keys = sorted(st.session_state)
 	sorted_dict_by_key = {k: st.session_state[k] for k in sorted_keys}
 	st.write(sorted_dict_by_key)
+
+def power_backend_table():
+	import pandas as pd
+	from PowerBackends import get_power_backend_cache
+
+	st.subheader("Power backends")
+	st.caption("The backend each BMC uses with power_method = auto, and the seconds of each backend at the probe "
+		"(empty: no reading).")
+	cache = get_power_backend_cache()
+	rows = cache.rows()
+	if not rows:
+		st.text("No BMC probed yet.")
+		return
+	st.dataframe(pd.DataFrame(rows), hide_index=True, width="stretch")
+	if st.button("Probe all again"):
+		for row in rows:
+			cache.forget(row["BMC"])
+		st.rerun()
+
+def rerun_profile():
+	import pandas as pd
+	import RerunProfiler
+
+	st.subheader("Reruns")
+	st.caption("Seconds per phase of the latest reruns of all sessions. Phases do not overlap; "
+		"\"other\" is the time spent in Streamlit itself.")
+	with st.container(horizontal=True, vertical_alignment="center", horizontal_alignment="left"):
+		sampling = st.toggle("Sampling profiler", value=RerunProfiler.sampling,
+			help="Sample the stacks of running reruns every 5 ms and keep the folded stacks of the slowest reruns.")
+		RerunProfiler.set_sampling(sampling)
+		if st.button("Refresh", icon=":material/refresh:"):
+			st.rerun()
+
+	rows = RerunProfiler.profiler.rows()
+	if not rows:
+		st.text("No reruns recorded yet.")
+		return
+	df = pd.DataFrame(rows[::-1])
+	phases = [c for c in df.columns if not c in ("time", "page")]
+	st.dataframe(df, hide_index=True, width="stretch", column_config={c: st.column_config.NumberColumn(format="%.3f") for c in phases})
+
+	st.text("Per page")
+	summary = df.groupby("page")[phases].agg(["mean", lambda x: x.quantile(0.95)])
+	summary.columns = [f"{c} {'mean' if s == 'mean' else 'p95'}" for c, s in summary.columns]
+	st.dataframe(summary.round(3), width="stretch")
+
+	slowest = RerunProfiler.profiler.slowest_reruns()
+	if slowest:
+		st.text("Slowest sampled reruns (folded stacks for flamegraph.pl or speedscope)")
+		for n, rec in enumerate(slowest):
+			with st.container(horizontal=True, vertical_alignment="center", horizontal_alignment="left"):
+				st.text(f"{rec.page or 'home'} at {rec.row()['time']}: {rec.total:.3f} sec., {sum(rec.samples.values())} samples")
+				st.download_button("Download", data=RerunProfiler.folded_text(rec), key=f"folded-{n}",
+					file_name=f"rerun_{rec.page or 'home'}_{rec.started_at:.0f}.folded", mime="text/plain", icon=":material/download:")
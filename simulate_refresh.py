@@ -0,0 +1,137 @@
+#!/usr/bin/env python3
+
+# Auto refresh of a watt page on a virtual clock. Each tick is one rerun: the
+# poll of the BMCs takes a duration drawn from --poll, RefreshScheduler decides
+# the sleep, and Streamlit adds --overhead before the next rerun starts.
+# Thousands of ticks take milliseconds, so scheduler and controller changes
+# can be compared offline.
+#
+#   python simulate_refresh.py --poll lognormal:0.3,0.4 --overhead const:0.05
+#   python simulate_refresh.py --gains 0.3,0.05,0.1 --save simulate_refresh.json
+#   python simulate_refresh.py --baseline simulate_refresh.json --tolerance 0.25
+#
+# Distributions: const:S  uniform:LO,HI  normal:MEAN,SD  lognormal:MEDIAN,SIGMA
+# exp:MEAN  spike:BASE,SPIKE,P (BASE, or SPIKE with probability P). Seconds.
+
+import argparse
+import json
+import sys
+import time
+from pathlib import Path
+
+import numpy
+
+from RefreshScheduler import RefreshScheduler, VirtualClock, pid_gains
+
+def sampler(spec:str, rng):
+	kind, _, params = spec.partition(":")
+	p = [float(x) for x in params.split(",")] if params else []
+	if kind == "const":
+		return lambda: p[0]
+	if kind == "uniform":
+		return lambda: rng.uniform(p[0], p[1])
+	if kind == "normal":
+		return lambda: max(0.0, rng.normal(p[0], p[1]))
+	if kind == "lognormal":
+		return lambda: p[0] * rng.lognormal(0.0, p[1])
+	if kind == "exp":
+		return lambda: rng.exponential(p[0])
+	if kind == "spike":
+		return lambda: p[1] if rng.random() < p[2] else p[0]
+	raise ValueError(f"unknown distribution {spec}")
+
+def simulate(ticks:int, target:float, correction:float, auto_correct:bool, poll, overhead, gains:tuple) -> numpy.ndarray:
+	clock = VirtualClock()
+	state = {}
+	intervals = []
+	for i in range(ticks):
+		# a rerun builds its scheduler from the session state, like the page does
+		scheduler = RefreshScheduler(state, clock, gains)
+		start = clock.now()
+		clock.advance(poll())
+		seconds = scheduler.tick(start, target, correction, auto_correct)
+		scheduler.finish(start)
+		if scheduler.interval is not None:
+			intervals.append(scheduler.interval)
+		clock.sleep(seconds)
+		clock.advance(overhead())
+	return numpy.array(intervals)
+
+def converged_at(errors:numpy.ndarray, window:int, tolerance:float) -> int|None:
+	# first tick after which the rolling mean of the error stays within tolerance
+	if len(errors) < window:
+		return None
+	rolling = numpy.abs(numpy.convolve(errors, numpy.ones(window) / window, mode="valid"))
+	outside = numpy.nonzero(rolling > tolerance)[0]
+	if len(outside) == 0:
+		return window
+	if outside[-1] == len(rolling) - 1:
+		return None
+	return int(outside[-1]) + 1 + window
+
+def report(intervals:numpy.ndarray, target:float, window:int, tolerance:float) -> dict:
+	errors = intervals - target
+	settled = errors[len(errors) // 2:]
+	return {
+		"interval mean": float(intervals.mean()),
+		"error mean": float(errors.mean()),
+		"error mean (2nd half)": float(settled.mean()),
+		"jitter": float(intervals.std()),
+		"jitter (2nd half)": float(settled.std()),
+		"abs error p99": float(numpy.percentile(numpy.abs(errors), 99)),
+		"converged at": converged_at(errors, window, tolerance),
+	}
+
+def main():
+	parser = argparse.ArgumentParser(description="Simulate the auto refresh timing of a watt page on a virtual clock.")
+	parser.add_argument("--ticks", type=int, default=5000, help="reruns to simulate")
+	parser.add_argument("--target", type=float, default=1.0, help="target interval in seconds")
+	parser.add_argument("--correction", type=float, default=0.0, help="manual error correction in seconds")
+	parser.add_argument("--no-auto-correct", action="store_true", help="turn off automatic interval error correction")
+	parser.add_argument("--poll", default="lognormal:0.3,0.3", help="distribution of the poll duration")
+	parser.add_argument("--overhead", default="const:0.05", help="distribution of the time from st.rerun() to the next rerun")
+	parser.add_argument("--gains", default=",".join(str(g) for g in pid_gains), help="kp,ki,kd of the controller")
+	parser.add_argument("--window", type=int, default=20, help="ticks of the rolling mean for convergence")
+	parser.add_argument("--tolerance-error", type=float, default=0.05, help="absolute error in seconds that counts as converged")
+	parser.add_argument("--seed", type=int, default=1)
+	parser.add_argument("--save", help="write the results to this JSON file")
+	parser.add_argument("--baseline", help="compare against the results in this JSON file")
+	parser.add_argument("--tolerance", type=float, default=0.25, help="allowed worsening against the baseline (0.25 = 25%%)")
+	args = parser.parse_args()
+
+	rng = numpy.random.default_rng(args.seed)
+	gains = tuple(float(x) for x in args.gains.split(","))
+	t0 = time.perf_counter()
+	intervals = simulate(args.ticks, args.target, args.correction, not args.no_auto_correct,
+		sampler(args.poll, rng), sampler(args.overhead, rng), gains)
+	seconds = time.perf_counter() - t0
+
+	results = report(intervals, args.target, args.window, args.tolerance_error)
+	print(f"{args.ticks} ticks in {seconds * 1000:.0f} ms, target {args.target} sec., poll {args.poll}, overhead {args.overhead}, gains {gains}")
+	for name, value in results.items():
+		if isinstance(value, float):
+			print(f"{name:24} {value * 1000:9.1f} ms")
+		else:
+			print(f"{name:24} {value if value is not None else 'never':>9} ticks")
+
+	if args.save:
+		Path(args.save).write_text(json.dumps(results, indent=1))
+
+	if args.baseline:
+		baseline = json.loads(Path(args.baseline).read_text())
+		regressions = []
+		for name in ("error mean (2nd half)", "jitter (2nd half)", "abs error p99"):
+			b, r = abs(baseline[name]), abs(results[name])
+			if r > b * (1 + args.tolerance) and r - b > 0.001:
+				regressions.append(f"{name}: {b * 1000:.1f} ms -> {r * 1000:.1f} ms")
+		b, r = baseline["converged at"], results["converged at"]
+		if b is not None and (r is None or r > b * (1 + args.tolerance)):
+			regressions.append(f"converged at: {b} -> {r if r is not None else 'never'} ticks")
+		if regressions:
+			print("Regressions:")
+			for r in regressions:
+				print("  " + r)
+			sys.exit(1)
+
+if __name__=="__main__":
+	main()
@@ -0,0 +1,185 @@
+#!/usr/bin/env python3
+
+# AsyncIPMI against a fake IPMI v1.5 LAN BMC on a loopback UDP port.
+
+import asyncio
+import struct
+import sys
+from pathlib import Path
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+pyipmi = pytest.importorskip("pyipmi")
+
+import AsyncIPMI
+import BMCLiveness
+from AsyncIPMI import AUTH_MD5, AUTH_NONE, auth_code, checksum, pad16, rmcp_header
+
+user = "admin"
+passwd = "secret"
+NETFN_APP = 0x06
+
+class FakeBMC(asyncio.DatagramProtocol):
+	# answers the session setup, chassis status and DCMI power reading like a BMC with MD5 authentication
+	def __init__(self):
+		self.transport = None
+		self.session_id = 0
+		self.received = []
+		# cmd: packets to drop before answering
+		self.drop = {}
+		# cmd: completion code to answer with
+		self.cc = {}
+		# requests of these cmds are held back until hold_count of them arrived, then answered in reverse order
+		self.hold = set()
+		self.hold_count = 0
+		self.held = []
+		self.stray = False
+
+	def connection_made(self, transport):
+		self.transport = transport
+
+	def datagram_received(self, data, addr):
+		if data[:4] != rmcp_header:
+			return
+		auth_type, seq, session_id = struct.unpack_from("<BII", data, 4)
+		offset = 13
+		code = b""
+		if auth_type != AUTH_NONE:
+			code = data[offset:offset + 16]
+			offset += 16
+		message = data[offset + 1:offset + 1 + data[offset]]
+		if auth_type != AUTH_NONE and code != auth_code(auth_type, pad16(passwd), session_id, seq, message):
+			return
+		netfn, rq_seq, cmd, body = message[1] >> 2, message[4] >> 2, message[5], message[6:-1]
+		self.received.append({"auth_type": auth_type, "seq": seq, "session_id": session_id, "cmd": cmd, "rq_seq": rq_seq})
+		if self.drop.get(cmd, 0) > 0:
+			self.drop[cmd] -= 1
+			return
+		request = (netfn, rq_seq, cmd, body, addr)
+		if cmd in self.hold:
+			self.held.append(request)
+			if len(self.held) < self.hold_count:
+				return
+			held, self.held = self.held, []
+			if self.stray:
+				# a late answer to a request nobody waits for any more
+				self.answer(NETFN_APP, (held[0][1] + 17) & 0x3f, 0x01, 0, b"\x00", addr)
+			for r in reversed(held):
+				self.reply(*r)
+			return
+		self.reply(*request)
+
+	def reply(self, netfn, rq_seq, cmd, body, addr):
+		if cmd in self.cc:
+			self.answer(netfn, rq_seq, cmd, self.cc[cmd], b"", addr)
+			return
+		if cmd == 0x38:
+			data = bytes([0x01, 1 << AUTH_MD5 | 0x01, 0x14, 0, 0, 0, 0, 0])
+		elif cmd == 0x39:
+			data = struct.pack("<I", 0x1234) + bytes(range(16))
+		elif cmd == 0x3a:
+			self.session_id = 0x5678
+			data = bytes([AUTH_MD5]) + struct.pack("<II", self.session_id, 100) + bytes([0x04])
+		elif cmd == 0x3b:
+			data = bytes([0x04])
+		elif cmd == 0x3c:
+			data = b""
+		elif netfn == 0x00 and cmd == 0x01:
+			data = bytes([0x01, 0x00, 0x00])
+		elif netfn == 0x2c and cmd == 0x02:
+			data = struct.pack("<BHHHHIIB", 0xdc, 250 + rq_seq, 200, 300, 240, 0, 1000, 0x40)
+		else:
+			self.answer(netfn, rq_seq, cmd, 0xc1, b"", addr)
+			return
+		self.answer(netfn, rq_seq, cmd, 0, data, addr)
+
+	def answer(self, netfn, rq_seq, cmd, cc, data, addr):
+		head = bytes([0x81, (netfn + 1) << 2])
+		body = bytes([0x20, rq_seq << 2, cmd, cc]) + data
+		message = head + bytes([checksum(head)]) + body + bytes([checksum(body)])
+		packet = rmcp_header + struct.pack("<BII", AUTH_NONE, 0, self.session_id) + bytes([len(message)]) + message
+		self.transport.sendto(packet, addr)
+
+@pytest.fixture(autouse=True)
+def liveness(monkeypatch):
+	# a fresh breaker without presence pings for the loopback BMC
+	monkeypatch.setattr(BMCLiveness, "liveness", None)
+	BMCLiveness.get_liveness().set_ping("127.0.0.1", False)
+	return BMCLiveness.get_liveness()
+
+def run(test, timeout=0.2, retries=3):
+	async def main():
+		loop = asyncio.get_running_loop()
+		transport, fake = await loop.create_datagram_endpoint(FakeBMC, local_addr=("127.0.0.1", 0))
+		port = transport.get_extra_info("sockname")[1]
+		try:
+			async with AsyncIPMI.AsyncIPMI(timeout, retries, port) as client:
+				return await test(client, client.bmc("127.0.0.1", user, passwd, "lan"), fake)
+		finally:
+			transport.close()
+	return asyncio.run(main())
+
+def test_session_setup():
+	async def test(client, bmc, fake):
+		status = await bmc.get_chassis_status()
+		return status, list(fake.received), bmc.active
+	status, received, active = run(test)
+	assert status.power_on
+	assert [r["cmd"] for r in received] == [0x38, 0x39, 0x3a, 0x3b, 0x01]
+	# Activate Session is authenticated with the temporary ID and sequence number 0
+	assert (received[2]["auth_type"], received[2]["session_id"], received[2]["seq"]) == (AUTH_MD5, 0x1234, 0)
+	# then the session ID and the inbound sequence numbers the BMC gave
+	assert [(r["session_id"], r["seq"]) for r in received[3:]] == [(0x5678, 100), (0x5678, 101)]
+	assert active
+
+def test_retransmit():
+	async def test(client, bmc, fake):
+		await bmc.connect()
+		fake.drop[0x01] = 2
+		status = await bmc.get_chassis_status()
+		return status, [r for r in fake.received if r["cmd"] == 0x01]
+	status, sent = run(test)
+	assert status.power_on
+	assert len(sent) == 3
+	# the same request, each time with the next session sequence number
+	assert len({r["rq_seq"] for r in sent}) == 1
+	assert [r["seq"] for r in sent] == [101, 102, 103]
+
+def test_timeout(liveness):
+	async def test(client, bmc, fake):
+		await bmc.connect()
+		fake.drop[0x01] = 100
+		with pytest.raises(AsyncIPMI.RequestTimeout):
+			await bmc.get_chassis_status()
+		return [r for r in fake.received if r["cmd"] == 0x01], bmc.active
+	sent, active = run(test, timeout=0.05, retries=2)
+	assert len(sent) == 3
+	assert not active
+	assert liveness.get("127.0.0.1").failures == 1
+
+def test_sequence_matching():
+	async def test(client, bmc, fake):
+		await bmc.connect()
+		fake.hold = {0x01, 0x02}
+		fake.hold_count = 3
+		fake.stray = True
+		return await asyncio.gather(bmc.get_chassis_status(), bmc.get_power_reading(), bmc.get_power_reading()), fake.received
+	(status, first, second), received = run(test)
+	assert status.power_on
+	sent = [r["rq_seq"] for r in received if r["cmd"] == 0x02]
+	# answered in reverse order, each reading goes to the request with its sequence number
+	assert (first.current_power, second.current_power) == (250 + sent[0], 250 + sent[1])
+	assert first.period == 1000
+
+def test_completion_code(liveness):
+	async def test(client, bmc, fake):
+		fake.cc[0x01] = 0xd4
+		with pytest.raises(pyipmi.errors.CompletionCodeError) as e:
+			await bmc.get_chassis_status()
+		return e.value, bmc.active
+	e, active = run(test)
+	assert e.cc == 0xd4
+	# an error from the BMC is an answer, so the session stays
+	assert active
+	assert liveness.state("127.0.0.1") == BMCLiveness.CLOSED